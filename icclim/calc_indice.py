@@ -339,7 +339,7 @@ def vDTR_calculation(arr1, arr2, fill_val1=None, fill_val2=None):
 
 ###### heat indices
 
-def SU_calculation(arr, fill_val=None, threshold=25, out_unit="days"):
+def SU_calculation(arr, fill_val=None, threshold=25, out_unit="days", packing=None):
     '''
     Calculates the SU indice: number of summer days (i.e. days with daily maximum temperature > 25 degrees Celsius) [days].
     
@@ -349,6 +349,8 @@ def SU_calculation(arr, fill_val=None, threshold=25, out_unit="days"):
     :type fill_val: float
     :param threshold: user defined temperature threshold in degrees Celsius (default: threshold=25)
     :type threshold: float
+    :param packing: if "arr" contains packed values, packed values and the values they are read as (see util/util_nc.py get_packing)
+    :type packing: tuple (numpy.ndarray (1D), numpy.ndarray (1D))
 
     :rtype: numpy.ndarray (2D)        (if "arr" is numpy.ndarray)
          or numpy.ma.MaskedArray (2D) (if "arr" is numpy.ma.MaskedArray)
@@ -361,11 +363,11 @@ def SU_calculation(arr, fill_val=None, threshold=25, out_unit="days"):
     '''
     T = threshold + 273.15
     
-    SU = calc.get_nb_events(arr, logical_operation='gt', thresh=T, fill_val=fill_val, out_unit=out_unit)
+    SU = calc.get_nb_events(arr, logical_operation='gt', thresh=T, fill_val=fill_val, out_unit=out_unit, packing=packing)
         
     return SU
 
-def CSU_calculation(arr, fill_val=None, threshold=25):
+def CSU_calculation(arr, fill_val=None, threshold=25, packing=None):
 
     '''
     Calculates the CSU indice: maximum number of consecutive summer days (i.e. days with daily maximum temperature > 25 degrees Celsius) [days].
@@ -377,6 +379,8 @@ def CSU_calculation(arr, fill_val=None, threshold=25):
     :type fill_val: float
     :param threshold: user defined temperature threshold in degrees Celsius (default: threshold=25)
     :type threshold: float
+    :param packing: if "arr" contains packed values, packed values and the values they are read as (see util/util_nc.py get_packing)
+    :type packing: tuple (numpy.ndarray (1D), numpy.ndarray (1D))
     
     :rtype: numpy.ndarray (2D)        (if "arr" is numpy.ndarray)
          or numpy.ma.MaskedArray (2D) (if "arr" is numpy.ma.MaskedArray)
@@ -390,13 +394,13 @@ def CSU_calculation(arr, fill_val=None, threshold=25):
         
     T = threshold + 273.15  # Celsius -> Kelvin
     
-    CSU = calc.get_max_nb_consecutive_days(arr, thresh=T, logical_operation='gt', coef=1.0, fill_val=fill_val)
+    CSU = calc.get_max_nb_consecutive_days(arr, thresh=T, logical_operation='gt', coef=1.0, fill_val=fill_val, packing=packing)
     
     return CSU    
 
 
 
-def TR_calculation(arr, fill_val=None, threshold=20, out_unit="days"):
+def TR_calculation(arr, fill_val=None, threshold=20, out_unit="days", packing=None):
     '''
     Calculates the TR indice: number of tropical nights (i.e. days with daily minimum temperature > 20 degrees Celsius) [days]. 
     
@@ -406,6 +410,8 @@ def TR_calculation(arr, fill_val=None, threshold=20, out_unit="days"):
     :type fill_val: float
     :param threshold: user defined temperature threshold in degrees Celsius (default: threshold=20)
     :type threshold: float
+    :param packing: if "arr" contains packed values, packed values and the values they are read as (see util/util_nc.py get_packing)
+    :type packing: tuple (numpy.ndarray (1D), numpy.ndarray (1D))
     
     :rtype: numpy.ndarray (2D)        (if "arr" is numpy.ndarray)
          or numpy.ma.MaskedArray (2D) (if "arr" is numpy.ma.MaskedArray)
@@ -419,14 +425,14 @@ def TR_calculation(arr, fill_val=None, threshold=20, out_unit="days"):
     
     T = threshold + 273.15
     
-    TR = calc.get_nb_events(arr, logical_operation='gt', thresh=T, fill_val=fill_val, out_unit=out_unit)
+    TR = calc.get_nb_events(arr, logical_operation='gt', thresh=T, fill_val=fill_val, out_unit=out_unit, packing=packing)
     
     return TR
 
 
 ###### cold indices
 
-def FD_calculation(arr, fill_val=None, threshold=0, out_unit="days"):
+def FD_calculation(arr, fill_val=None, threshold=0, out_unit="days", packing=None):
     '''
     Calculates the FD indice: number of frost days (i.e. days with daily minimum temperature < 0 degrees Celsius) [days].
     
@@ -434,6 +440,8 @@ def FD_calculation(arr, fill_val=None, threshold=0, out_unit="days"):
     :type arr: numpy.ndarray (3D) or numpy.ma.MaskedArray (3D)
     :param fill_val: fill value 
     :type fill_val: float
+    :param packing: if "arr" contains packed values, packed values and the values they are read as (see util/util_nc.py get_packing)
+    :type packing: tuple (numpy.ndarray (1D), numpy.ndarray (1D))
     
     :rtype: numpy.ndarray (2D)        (if "arr" is numpy.ndarray)
          or numpy.ma.MaskedArray (2D) (if "arr" is numpy.ma.MaskedArray)
@@ -445,12 +453,12 @@ def FD_calculation(arr, fill_val=None, threshold=0, out_unit="days"):
     
     T = threshold + 273.15
     
-    FD = calc.get_nb_events(arr, logical_operation='lt', thresh=T, fill_val=fill_val, out_unit=out_unit)
+    FD = calc.get_nb_events(arr, logical_operation='lt', thresh=T, fill_val=fill_val, out_unit=out_unit, packing=packing)
     
     return FD
 
 
-def CFD_calculation(arr, fill_val=None, threshold=0):
+def CFD_calculation(arr, fill_val=None, threshold=0, packing=None):
 
     '''
     Calculates the CFD indice: maximum number of consecutive frost days (i.e. days with daily minimum temperature < 0 degrees Celsius) [days].
@@ -459,6 +467,8 @@ def CFD_calculation(arr, fill_val=None, threshold=0):
     :type arr: numpy.ndarray (3D) or numpy.ma.MaskedArray (3D)
     :param fill_val: fill value 
     :type fill_val: float
+    :param packing: if "arr" contains packed values, packed values and the values they are read as (see util/util_nc.py get_packing)
+    :type packing: tuple (numpy.ndarray (1D), numpy.ndarray (1D))
     
     :rtype: numpy.ndarray (2D)        (if "arr" is numpy.ndarray)
          or numpy.ma.MaskedArray (2D) (if "arr" is numpy.ma.MaskedArray)
@@ -470,12 +480,12 @@ def CFD_calculation(arr, fill_val=None, threshold=0):
 
     T = threshold + 273.15  # Celsius -> Kelvin
     
-    CFD = calc.get_max_nb_consecutive_days(arr, thresh=T, logical_operation='lt', coef=1.0, fill_val=fill_val)
+    CFD = calc.get_max_nb_consecutive_days(arr, thresh=T, logical_operation='lt', coef=1.0, fill_val=fill_val, packing=packing)
     
     return CFD 
 
 
-def ID_calculation(arr, fill_val=None, threshold=0, out_unit="days"):
+def ID_calculation(arr, fill_val=None, threshold=0, out_unit="days", packing=None):
     '''
     Calculates the ID indice: number of ice days (i.e. days with daily maximum temperature < 0 degrees Celsius) [days].
     
@@ -483,6 +493,8 @@ def ID_calculation(arr, fill_val=None, threshold=0, out_unit="days"):
     :type arr: numpy.ndarray (3D) or numpy.ma.MaskedArray (3D)
     :param fill_val: fill value 
     :type fill_val: float
+    :param packing: if "arr" contains packed values, packed values and the values they are read as (see util/util_nc.py get_packing)
+    :type packing: tuple (numpy.ndarray (1D), numpy.ndarray (1D))
     
     :rtype: numpy.ndarray (2D)        (if "arr" is numpy.ndarray)
          or numpy.ma.MaskedArray (2D) (if "arr" is numpy.ma.MaskedArray)
@@ -494,7 +506,7 @@ def ID_calculation(arr, fill_val=None, threshold=0, out_unit="days"):
     
     T = threshold + 273.15
     
-    ID = calc.get_nb_events(arr, logical_operation='lt', thresh=T, fill_val=fill_val, out_unit=out_unit)
+    ID = calc.get_nb_events(arr, logical_operation='lt', thresh=T, fill_val=fill_val, out_unit=out_unit, packing=packing)
     
     return ID
 
@@ -565,7 +577,7 @@ def GD4_calculation(arr, fill_val=None, threshold=4):
 
 ###### draught indices
 
-def CDD_calculation(arr, fill_val=None, threshold=1.0):
+def CDD_calculation(arr, fill_val=None, threshold=1.0, packing=None):
 
     '''
     Calculates the CDD indice: maximum number of consecutive dry days (i.e. days with daily precipitation amount < 1 mm) [days].
@@ -575,6 +587,8 @@ def CDD_calculation(arr, fill_val=None, threshold=1.0):
     :param fill_val: fill value 
     :type fill_val: float
     
+    :param packing: if "arr" contains packed values, packed values and the values they are read as (see util/util_nc.py get_packing)
+    :type packing: tuple (numpy.ndarray (1D), numpy.ndarray (1D))
     
     :rtype: numpy.ndarray (2D)        (if "arr" is numpy.ndarray)
          or numpy.ma.MaskedArray (2D) (if "arr" is numpy.ma.MaskedArray)
@@ -584,7 +598,7 @@ def CDD_calculation(arr, fill_val=None, threshold=1.0):
     .. warning:: If "arr" is a masked array, the parameter "fill_val" is ignored, because it has no sense in this case.
     '''
     
-    CDD = calc.get_max_nb_consecutive_days(arr, thresh=threshold, logical_operation='lt', coef=1.0, fill_val=fill_val)
+    CDD = calc.get_max_nb_consecutive_days(arr, thresh=threshold, logical_operation='lt', coef=1.0, fill_val=fill_val, packing=packing)
 
     return CDD
 
@@ -614,7 +628,7 @@ def PRCPTOT_calculation(arr, fill_val=None):
 
 
    
-def RR1_calculation(arr, fill_val=None, threshold=1.0, out_unit="days"):
+def RR1_calculation(arr, fill_val=None, threshold=1.0, out_unit="days", packing=None):
     '''
     Calculates the RR1 indice: number of wet days (i.e. days with daily precipitation amount > = 1 mm) [days]
     
@@ -622,6 +636,8 @@ def RR1_calculation(arr, fill_val=None, threshold=1.0, out_unit="days"):
     :type arr: numpy.ndarray (3D) or numpy.ma.MaskedArray (3D)
     :param fill_val: fill value 
     :type fill_val: float
+    :param packing: if "arr" contains packed values, packed values and the values they are read as (see util/util_nc.py get_packing)
+    :type packing: tuple (numpy.ndarray (1D), numpy.ndarray (1D))
     
     :rtype: numpy.ndarray (2D)        (if "arr" is numpy.ndarray)
          or numpy.ma.MaskedArray (2D) (if "arr" is numpy.ma.MaskedArray)
@@ -632,12 +648,12 @@ def RR1_calculation(arr, fill_val=None, threshold=1.0, out_unit="days"):
     '''
 
     
-    RR1 = calc.get_nb_events(arr, logical_operation='get', thresh=threshold, fill_val=fill_val, out_unit=out_unit)
+    RR1 = calc.get_nb_events(arr, logical_operation='get', thresh=threshold, fill_val=fill_val, out_unit=out_unit, packing=packing)
     
     return RR1
 
 
-def CWD_calculation(arr, fill_val=None, threshold=1.0):
+def CWD_calculation(arr, fill_val=None, threshold=1.0, packing=None):
 
     '''
     Calculates the CWD indice: maximum number of consecutive wet days (i.e. days with daily precipitation amount > = 1 mm) [days].
@@ -646,6 +662,8 @@ def CWD_calculation(arr, fill_val=None, threshold=1.0):
     :type arr: numpy.ndarray (3D) or numpy.ma.MaskedArray (3D)
     :param fill_val: fill value 
     :type fill_val: float
+    :param packing: if "arr" contains packed values, packed values and the values they are read as (see util/util_nc.py get_packing)
+    :type packing: tuple (numpy.ndarray (1D), numpy.ndarray (1D))
     
     :rtype: numpy.ndarray (2D)        (if "arr" is numpy.ndarray)
          or numpy.ma.MaskedArray (2D) (if "arr" is numpy.ma.MaskedArray)
@@ -657,7 +675,7 @@ def CWD_calculation(arr, fill_val=None, threshold=1.0):
 
 
 
-    CWD = calc.get_max_nb_consecutive_days(arr, thresh=threshold, logical_operation='get', coef=1.0, fill_val=fill_val)
+    CWD = calc.get_max_nb_consecutive_days(arr, thresh=threshold, logical_operation='get', coef=1.0, fill_val=fill_val, packing=packing)
 
     return CWD
 
@@ -686,7 +704,7 @@ def SDII_calculation(arr, fill_val=None):
     return SDII
 
 
-def R10mm_calculation(arr, fill_val=None, threshold=10.0, out_unit="days"):    
+def R10mm_calculation(arr, fill_val=None, threshold=10.0, out_unit="days", packing=None):    
     '''
     Calculates the R10mm indice: number of heavy precipitation days (i.e. days with daily precipitation amount > = 10 mm) [days]
     
@@ -694,6 +712,8 @@ def R10mm_calculation(arr, fill_val=None, threshold=10.0, out_unit="days"):
     :type arr: numpy.ndarray (3D) or numpy.ma.MaskedArray (3D)
     :param fill_val: fill value 
     :type fill_val: float
+    :param packing: if "arr" contains packed values, packed values and the values they are read as (see util/util_nc.py get_packing)
+    :type packing: tuple (numpy.ndarray (1D), numpy.ndarray (1D))
     
     :rtype: numpy.ndarray (2D)        (if "arr" is numpy.ndarray)
          or numpy.ma.MaskedArray (2D) (if "arr" is numpy.ma.MaskedArray)
@@ -704,12 +724,12 @@ def R10mm_calculation(arr, fill_val=None, threshold=10.0, out_unit="days"):
     '''
     
     
-    R10mm = calc.get_nb_events(arr, logical_operation='get', thresh=threshold, fill_val=fill_val, out_unit=out_unit)
+    R10mm = calc.get_nb_events(arr, logical_operation='get', thresh=threshold, fill_val=fill_val, out_unit=out_unit, packing=packing)
     
     return R10mm
     
 
-def R20mm_calculation(arr, fill_val=None, threshold=20.0, out_unit="days"):    
+def R20mm_calculation(arr, fill_val=None, threshold=20.0, out_unit="days", packing=None):    
     '''
     Calculates the R20mm indice: number of very heavy precipitation days (i.e. days with daily precipitation amount > = 20 mm) [days]
     
@@ -717,6 +737,8 @@ def R20mm_calculation(arr, fill_val=None, threshold=20.0, out_unit="days"):
     :type arr: numpy.ndarray (3D) or numpy.ma.MaskedArray (3D)
     :param fill_val: fill value 
     :type fill_val: float
+    :param packing: if "arr" contains packed values, packed values and the values they are read as (see util/util_nc.py get_packing)
+    :type packing: tuple (numpy.ndarray (1D), numpy.ndarray (1D))
     
     :rtype: numpy.ndarray (2D)        (if "arr" is numpy.ndarray)
          or numpy.ma.MaskedArray (2D) (if "arr" is numpy.ma.MaskedArray)
@@ -728,7 +750,7 @@ def R20mm_calculation(arr, fill_val=None, threshold=20.0, out_unit="days"):
     
 
     
-    R20mm = calc.get_nb_events(arr, logical_operation='get', thresh=threshold, fill_val=fill_val, out_unit=out_unit)
+    R20mm = calc.get_nb_events(arr, logical_operation='get', thresh=threshold, fill_val=fill_val, out_unit=out_unit, packing=packing)
     
     return R20mm
 
@@ -811,7 +833,7 @@ def SD_calculation(arr, fill_val=None):
     return SD
 
     
-def SD1_calculation(arr, fill_val=None, threshold=1.0, out_unit="days"):
+def SD1_calculation(arr, fill_val=None, threshold=1.0, out_unit="days", packing=None):
     '''
     Calculates the SD1 indice: number of days with snow depth >= 1 cm [days]
     
@@ -819,6 +841,8 @@ def SD1_calculation(arr, fill_val=None, threshold=1.0, out_unit="days"):
     :type arr: numpy.ndarray (3D) or numpy.ma.MaskedArray (3D)
     :param fill_val: fill value 
     :type fill_val: float
+    :param packing: if "arr" contains packed values, packed values and the values they are read as (see util/util_nc.py get_packing)
+    :type packing: tuple (numpy.ndarray (1D), numpy.ndarray (1D))
     
     :rtype: numpy.ndarray (2D)        (if "arr" is numpy.ndarray)
          or numpy.ma.MaskedArray (2D) (if "arr" is numpy.ma.MaskedArray)
@@ -831,12 +855,12 @@ def SD1_calculation(arr, fill_val=None, threshold=1.0, out_unit="days"):
     
     
     threshold = threshold*10 # cm --> mm
-    SD1 = calc.get_nb_events(arr, logical_operation='get', thresh=threshold, fill_val=fill_val, out_unit=out_unit)
+    SD1 = calc.get_nb_events(arr, logical_operation='get', thresh=threshold, fill_val=fill_val, out_unit=out_unit, packing=packing)
     
     return SD1
 
 
-def SD5cm_calculation(arr, fill_val=None, threshold=5.0, out_unit="days"):
+def SD5cm_calculation(arr, fill_val=None, threshold=5.0, out_unit="days", packing=None):
     '''
     Calculates the SD5cm indice: number of days with snow depth >= 5 cm [days]
     
@@ -844,6 +868,8 @@ def SD5cm_calculation(arr, fill_val=None, threshold=5.0, out_unit="days"):
     :type arr: numpy.ndarray (3D) or numpy.ma.MaskedArray (3D)
     :param fill_val: fill value 
     :type fill_val: float
+    :param packing: if "arr" contains packed values, packed values and the values they are read as (see util/util_nc.py get_packing)
+    :type packing: tuple (numpy.ndarray (1D), numpy.ndarray (1D))
     
     :rtype: numpy.ndarray (2D)        (if "arr" is numpy.ndarray)
          or numpy.ma.MaskedArray (2D) (if "arr" is numpy.ma.MaskedArray)
@@ -855,12 +881,12 @@ def SD5cm_calculation(arr, fill_val=None, threshold=5.0, out_unit="days"):
     
     
     threshold = threshold*10 # cm --> mm
-    SD5cm = calc.get_nb_events(arr, logical_operation='get', thresh=threshold, fill_val=fill_val, out_unit=out_unit)
+    SD5cm = calc.get_nb_events(arr, logical_operation='get', thresh=threshold, fill_val=fill_val, out_unit=out_unit, packing=packing)
     
     return SD5cm
 
 
-def SD50cm_calculation(arr, fill_val=None, threshold=50.0, out_unit="days"):
+def SD50cm_calculation(arr, fill_val=None, threshold=50.0, out_unit="days", packing=None):
     '''
     Calculates the SD50cm indice: number of days with snow depth >= 50 cm [days]
     
@@ -868,6 +894,8 @@ def SD50cm_calculation(arr, fill_val=None, threshold=50.0, out_unit="days"):
     :type arr: numpy.ndarray (3D) or numpy.ma.MaskedArray (3D)
     :param fill_val: fill value 
     :type fill_val: float
+    :param packing: if "arr" contains packed values, packed values and the values they are read as (see util/util_nc.py get_packing)
+    :type packing: tuple (numpy.ndarray (1D), numpy.ndarray (1D))
     
     :rtype: numpy.ndarray (2D)        (if "arr" is numpy.ndarray)
          or numpy.ma.MaskedArray (2D) (if "arr" is numpy.ma.MaskedArray)
@@ -879,7 +907,7 @@ def SD50cm_calculation(arr, fill_val=None, threshold=50.0, out_unit="days"):
     
     
     threshold = threshold*10 # cm --> mm
-    SD50cm = calc.get_nb_events(arr, logical_operation='get', thresh=threshold, fill_val=fill_val, out_unit=out_unit)
+    SD50cm = calc.get_nb_events(arr, logical_operation='get', thresh=threshold, fill_val=fill_val, out_unit=out_unit, packing=packing)
     
     return SD50cm   
 
@@ -12,6 +12,7 @@ from datetime import datetime
 from collections import OrderedDict, defaultdict
 import pdb
 import calendar
+import hashlib
 import util.calc as calc
 import util.util_dt as util_dt
 import netcdftime
@@ -166,6 +167,144 @@ def get_mask_dt_arr(dt_arr, month, day, dt_hour, window_width, only_leap_years,
     return mask
 
 
+# window tables already computed: key=(t_calendar, t_units, window_width, only_leap_years, ignore_Feb29th, fingerprint of dt_arr)
+_window_tables = {}
+
+def get_window_table(dt_arr, window_width, only_leap_years, t_calendar, t_units, ignore_Feb29th=False):
+    '''
+    Returns the window of each calendar day of a time steps vector: the indices of the time steps in the window
+    centered on the calendar day, i.e. the time steps not masked by get_mask_dt_arr (same windows, same options).
+
+    Dates are converted to numbers once: the time steps, and the calendar days of each year (vectors of date2num),
+    then all windows are computed on integer arrays of years.
+    The table is kept: it is computed only once for the same time steps (e.g. for all tiles).
+    For bootstrapping, the table of resampled time steps is derived from it (see get_resampled_window_table).
+
+    :param dt_arr: time steps vector
+    :type dt_arr: numpy.ndarray (1D) of datetime objects
+    :param window_width: window width, must be odd
+    :type window_width: int
+    :param only_leap_years: option for February 29th
+    :type only_leap_years: bool
+    :param t_calendar: calendar attribute of variable "time"
+    :type t_calendar: str
+    :param t_units: units of variable "time"
+    :type t_units: str
+    :param ignore_Feb29th: Ignoring or not February 29th (default: False)
+    :type ignore_Feb29th: bool
+
+    :rtype: OrderedDict, keys=calendar day (month,day), values=numpy.ndarray (1D) of int
+    '''
+
+    dates = numpy.array([(dt.year, dt.month, dt.day, dt.hour, dt.minute, dt.second) for dt in dt_arr], dtype='int64').reshape(-1, 6)
+    key = (t_calendar, t_units, window_width, only_leap_years, ignore_Feb29th, hashlib.sha1(dates.tostring()).hexdigest())
+    if key in _window_tables:
+        return _window_tables[key]
+
+    t = util_dt.get_utime(t_units, t_calendar)
+    dt_hour = dt_arr[0].hour # (usually the hour is the same for all dates in input dt_arr)
+    half_width = window_width/2
+
+    years = dates[:, 0]
+    dt_arr_num = numpy.array(t.date2num(list(dt_arr)), dtype='float64')
+    leap = numpy.array([calendar.isleap(y) for y in years], dtype=bool)
+
+    def get_caldays_num(years_, month, day):
+        # numerical dates of a calendar day in each year of "years_"
+        if len(years_) == 0:
+            return numpy.zeros(0)
+        return numpy.array(t.date2num([netcdftime.datetime(y, month, day, dt_hour) for y in years_]), dtype='float64')
+
+    # years of the time steps, and years before and after
+    all_years = numpy.unique(numpy.concatenate([years - 1, years, years + 1]))
+    pos = numpy.searchsorted(all_years, years)
+    leap_years = numpy.unique(years[leap])
+
+    if ignore_Feb29th:
+        feb29_num = get_caldays_num(leap_years, 02, 29)[numpy.searchsorted(leap_years, years[leap])]
+        near_feb29 = numpy.zeros(len(years), dtype=bool)
+        near_feb29[leap] = abs(dt_arr_num[leap] - feb29_num) < half_width
+
+    window_table = OrderedDict()
+    dic_caldays = get_dict_caldays(dt_arr)
+    for month in dic_caldays.keys():
+        for day in dic_caldays[month]:
+
+            if (day==29 and month==02):
+                masked = numpy.ones(len(years), dtype=bool)
+                feb29_num = get_caldays_num(leap_years, month, day)[numpy.searchsorted(leap_years, years[leap])]
+                masked[leap] = abs(dt_arr_num[leap] - feb29_num) > half_width
+                if not only_leap_years:
+                    non_leap_years = numpy.unique(years[~leap])
+                    feb28_num = get_caldays_num(non_leap_years, 02, 28)[numpy.searchsorted(non_leap_years, years[~leap])]
+                    diff = abs(dt_arr_num[~leap] - feb28_num)
+                    masked[~leap] = (diff < (-(half_width) + 1)) | (diff > half_width)
+            else:
+                # the calendar day in the same year, the next year and the previous year (see get_masked)
+                caldays_num = get_caldays_num(all_years, month, day)
+                diff = numpy.minimum(numpy.minimum(abs(dt_arr_num - caldays_num[pos]), abs(dt_arr_num - caldays_num[pos + 1])), abs(dt_arr_num - caldays_num[pos - 1]))
+                if ignore_Feb29th:
+                    diff[near_feb29] -= 1
+                masked = diff > half_width
+
+            window_table[month, day] = numpy.where(masked==False)[0]
+
+    _window_tables[key] = window_table
+
+    return window_table
+
+
+def get_resampled_window_table(window_table, indices):
+    '''
+    Returns the window table of resampled time steps (bootstrapping), from the table of the original time steps.
+
+    :param window_table: window table of the original time steps (see get_window_table)
+    :type window_table: OrderedDict
+    :param indices: indices of the resampled time steps in the original time steps (see time_subset.get_resampled_indices)
+    :type indices: numpy.ndarray (1D) of int
+
+    :rtype: OrderedDict, keys=calendar day (month,day), values=numpy.ndarray (1D) of int
+    '''
+
+    in_window = numpy.zeros(max([indices.max()] + [w.max() for w in window_table.values() if len(w) > 0]) + 1, dtype=bool)
+
+    resampled_window_table = OrderedDict()
+    for (calday, window) in window_table.items():
+        in_window[window] = True
+        resampled_window_table[calday] = numpy.where(in_window[indices])[0]
+        in_window[window] = False
+
+    return resampled_window_table
+
+
+def get_window_changes(windows):
+    '''
+    Returns the time steps leaving and entering each window, compared with the previous window
+    (all time steps of the first window are entering it).
+
+    :param windows: windows (indices of time steps, sorted)
+    :type windows: list of numpy.ndarray (1D) of int
+
+    :rtype: tuple of numpy.ndarray (1D) of int32 (number of time steps leaving each window, time steps leaving the windows,
+            number of time steps entering each window, time steps entering the windows)
+    '''
+
+    removed = []
+    added = []
+    previous_window = numpy.zeros(0, dtype=int)
+    for window in windows:
+        removed.append(numpy.setdiff1d(previous_window, window, assume_unique=True))
+        added.append(numpy.setdiff1d(window, previous_window, assume_unique=True))
+        previous_window = window
+
+    nb_removed = numpy.array([len(r) for r in removed], dtype='int32')
+    nb_added = numpy.array([len(a) for a in added], dtype='int32')
+    removed = numpy.array(numpy.concatenate(removed), dtype='int32')
+    added = numpy.array(numpy.concatenate(added), dtype='int32')
+
+    return (nb_removed, removed, nb_added, added)
+
+
 def get_year_list(dt_arr):
     '''
     Returns a list of all years of the time steps vector (dt_arr).
@@ -195,27 +334,49 @@ def get_masked_arr(arr, fill_val):
 
     return masked_arr
 
+def get_percentiles(percentile):
+    '''
+    Returns the percentile(s) to compute as an array to pass to the C functions.
+
+    :param percentile: percentile, or list of percentiles
+    :type percentile: int or list of int
+
+    :rtype: numpy.ndarray (1D) of int32
+    '''
+    if not isinstance(percentile, (list, tuple)):
+        percentile = [percentile]
+    if len(percentile) == 0:
+        raise(ValueError('At least one percentile must be provided.'))
+    return numpy.array(percentile, dtype='int32')
+
 ############### utility functions: end ##################
 #########################################################
 
+# minimum window width for which the percentiles of consecutive calendar days are computed by sliding the window (see get_percentile_dict):
+# a sliding window replaces about 2/window_width of its values every day, narrower windows are faster selected again (see libC.c)
+SLIDING_WINDOW_MIN_WIDTH = 11
+
 ### used to get daily percentile thresholds for temperature variables
 def get_percentile_dict(arr, dt_arr, percentile, window_width,
                         t_calendar, t_units,
                         only_leap_years=False, callback=None, callback_percentage_start_value=0,
                         callback_percentage_total=100, chunk_counter=1, fill_val=None,
-                        ignore_Feb29th=False, interpolation="hyndman_fan"):
+                        ignore_Feb29th=False, interpolation="hyndman_fan", window_table=None):
     '''
     Creates a dictionary with keys=calendar day (month,day) and values=numpy.ndarray (2D)
     Example - to get the 2D percentile array corresponding to the 15th Mai: percentile_dict[5,15]
 
+    Several percentiles can be computed in one call (e.g. percentile=[10, 90] for TX10p and TX90p):
+    the values of each window are selected once for all of them, and one dictionary is returned per percentile.
+
     :param arr: array of values
     :type arr: numpy.ndarray (3D) or numpy.ma.MaskedArray (3D) of float
 
     :param dt_arr: corresponding time steps vector (base period: usually 1961-1990)
     :type dt_arr: numpy.ndarray (1D) of datetime objects
 
-    :param percentile: percentile to compute which must be between 0 and 100 inclusive
-    :type percentile: int
+    :param percentile: percentile to compute which must be between 0 and 100 inclusive, or list of percentiles
+    :type percentile: int or list of int
 
     :param window_width: window width, must be odd
     :type window_width: int
@@ -244,7 +405,11 @@ def get_percentile_dict(arr, dt_arr, percentile, window_width,
     :param interpolation: type of used interpolation: "linear" or "hyndman_fan" (default: "hyndman_fan")
     :type interpolation: str
 
-    :rtype: dict
+    :param window_table: windows of the calendar days of ``dt_arr`` (see get_window_table and get_resampled_window_table),
+                         if ``None`` it will be computed (default: None)
+    :type window_table: OrderedDict
+
+    :rtype: dict, or list of dict if ``percentile`` is a list (one dictionary per percentile, in the same order)
 
     .. warning:: If "arr" is a masked array, the parameter "fill_val" is ignored, because it has no sense in this case.
 
@@ -253,6 +418,9 @@ def get_percentile_dict(arr, dt_arr, percentile, window_width,
     assert(arr.ndim == 3)
     assert(arr.shape[0]==dt_arr.shape[0])
 
+    if window_table is None:
+        window_table = get_window_table(dt_arr, window_width, only_leap_years, t_calendar, t_units, ignore_Feb29th)
+
     # for callback print
     nb_months = 12*1.0
     percent_one_month = ((callback_percentage_total)/nb_months) ######## callback_percentage_total default value = 100 %; set callback_percentage_total=50% for WPS: computing percentiles will be 50%  (other 50% for computing indice)
@@ -262,9 +430,9 @@ def get_percentile_dict(arr, dt_arr, percentile, window_width,
     # step1: creation of the dictionary with all calendar days:
     dic_caldays = get_dict_caldays(dt_arr)
 
-    percentile_dict = OrderedDict()
-
-    dt_hour = dt_arr[0].hour # (we get hour of a date only one time, because usually the hour is the same for all dates in input dt_arr)
+    # percentiles computed together (see libC.c: percentiles_3d)
+    percentiles = get_percentiles(percentile)
+    percentile_dicts = [OrderedDict() for p in percentiles]
 
     # we mask our array in case it has fill_values
     arr_masked = get_masked_arr(arr, fill_val)
@@ -280,7 +448,7 @@ def get_percentile_dict(arr, dt_arr, percentile, window_width,
     if arr_filled.dtype != 'float32':
         arr_filled = numpy.array(arr_filled, dtype='float32')
 
-    C_percentile = libraryC.percentile_3d
+    C_percentile = libraryC.percentiles_3d
     C_percentile.restype = None
 
     C_percentile.argtypes = [ndpointer(ctypes.c_float),
@@ -289,46 +457,65 @@ def get_percentile_dict(arr, dt_arr, percentile, window_width,
                                         ctypes.c_int,
                                         ndpointer(ctypes.c_double),
                                         ctypes.c_int,
+                                        ndpointer(ctypes.c_int),
                                         ctypes.c_float,
                                         ctypes.c_char_p]
 
+    C_percentile_windows = libraryC.percentiles_windows_3d
+    C_percentile_windows.restype = None
 
+    C_percentile_windows.argtypes = [ndpointer(ctypes.c_float),
+                                        ctypes.c_int,
+                                        ctypes.c_int,
+                                        ctypes.c_int,
+                                        ndpointer(ctypes.c_double),
+                                        ctypes.c_int,
+                                        ndpointer(ctypes.c_int),
+                                        ctypes.c_float,
+                                        ctypes.c_char_p,
+                                        ctypes.c_int,
+                                        ndpointer(ctypes.c_int),
+                                        ndpointer(ctypes.c_int),
+                                        ndpointer(ctypes.c_int),
+                                        ndpointer(ctypes.c_int)]
 
-    ## we check the fill_value (we need it to be the maximum value in the array)
-    if fill_val == arr_filled.max():
-        pass
-    else:
-        fill_val_new = 1e+20
-        arr_filled[arr_filled==fill_val] = fill_val_new
-        fill_val = fill_val_new
 
+    ## fill values are not taken into account by the C functions
     #############################
 
     for month in dic_caldays.keys():
-        for day in dic_caldays[month]:
 
-            arr_percentile_current_calday = numpy.zeros([arr.shape[1], arr.shape[2]]) # we reserve memory
+        # step2-3: indices of the dates in the windows centered on the calendar days (day/month) of current month,
+        # i.e. dates not masked by get_mask_dt_arr
+        windows = [window_table[month, day] for day in dic_caldays[month]]
+
+        arr_percentile_current_month = numpy.zeros([len(windows), len(percentiles), arr.shape[1], arr.shape[2]]) # we reserve memory
+
+        if window_width >= SLIDING_WINDOW_MIN_WIDTH:
 
-            # step2: we do a mask for the datetime vector for current calendar day (day/month)
-            dt_arr_mask = get_mask_dt_arr(dt_arr, month, day, dt_hour, window_width, only_leap_years, t_calendar, t_units, ignore_Feb29th)
+            # step4: the windows of consecutive calendar days overlap: each window is given by the dates leaving and entering it
+            (nb_removed, removed, nb_added, added) = get_window_changes(windows)
 
+            # step5: we compute the percentiles of all windows, sliding along the calendar days (see libC.c: percentile_windows_3d)
+            C_percentile_windows(arr_filled, arr_filled.shape[0], arr_filled.shape[1], arr_filled.shape[2], arr_percentile_current_month, len(percentiles), percentiles, fill_val, interpolation,
+                                 len(windows), nb_removed, removed, nb_added, added)
 
-            # step3: we are looking for the indices of non-masked dates (i.e. where dt_arr_mask==False)
-            indices_non_masked = numpy.where(dt_arr_mask==False)[0]
+        else:
+
+            for (k, window) in enumerate(windows):
 
-            # step4: we subset our arr
-            #arr_subset = arr_filled[indices_non_masked, :, :].squeeze()
-            arr_subset = arr_filled[indices_non_masked, :, :]
+                # step4: we subset our arr
+                arr_subset = arr_filled[window, :, :]
 
-            # step5: we compute the percentile for current arr_subset
-            C_percentile(arr_subset, arr_subset.shape[0], arr_subset.shape[1], arr_subset.shape[2], arr_percentile_current_calday, percentile, fill_val, interpolation)
+                # step5: we compute the percentile for current arr_subset
+                C_percentile(arr_subset, arr_subset.shape[0], arr_subset.shape[1], arr_subset.shape[2], arr_percentile_current_month[k], len(percentiles), percentiles, fill_val, interpolation)
 
-            arr_percentile_current_calday = arr_percentile_current_calday.reshape(arr.shape[1], arr.shape[2])
-            arr_percentile_current_calday_masked = numpy.ma.masked_array(arr_percentile_current_calday, in_mask)
-            del arr_percentile_current_calday
+        # step6: we add to the dictionaries
+        for (k, day) in enumerate(dic_caldays[month]):
+            for (p, percentile_dict) in enumerate(percentile_dicts):
+                percentile_dict[month,day] = numpy.ma.masked_array(arr_percentile_current_month[k, p], in_mask)
 
-            # step6: we add to the dictionary
-            percentile_dict[month,day] = arr_percentile_current_calday_masked
+        del arr_percentile_current_month
 
         if callback != None:
             percent_current_month =  percent_current_month + percent_one_month
@@ -336,7 +523,9 @@ def get_percentile_dict(arr, dt_arr, percentile, window_width,
             
     del in_mask
 
-    return percentile_dict
+    if isinstance(percentile, (list, tuple)):
+        return percentile_dicts
+    return percentile_dicts[0]
 
 
 
@@ -351,14 +540,17 @@ def get_percentile_arr(arr, percentile, callback=None, callback_percentage_start
     '''
     Returns an 2D array with computed percentile values.
 
+    Several percentiles can be computed in one call (e.g. percentile=[75, 95, 99] for R75p, R95p and R99p):
+    the values of each pixel are selected once for all of them, and one 2D array is returned per percentile.
+
     :param arr: array of values (in case of precipitation, units must be `mm/day`)
     :type arr: numpy.ndarray (3D) or numpy.ma.MaskedArray (3D) of float
 
     :param dt_arr: corresponding time steps vector (base period: usually 1961-1990)
     :type dt_arr: numpy.ndarray (1D) of datetime objects
 
-    :param percentile: percentile to compute which must be between 0 and 100 inclusive
-    :type percentile: int
+    :param percentile: percentile to compute which must be between 0 and 100 inclusive, or list of percentiles
+    :type percentile: int or list of int
 
     :param callback: progress bar, if ``None`` progress bar will not be printed
     :type callback: :func:`callback.defaultCallback2`
@@ -378,7 +570,10 @@ def get_percentile_arr(arr, percentile, callback=None, callback_percentage_start
     :param fill_val: fill value of ``arr``
     :type fill_val: float
 
-    :rtype: numpy.ndarray (2D)
+    :param interpolation: type of used interpolation: "linear" or "hyndman_fan" (default: "hyndman_fan")
+    :type interpolation: str
+
+    :rtype: numpy.ndarray (2D), or list of numpy.ndarray (2D) if ``percentile`` is a list (one array per percentile, in the same order)
 
     .. warning:: If "arr" is a masked array, the parameter "fill_val" is ignored, because it has no sense in this case.
 
@@ -417,7 +612,7 @@ def get_percentile_arr(arr, percentile, callback=None, callback_percentage_start
     if arr_filled.dtype != 'float32':
         arr_filled = numpy.array(arr_filled, dtype='float32')
 
-    C_percentile = libraryC.percentile_3d
+    C_percentile = libraryC.percentiles_3d
     C_percentile.restype = None
 
     C_percentile.argtypes = [ndpointer(ctypes.c_float),
@@ -426,32 +621,29 @@ def get_percentile_arr(arr, percentile, callback=None, callback_percentage_start
                                         ctypes.c_int,
                                         ndpointer(ctypes.c_double),
                                         ctypes.c_int,
+                                        ndpointer(ctypes.c_int),
                                         ctypes.c_float,
                                         ctypes.c_char_p]
 
 
-
-    ## we check the fill_value (we need it to be the maximum value in the array)
-    if fill_val == arr_filled.max():
-        pass
-    else:
-        fill_val_new = 1e+20
-        arr_filled[arr_filled==fill_val] = fill_val_new
-        fill_val = fill_val_new
-
+    ## fill values are not taken into account by the C functions
     #############################
 
-    arr_percentile = numpy.zeros([arr.shape[1], arr.shape[2]]) # we reserve memory
+    # percentiles computed together (see libC.c: percentiles_3d)
+    percentiles = get_percentiles(percentile)
+
+    arr_percentile = numpy.zeros([len(percentiles), arr.shape[1], arr.shape[2]]) # we reserve memory
     
     # we compute the percentiles
-    C_percentile(arr_filled, arr_filled.shape[0], arr_filled.shape[1], arr_filled.shape[2], arr_percentile, percentile, fill_val, interpolation)
+    C_percentile(arr_filled, arr_filled.shape[0], arr_filled.shape[1], arr_filled.shape[2], arr_percentile, len(percentiles), percentiles, fill_val, interpolation)
 
-    arr_percentile = arr_percentile.reshape(arr.shape[1], arr.shape[2])
-    arr_percentile_masked = numpy.ma.masked_array(arr_percentile, in_mask)
+    arr_percentile_masked = [numpy.ma.masked_array(arr_percentile[p], in_mask) for p in range(len(percentiles))]
     del arr_percentile
     del in_mask
 
-    return arr_percentile_masked
+    if isinstance(percentile, (list, tuple)):
+        return arr_percentile_masked
+    return arr_percentile_masked[0]
 
 
 
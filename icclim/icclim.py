@@ -12,7 +12,7 @@ import numpy
 import logging
 import pdb
 import pkg_resources
-from netCDF4 import Dataset, MFDataset
+from netCDF4 import Dataset
 
 import os
 from collections import OrderedDict
@@ -27,7 +27,17 @@ import calc_percentiles
 import util.util_dt as util_dt
 import util.util_nc as util_nc
 import util.arr_size as arr_size
-import util.OCGIS_tile as OCGIS_tile
+import util.tile_plan as tile_plan
+import util.catalog as catalog
+import util.nc_pool as nc_pool
+import util.run_metadata as run_metadata
+import util.tile_prefetch as tile_prefetch
+import util.remote_reader as remote_reader
+import util.remote_cache as remote_cache
+import util.shm_cache as shm_cache
+import util.pctl_cache as pctl_cache
+import util.stores as stores
+import util.pack as pack
 import util.files_order as files_order
 import time_subset
 import time
@@ -69,7 +79,13 @@ def indice(in_files,
            interpolation='hyndman_fan', 
            out_unit='days',
            netcdf_version='NETCDF3_CLASSIC',
-           user_indice=None
+           user_indice=None,
+           prefetch=False,
+           memory_limit_Mbytes=None,
+           time_streaming=False,
+           nb_read_processes=1,
+           nb_remote_connections=1,
+           packed_values=False
            ):
 
     
@@ -79,7 +95,7 @@ def indice(in_files,
     :param indice_name: Climate indice name. 
     :type indice_name: str    
     
-    :param in_files: Absolute path(s) to NetCDF dataset(s) (including OPeNDAP URLs).
+    :param in_files: Absolute path(s) to NetCDF dataset(s) (including OPeNDAP URLs), or to array stores (JSON sidecars) or chunked stores (directories) (see util/stores.py).
     :type in_files: str OR list of str OR list of lists
 
     :param var_name: Target variable name to process corresponding to ``in_files``.
@@ -91,7 +107,7 @@ def indice(in_files,
     :param time_range: Temporal range: upper and lower bounds for temporal subsetting. If ``None``, whole period of input files will be processed.
     :type time_range: [datetime.datetime, datetime.datetime]
 
-    :param out_file: Output NetCDF file name (default: "icclim_out.nc" in the current directory).
+    :param out_file: Output NetCDF file name (default: "icclim_out.nc" in the current directory). If ``None``, the output dataset is kept in memory and the values of its variables are returned (see ``indice_from_arrays``).
     :type out_file: str
        
     :param threshold: User defined threshold for certain indices.
@@ -136,7 +152,25 @@ def indice(in_files,
     :param user_indice: A dictionary with parameters for user defined indice
     :type user_indice: dict
     
-    :rtype: path to NetCDF file
+    :param prefetch: If True, the next chunk is read in background while the current chunk is computed (memory of one more chunk is used, default: False).
+    :type prefetch: bool
+    
+    :param memory_limit_Mbytes: Maximum memory in Mbytes: the size of chunks is computed from a peak memory model of the indice type. If ``transfer_limit_Mbytes`` is also set, the smallest chunks are used.
+    :type memory_limit_Mbytes: float
+    
+    :param time_streaming: If True, the values of each chunk are read one temporal slice (year, season or month) at a time, so that memory used per pixel depends on the slice length and not on the whole period (default: False). Only for simple and multivariable indices (standard and user defined, except anomaly); ``prefetch`` is ignored.
+    :type time_streaming: bool
+    
+    :param nb_read_processes: Number of worker processes reading input files in parallel when a read spans several files (default: 1, i.e. files are read one after another).
+    :type nb_read_processes: int
+    
+    :param nb_remote_connections: Number of requests sent at the same time to read OPeNDAP datasets (default: 1, i.e. each chunk is read by one request per file). If > 1, the read of each chunk is split into requests of at most ``transfer_limit_Mbytes`` (or into ``nb_remote_connections`` requests if it is not set) which are sent at the same time and retried if they fail; ``transfer_limit_Mbytes`` then limits the size of requests instead of the size of chunks.
+    :type nb_remote_connections: int
+    
+    :param packed_values: If True and the target variable is stored as packed integers (8 or 16 bits, e.g. int16 with "scale_factor" and "add_offset"), count and spell indices with a numeric threshold (SU, CSU, TR, FD, CFD, ID, CDD, CWD, RR1, R10mm, R20mm, SD1, SD5cm, SD50cm, and user defined indices "nb_events" and "max_nb_consecutive_events") are computed on values as they are stored: values are not unpacked into float32, the threshold is converted into packed values instead, with the same results (see util/calc.py get_packed_condition). Ignored for other indices, OPeNDAP datasets, and if ``nb_read_processes`` > 1 (default: False).
+    :type packed_values: bool
+    
+    :rtype: path to NetCDF file (or OrderedDict {variable name: values} if ``out_file`` is ``None``)
 
     .. warning:: If ``out_file`` already exists, Icclim will overwrite it!
 
@@ -187,6 +221,13 @@ def indice(in_files,
     if (indice_type in ['percentile_based', 'percentile_based_multivariable'] or indice_type.startswith('user_indice_percentile_')) and base_period_time_range==None:
         raise IOError('Time range of base period is required for percentile-based indices! Please, set the "base_period_time_range" parameter.')
 
+    if time_streaming == True:
+        if not indice_type in ['simple', 'multivariable', 'user_indice_simple', 'user_indice_multivariable'] or (indice_type.startswith('user_indice_') and user_indice['calc_operation']=='anomaly'):
+            raise IOError('Time streaming ("time_streaming" parameter) is only available for simple and multivariable indices (except anomaly-based user indices).')
+        if prefetch == True:
+            logging.info("Time streaming: values are read while the chunk is computed, prefetch is ignored.")
+            prefetch = False
+
     
     
     #####    input files and target variable names 
@@ -212,6 +253,12 @@ def indice(in_files,
                 in_files[i] = [in_files[i]]                
             VARS_in_files[var_name[i]] = in_files[i]
     
+    #####    variables packed pixel-major are read from their pack, if ICCLIM_PACK_DIR is set (see util/pack.py)
+    for v in VARS_in_files:
+        pack_path = pack.get_pack(VARS_in_files[v], v)
+        if pack_path is not None:
+            logging.info("Variable %s is read from its pack %s.", v, pack_path)
+            VARS_in_files[v] = [pack_path]
 
     #####    callback
     if callback != None:
@@ -219,15 +266,20 @@ def indice(in_files,
         percentage_current_slice = callback_percentage_start_value
     
     #####    we check if output path exists
-    out_path = os.path.dirname(os.path.abspath(out_file)) + os.sep
-    if os.path.isdir(out_path) == False:
-        raise IOError('Output directory does not exists.')
+    if out_file is not None:
+        out_path = os.path.dirname(os.path.abspath(out_file)) + os.sep
+        if os.path.isdir(out_path) == False:
+            raise IOError('Output directory does not exists.')
                      
     #####    we prepare output file
     netcdfv = ['NETCDF4', 'NETCDF4_CLASSIC', 'NETCDF3_CLASSIC', 'NETCDF3_64BIT']
     if netcdf_version not in netcdfv:
         netcdf_version = 'NETCDF3_CLASSIC'
-    onc = Dataset(out_file, 'w' ,format=netcdf_version)
+    if out_file is None:
+        # output dataset in memory (nothing is written to disk)
+        onc = Dataset('icclim_out.nc', 'w', format=netcdf_version, diskless=True, persist=False)
+    else:
+        onc = Dataset(out_file, 'w' ,format=netcdf_version)
     
     #####    we define type of result indice
     ind_type = 'f' # 'float32'
@@ -239,12 +291,15 @@ def indice(in_files,
     any_in_file = VARS_in_files[var_name[0]][0] # we take any input file (for example the first one of the first one of the target variables)
 
     try:
-        inc = Dataset(any_in_file, 'r')
-    except RuntimeError:
+        inc = stores.open_dataset(any_in_file)
+    except (RuntimeError, IOError):
         raise MissingIcclimInputError("Failed to access dataset: " + any_in_file)
 
     indice_dim = util_nc.copy_var_dim(inc, onc, var_name[0], lev_dim_pos=lev_dim_pos) # tuple ('time', 'lat', 'lon')    
     indice_dim = list(indice_dim)
+    
+    # metadata of all input files, collected in one pass (files already in the catalog are not reopened)
+    metadata = run_metadata.RunMetadata(VARS_in_files, temporal_var_name=indice_dim[0], lev_dim_pos=lev_dim_pos)
     ncVar = inc.variables[var_name[0]] 
     fill_val = ncVar._FillValue.astype('float32') # fill_value must be the same type as "ind_type", i.e. 'float32'
     dimensions_list_var = ncVar.dimensions
@@ -346,6 +401,9 @@ def indice(in_files,
     VARS = OrderedDict()
 
     vars_tile_dimension = []
+    
+    # OPeNDAP reads are split into requests of at most transfer_limit_Mbytes (see util/remote_reader.py): chunks are not limited by it
+    remote_reads = nb_remote_connections > 1 and any([catalog.is_remote(ifile) for v in var_name for ifile in VARS_in_files[v]])
 
     for v in var_name:
         
@@ -358,6 +416,7 @@ def indice(in_files,
                                 'values_arr': [], 
                                 'unit_conversion_var_add':[],
                                 'unit_conversion_var_scale':[],
+                                'packing': None,
                                 'temporal_slices': OrderedDict(), 
                                 'base': OrderedDict(), 
                                 'files_years_base': OrderedDict()  
@@ -375,240 +434,370 @@ def indice(in_files,
             dict_files_years_to_process_base = files_order.get_dict_files_years_to_process_in_correct_order(files_list=VARS_in_files[v], time_range=base_period_time_range)
             VARS[v]['files_years_base'] = dict_files_years_to_process_base
 
-        dim_name = util_nc.check_unlimited(VARS_in_files[v][0])
+        dim_name = util_nc.check_unlimited(VARS_in_files[v][0], temporal_var_name=indice_dim[0])
         tile_dimension = arr_size.get_tile_dimension(in_files=dict_files_years_to_process.keys(), 
                                              var_name=v, 
-                                             transfer_limit_Mbytes=transfer_limit_Mbytes, 
+                                             transfer_limit_Mbytes=None if remote_reads else transfer_limit_Mbytes, 
                                              time_range=time_range)
 
         vars_tile_dimension.append(tile_dimension)
 
     tile_dimension = min(vars_tile_dimension)
+    
+    #####    memory limit: tile dimension is computed with the peak memory model of the indice type (see arr_size.get_nb_bytes_per_pixel)
+    if memory_limit_Mbytes != None:
+        
+        nb_time_steps = [arr_size.get_nb_time_steps(VARS[v]['files_years'].keys(), time_range=time_range) for v in var_name]
+        
+        if len(VARS[var_name[0]]['files_years_base']) > 0:
+            nb_time_steps_base = [arr_size.get_nb_time_steps(VARS[v]['files_years_base'].keys(), time_range=base_period_time_range) for v in var_name]
+            nb_years_base = base_period_time_range[1].year - base_period_time_range[0].year + 1
+        else:
+            nb_time_steps_base = None
+            nb_years_base = 0
+        
+        nb_bytes_per_pixel = arr_size.get_nb_bytes_per_pixel(indice_type, nb_time_steps, 
+                                                             nb_time_steps_base=nb_time_steps_base, 
+                                                             slice_mode=slice_mode, 
+                                                             nb_years_base=nb_years_base, 
+                                                             prefetch=prefetch,
+                                                             time_streaming=time_streaming)
+        
+        # result arrays (whole grid) do not depend on tile size
+        nb_years = time_range[1].year - time_range[0].year + 1
+        if slice_mode == None:
+            nb_slices = 1
+        elif slice_mode == 'month':
+            nb_slices = 12 * nb_years
+        else:
+            nb_slices = nb_years
+        
+        nb_bytes_fixed = max(nb_user_thresholds, 1) * nb_slices * var_shape1 * var_shape2 * arr_size.NBYTES_MASKED_FLOAT32
+        if indice_type.startswith('user_indice_') and user_indice['date_event']==True:
+            # dates of events (float64, not masked): one array (min, max) or two (start and end of events)
+            nb_bytes_fixed += 2 * nb_slices * var_shape1 * var_shape2 * 8
+        
+        tile_dimension_memory = arr_size.get_tile_dimension_from_memory_limit(memory_limit_Mbytes, nb_bytes_per_pixel, 
+                                                                              nrow=var_shape1, ncol=var_shape2, 
+                                                                              nb_bytes_fixed=nb_bytes_fixed)
+        
+        if tile_dimension == 0 or (tile_dimension_memory != 0 and tile_dimension_memory < tile_dimension):
+            tile_dimension = tile_dimension_memory
+        
+        logging.info("Memory limit: %s Mbytes, %d bytes per pixel, tile dimension: %d", memory_limit_Mbytes, nb_bytes_per_pixel, tile_dimension)
 
  
     global nb_chunks
     
-    # chunk tiles    
-    tile_map = OCGIS_tile.get_tile_schema(nrow=var_shape1, ncol=var_shape2, tdim=tile_dimension, origin=0)
+    # chunk tiles (aligned on the storage chunks of the first target variable)
+    vars_storage = OrderedDict()
+    for v in var_name:
+        vars_storage[v] = metadata.vars[v]
+    
+    tile_map = tile_plan.get_tile_schema(nrow=var_shape1, ncol=var_shape2, tdim=tile_dimension, 
+                                         chunking=vars_storage[var_name[0]]['chunking'], origin=0)
         
     nb_chunks = len(tile_map)
+    
+    # chunk cache of each target variable is set to hold the storage chunks of one tile
+    chunk_cache = OrderedDict()
+    for v in var_name:
+        chunk_cache_size = tile_plan.get_chunk_cache_size(tile_map, vars_storage[v]['chunking'], numpy.dtype(str(vars_storage[v]['dtype'])).itemsize)
+        if chunk_cache_size is not None:
+            chunk_cache[v] = chunk_cache_size
 
     global chunk_counter
     chunk_counter = 0
     
-    #####    for each chunk
-    for tile_id in tile_map:
-        
-        if len(tile_map)>1:
-            logging.info("Loading data: chunk " + str(int(chunk_counter+1)) + '/'+ str(len(tile_map)) + " ...")
-        else:
-            logging.info("Loading data...")
+    #####    metadata of each target variable (taken from the first file, see util/run_metadata.py)
+    for v in var_name:
         
-        #####    for each target variable
-        for v in var_name:
-            
-            if chunk_counter == 0:
+        var_metadata = metadata.get_var_metadata(v, files=VARS[v]['files_years'].keys(), lev_dim_pos=lev_dim_pos)
 
-                inc = Dataset(VARS[v]['files_years'].keys()[0], 'r')     
-                ncVar = inc.variables[v]    
-                dimensions_list_current_var = ncVar.dimensions
+        fill_val = var_metadata['fill_value'] # fill value (_FillValue) must be the same type as data type: float32 (ind_type = 'f', i.e. float32)
+        VARS[v]['fill_value']=fill_val
+     
+        calend = var_metadata['time_calendar']
+        units = var_metadata['time_units']
+        
+        VARS[v]['time_calendar']=calend
+        VARS[v]['time_units']=units
+
+        var_units = var_metadata['units']
+
+        # Units conversion
+        var_add = 0.0
+        var_scale = 1.0
+        if var_units == 'degC' or var_units == 'Celsius': #Kelvin
+            var_add = var_add + 273.15
+        elif var_units in ["mm/s", "mm/sec", "kg m-2 s-1"]: # mm/s --> mm/day
+            var_scale = var_scale * 86400.0
             
- 
-                fill_val = ncVar._FillValue.astype('float32') # fill value (_FillValue) must be the same type as data type: float32 (ind_type = 'f', i.e. float32)
-                VARS[v]['fill_value']=fill_val
-
-                ncVar_time = inc.variables[dimensions_list_current_var[index_time]]
-             
-                try:
-                    calend = ncVar_time.calendar
-                except:
-                    calend = 'gregorian'
-                 
-                units = ncVar_time.units
-                
-                VARS[v]['time_calendar']=calend
-                VARS[v]['time_units']=units
-
-                
-               
-               
-                var_units = getattr(inc.variables[v],'units')
-
-                # Units conversion
-                var_add = 0.0
-                var_scale = 1.0
-                if var_units == 'degC' or var_units == 'Celsius': #Kelvin
-                    var_add = var_add + 273.15
-                elif var_units in ["mm/s", "mm/sec", "kg m-2 s-1"]: # mm/s --> mm/day
-                    var_scale = var_scale * 86400.0
-                    
-                VARS[v]['unit_conversion_var_add']=var_add
-                VARS[v]['unit_conversion_var_scale']=var_scale
-
+        VARS[v]['unit_conversion_var_add']=var_add
+        VARS[v]['unit_conversion_var_scale']=var_scale
         
+        try:
+            if indice_type.startswith('user_indice_'):
+                if type(user_indice[v]['thresh'])==str:
+                    VARS[v]['var_type'] = user_indice[v]['var_type']
+            else:
+                VARS[v]['var_type'] = maps.map_var_type[indice_name]
+        except:
+            pass
 
-            nc = MFDataset(VARS[v]['files_years'].keys(), 'r', aggdim=dim_name) # VARS[v]['files_years'].keys(): files of current variable
-            var_time = nc.variables[indice_dim[0]]
-            var = nc.variables[v]
-            
+    
+    # files are opened once and reused by all tiles (study and base period)
+    if remote_reads:
+        # OPeNDAP reads are split into requests sent at the same time (see util/remote_reader.py)
+        pool = nc_pool.DatasetPool(nb_read_processes=nb_read_processes, 
+                                   remote_reader=remote_reader.RemoteReader(nb_connections=nb_remote_connections, 
+                                                                            max_request_Mbytes=transfer_limit_Mbytes))
+    else:
+        pool = nc_pool.DatasetPool(nb_read_processes=nb_read_processes)
+    
+    # files, worker processes and shared memory references are released even if computing fails (e.g. in a long-lived process such as WPS)
+    try:
+        #####    packed values: threshold indices are computed on values as they are stored (see util/calc.py get_packed_condition)
+        packed_vars = []
+        if packed_values == True:
+            v = var_name[0]
+            dtype = numpy.dtype(str(vars_storage[v]['dtype']))
+            if not (indice_name in maps.packed_indices or 
+                    (indice_type == 'user_indice_simple' and user_indice['calc_operation'] in ['nb_events', 'max_nb_consecutive_events'])):
+                logging.info("Packed values: indice %s is computed on unpacked values.", indice_name)
+            elif dtype.kind not in 'iu' or dtype.itemsize > 2:
+                logging.info("Packed values: variable %s is not stored as 8 or 16 bits integers (%s).", v, dtype)
+            elif nb_read_processes > 1 or any([catalog.is_remote(ifile) for ifile in VARS_in_files[v]]):
+                logging.info("Packed values: values of %s are unpacked (OPeNDAP datasets or worker processes).", v)
+            else:
+                packed_vars = [v]
+                nc = pool.get(VARS[v]['files_years'].keys(), aggdim=dim_name, chunk_cache=chunk_cache, temporal_var_name=indice_dim[0], packed=packed_vars)
+                VARS[v]['packing'] = util_nc.get_packing(nc.variables[v], 
+                                                         scale_factor=VARS[v]['unit_conversion_var_scale'], 
+                                                         add_offset=VARS[v]['unit_conversion_var_add'])
+                logging.info("Packed values: %s is read as %s values.", v, dtype)
+    
+        # time steps of each temporal slice of each target variable: the same for all tiles, computed for the first tile
+        dict_slices_indices = OrderedDict()
+    
+        def read_tile(tile_id):
+            '''
+            Reads arrays of all target variables for one tile.
+            Returns a dictionary {var_name: {'dt_arr': ..., 'values_arr': ..., 'temporal_slices': ..., ...}}.
+            '''
+        
             ### coordinate of current chunk:
             ### indices of the left upper corner: (i1_row_current_tile, i1_col_current_tile)
             ### indices of the right lower corner: (i2_row_current_tile, i2_col_current_tile)
             i1_row_current_tile = tile_map.get(tile_id).get('row')[0]
             i2_row_current_tile = tile_map.get(tile_id).get('row')[1]
-            
+        
             i1_col_current_tile = tile_map.get(tile_id).get('col')[0]
             i2_col_current_tile = tile_map.get(tile_id).get('col')[1]  
-                        
-
-            arrs_current_chunk = util_nc.get_values_arr_and_dt_arr(ncVar_temporal=var_time, ncVar_values=var, 
-                                                                     fill_val=VARS[v]['fill_value'], 
-                                                                     time_range=time_range, 
-                                                                     N_lev=N_lev, 
-                                                                     lev_dim_pos=lev_dim_pos,
-                                                                     scale_factor=VARS[v]['unit_conversion_var_scale'], 
-                                                                     add_offset=VARS[v]['unit_conversion_var_add'],
-                                                                     ignore_Feb29th=ignore_Feb29th, 
-                                                                     i1_row_current_tile=i1_row_current_tile,
-                                                                     i2_row_current_tile=i2_row_current_tile,
-                                                                     i1_col_current_tile=i1_col_current_tile,
-                                                                     i2_col_current_tile=i2_col_current_tile)
+        
+            def read_values(v, files, time_range_, indices=None):
+                # the decoded time axis and the selected time steps are computed once per run (see util/run_metadata.py)
+                (dt_arr, indices_subset) = metadata.get_dt_arr_and_indices(files, time_range=time_range_, ignore_Feb29th=ignore_Feb29th)
+                if indices is not None:
+                    (dt_arr, indices_subset) = (dt_arr[indices], indices_subset[indices])
+                return (dt_arr, read_time_steps(v, files, indices_subset))
+        
+            def read_time_steps(v, files, indices_subset):
+                def read():
+                    nc = pool.get(files, aggdim=dim_name, chunk_cache=chunk_cache, temporal_var_name=indice_dim[0], packed=packed_vars)
+                    return util_nc.get_values_arr(nc.variables[v], indices_subset, 
+                                                  fill_val=VARS[v]['fill_value'], 
+                                                  N_lev=N_lev, 
+                                                  lev_dim_pos=lev_dim_pos,
+                                                  scale_factor=VARS[v]['unit_conversion_var_scale'], 
+                                                  add_offset=VARS[v]['unit_conversion_var_add'],
+                                                  i1_row_current_tile=i1_row_current_tile,
+                                                  i2_row_current_tile=i2_row_current_tile,
+                                                  i1_col_current_tile=i1_col_current_tile,
+                                                  i2_col_current_tile=i2_col_current_tile,
+                                                  packed=VARS[v]['packing'] is not None)
+                # values of the tile may be shared with concurrent runs on the same node (see util/shm_cache.py)
+                key = (v, indices_subset, i1_row_current_tile, i2_row_current_tile, i1_col_current_tile, i2_col_current_tile, N_lev, lev_dim_pos,
+                       VARS[v]['unit_conversion_var_scale'], VARS[v]['unit_conversion_var_add'], VARS[v]['fill_value'], VARS[v]['packing'] is not None)
+                return shm_cache.read_array(files, key, read)
+        
+            tile_arrs = OrderedDict()
+        
+            #####    for each target variable
+            for v in var_name:
             
-            VARS[v]['dt_arr']=arrs_current_chunk[0]            
-            VARS[v]['values_arr']=arrs_current_chunk[1] 
+                tile_arrs[v] = OrderedDict()
             
+                files = VARS[v]['files_years'].keys() # files of current variable
+                (dt_arr, indices_subset) = metadata.get_dt_arr_and_indices(files, time_range=time_range, ignore_Feb29th=ignore_Feb29th)
             
-            if indice_type.startswith('user_indice_') and user_indice['calc_operation']=='anomaly':
-                
-                ncb = MFDataset(VARS[v]['files_years_base'].keys(), 'r', aggdim=dim_name)
-                var_time = ncb.variables[indice_dim[0]]
-                var = ncb.variables[v]
-                arrs_current_chunk_ref = util_nc.get_values_arr_and_dt_arr(ncVar_temporal=var_time, ncVar_values=var, 
-                                                                            fill_val=VARS[v]['fill_value'], 
-                                                                            time_range=base_period_time_range, 
-                                                                            N_lev=N_lev, 
-                                                                            lev_dim_pos=lev_dim_pos,
-                                                                            scale_factor=VARS[v]['unit_conversion_var_scale'], 
-                                                                            add_offset=VARS[v]['unit_conversion_var_add'],
-                                                                            ignore_Feb29th=ignore_Feb29th,
-                                                                            i1_row_current_tile=i1_row_current_tile,
-                                                                            i2_row_current_tile=i2_row_current_tile,
-                                                                            i1_col_current_tile=i1_col_current_tile,
-                                                                            i2_col_current_tile=i2_col_current_tile)
+                if v not in dict_slices_indices:
+                    dict_slices_indices[v] = time_subset.get_dict_temporal_slices_indices(dt_arr=dt_arr, 
+                                                                                          calend=VARS[v]['time_calendar'],
+                                                                                          temporal_subset_mode=slice_mode, 
+                                                                                          time_range=time_range)
+            
+                if time_streaming == True:
+                    # values are read slice by slice while the chunk is computed
+                    def read_slice(indices, v=v, files=files):
+                        return read_values(v, files, time_range, indices=indices)[1]
                 
-                ncb.close()
-
-                VARS[v]['values_arr_ref']=arrs_current_chunk_ref[1] # arrs_current_chunk_ref[1]: values, arrs_current_chunk_ref[0]: dt_arr
-
-
-            if indice_type in ["percentile_based", "percentile_based_multivariable"] or indice_type.startswith('user_indice_percentile_'):
-                ncb = MFDataset(VARS[v]['files_years_base'].keys(), 'r', aggdim=dim_name)
-                var_time = ncb.variables[indice_dim[0]]
-                var = ncb.variables[v]
-                arrs_base_current_chunk = util_nc.get_values_arr_and_dt_arr(ncVar_temporal=var_time, ncVar_values=var, 
-                                                                            fill_val=VARS[v]['fill_value'], 
-                                                                            time_range=base_period_time_range, 
-                                                                            N_lev=N_lev, 
-                                                                            lev_dim_pos=lev_dim_pos,
-                                                                            scale_factor=VARS[v]['unit_conversion_var_scale'], 
-                                                                            add_offset=VARS[v]['unit_conversion_var_add'],
-                                                                            ignore_Feb29th=ignore_Feb29th,
-                                                                            i1_row_current_tile=i1_row_current_tile,
-                                                                            i2_row_current_tile=i2_row_current_tile,
-                                                                            i1_col_current_tile=i1_col_current_tile,
-                                                                            i2_col_current_tile=i2_col_current_tile)
+                    tile_arrs[v]['dt_arr']=dt_arr
+                    tile_arrs[v]['temporal_slices']=time_subset.StreamedTemporalSlices(dt_arr, dict_slices_indices[v], read_slice, VARS[v]['fill_value'])
+                    continue
+
+                if len(VARS[v]['files_years_base']) > 0:
+                    # the union of the study period and the base period is read once:
+                    # the values of both periods are views of the values read (see util/run_metadata.py)
+                    (union_files, indices_union, (dt_arr_study, pos), (dt_arr_base, pos_base)) = \
+                        metadata.get_union_dt_arrs_and_indices(files, time_range, VARS[v]['files_years_base'].keys(), base_period_time_range, 
+                                                               ignore_Feb29th=ignore_Feb29th)
+                    values_arr_union = read_time_steps(v, union_files, indices_union)
+                    arrs_current_chunk = (dt_arr_study, values_arr_union[pos])
+                    arrs_base_current_chunk = (dt_arr_base, values_arr_union[pos_base])
+                else:
+                    arrs_current_chunk = read_values(v, files, time_range)
+            
+                tile_arrs[v]['dt_arr']=arrs_current_chunk[0]            
+                tile_arrs[v]['values_arr']=arrs_current_chunk[1] 
+            
+            
+                if indice_type.startswith('user_indice_') and user_indice['calc_operation']=='anomaly':
                 
-                ncb.close()
+                    tile_arrs[v]['values_arr_ref']=arrs_base_current_chunk[1] # arrs_base_current_chunk[1]: values, arrs_base_current_chunk[0]: dt_arr
 
-                VARS[v]['base']['dt_arr']=arrs_base_current_chunk[0]
-                VARS[v]['base']['values_arr']=arrs_base_current_chunk[1]
+
+                if indice_type in ["percentile_based", "percentile_based_multivariable"] or indice_type.startswith('user_indice_percentile_'):
+                
+                    tile_arrs[v]['base'] = OrderedDict()
+                    tile_arrs[v]['base']['dt_arr']=arrs_base_current_chunk[0]
+                    tile_arrs[v]['base']['values_arr']=arrs_base_current_chunk[1]
+                
+                    # fingerprint of the base values: percentile thresholds may be taken from previous runs (see util/pctl_cache.py)
+                    tile_arrs[v]['base']['cache_key'] = None
+                    if pctl_cache.enabled():
+                        base_files = VARS[v]['files_years_base'].keys()
+                        indices_base = metadata.get_dt_arr_and_indices(base_files, time_range=base_period_time_range, ignore_Feb29th=ignore_Feb29th)[1]
+                        tile_arrs[v]['base']['cache_key'] = pctl_cache.get_base_key(base_files, 
+                                                                                    (v, indices_base, i1_row_current_tile, i2_row_current_tile, i1_col_current_tile, i2_col_current_tile, N_lev, lev_dim_pos,
+                                                                                     VARS[v]['unit_conversion_var_scale'], VARS[v]['unit_conversion_var_add'], VARS[v]['fill_value'], VARS[v]['packing'] is not None))
 
             
-            dict_temporal_slices = time_subset.get_dict_temporal_slices(dt_arr=VARS[v]['dt_arr'], 
-                                                                        values_arr=VARS[v]['values_arr'],
-                                                                        fill_value=VARS[v]['fill_value'],
-                                                                        calend=VARS[v]['time_calendar'],
-                                                                        temporal_subset_mode=slice_mode, 
-                                                                        time_range=time_range)
+                dict_temporal_slices = time_subset.get_dict_temporal_slices(dt_arr=tile_arrs[v]['dt_arr'], 
+                                                                            values_arr=tile_arrs[v]['values_arr'],
+                                                                            fill_value=VARS[v]['fill_value'],
+                                                                            calend=VARS[v]['time_calendar'],
+                                                                            temporal_subset_mode=slice_mode, 
+                                                                            time_range=time_range,
+                                                                            dict_slices_indices=dict_slices_indices[v])
             
                     
-            VARS[v]['temporal_slices']=dict_temporal_slices
-            
-            
-            try:
-                if indice_type.startswith('user_indice_'):
-                    if type(user_indice[v]['thresh'])==str:
-                        VARS[v]['var_type'] = user_indice[v]['var_type']
-                else:
-                    VARS[v]['var_type'] = maps.map_var_type[indice_name]
-            except:
-                pass
-                
-            nc.close()
-
+                tile_arrs[v]['temporal_slices']=dict_temporal_slices
+        
+            return tile_arrs
+    
+    
+        #####    for each chunk (if prefetch==True, the next chunk is read in background while the current one is computed)
+        for (tile_id, tile_arrs) in tile_prefetch.iter_tiles(tile_map.keys(), read_tile, prefetch=prefetch):
+        
+            if len(tile_map)>1:
+                logging.info("Loading data: chunk " + str(int(chunk_counter+1)) + '/'+ str(len(tile_map)) + " ...")
+            else:
+                logging.info("Loading data...")
+        
+            i1_row_current_tile = tile_map.get(tile_id).get('row')[0]
+            i2_row_current_tile = tile_map.get(tile_id).get('row')[1]
+        
+            i1_col_current_tile = tile_map.get(tile_id).get('col')[0]
+            i2_col_current_tile = tile_map.get(tile_id).get('col')[1]  
+        
+            for v in var_name:
+                VARS[v].update(tile_arrs[v])
+                dict_temporal_slices = VARS[v]['temporal_slices']
+        
+            tile_keys = tile_arrs[var_name[0]].keys()
+            del tile_arrs
 
 
         
-        if nb_user_thresholds == 0:
+            if nb_user_thresholds == 0:
             
-            if chunk_counter == 0:
-                indice_arr = numpy.ma.zeros( (len(dict_temporal_slices),var_shape1, var_shape2), dtype=ind_type )
+                if chunk_counter == 0:
+                    indice_arr = numpy.ma.zeros( (len(dict_temporal_slices),var_shape1, var_shape2), dtype=ind_type )
 
             
-            indice_tuple_current_chunk = get_indice_from_dict_temporal_slices(indice_name=indice_name,
-                                                        vars_dict=VARS,
-                                                        window_width=window_width,
-                                                        only_leap_years=only_leap_years,
-                                                        callback=callback, callback_percentage_total=callback_percentage_total,
-                                                        ignore_Feb29th=ignore_Feb29th, interpolation=interpolation,
-                                                        out_unit=out_unit,
-                                                        user_indice=user_indice) ## tuple: (dt_centroid_arr, dt_bounds_arr, indice_arr) 
-            indice_arr_current_chunk = indice_tuple_current_chunk[2]
+                indice_tuple_current_chunk = get_indice_from_dict_temporal_slices(indice_name=indice_name,
+                                                            vars_dict=VARS,
+                                                            window_width=window_width,
+                                                            only_leap_years=only_leap_years,
+                                                            callback=callback, callback_percentage_total=callback_percentage_total,
+                                                            ignore_Feb29th=ignore_Feb29th, interpolation=interpolation,
+                                                            out_unit=out_unit,
+                                                            user_indice=user_indice) ## tuple: (dt_centroid_arr, dt_bounds_arr, indice_arr) 
+                indice_arr_current_chunk = indice_tuple_current_chunk[2]
             
-            if indice_type.startswith('user_indice_'):
-                if user_indice['date_event']==True:
-                    if user_indice['calc_operation'] in ['min', 'max']:            
-                        date_event_arr_current_chunk = indice_tuple_current_chunk[3]
+                if indice_type.startswith('user_indice_'):
+                    if user_indice['date_event']==True:
+                        # dates of events of the current chunk are concatenated as the indice
+                        if user_indice['calc_operation'] in ['min', 'max']:            
+                            if chunk_counter == 0:
+                                date_event_arr = numpy.zeros( (len(dict_temporal_slices),var_shape1, var_shape2) )
+                            date_event_arr[:, i1_row_current_tile:i2_row_current_tile, i1_col_current_tile:i2_col_current_tile] = indice_tuple_current_chunk[3]
                         
-                    elif user_indice['calc_operation'] in ['nb_events', 'max_nb_consecutive_events', 'run_mean', 'run_sum']:
-                        date_event_start_arr_current_chunk = indice_tuple_current_chunk[3]
-                        date_event_end_arr_current_chunk = indice_tuple_current_chunk[4]
+                        elif user_indice['calc_operation'] in ['nb_events', 'max_nb_consecutive_events', 'run_mean', 'run_sum']:
+                            if chunk_counter == 0:
+                                date_event_start_arr = numpy.zeros( (len(dict_temporal_slices),var_shape1, var_shape2) )
+                                date_event_end_arr = numpy.zeros( (len(dict_temporal_slices),var_shape1, var_shape2) )
+                            date_event_start_arr[:, i1_row_current_tile:i2_row_current_tile, i1_col_current_tile:i2_col_current_tile] = indice_tuple_current_chunk[3]
+                            date_event_end_arr[:, i1_row_current_tile:i2_row_current_tile, i1_col_current_tile:i2_col_current_tile] = indice_tuple_current_chunk[4]
                         
                         
             
 
-            indice_arr[:, i1_row_current_tile:i2_row_current_tile, i1_col_current_tile:i2_col_current_tile] = indice_arr_current_chunk
+                indice_arr[:, i1_row_current_tile:i2_row_current_tile, i1_col_current_tile:i2_col_current_tile] = indice_arr_current_chunk
                      
             
             
         
-        else:
-            for t in user_thresholds:                    
-                if chunk_counter == 0:              
-                    dict_threshold_indice_arr = OrderedDict()
-                    dict_threshold_indice_arr[t] = numpy.zeros( (len(dict_temporal_slices),var_shape1, var_shape2), dtype=ind_type )
+            else:
+                for t in user_thresholds:                    
+                    if chunk_counter == 0:              
+                        dict_threshold_indice_arr = OrderedDict()
+                        dict_threshold_indice_arr[t] = numpy.zeros( (len(dict_temporal_slices),var_shape1, var_shape2), dtype=ind_type )
             
                 
-                indice_tuple_current_chunk = get_indice_from_dict_temporal_slices(indice_name=indice_name,
-                                                                    vars_dict=VARS,
-                                                                    thresh=t,
-                                                                    callback=callback, callback_percentage_total=callback_percentage_total,
-                                                                    user_indice=user_indice)  ## tuple: (dt_centroid_arr, dt_bounds_arr, indice_arr)         
+                    indice_tuple_current_chunk = get_indice_from_dict_temporal_slices(indice_name=indice_name,
+                                                                        vars_dict=VARS,
+                                                                        thresh=t,
+                                                                        callback=callback, callback_percentage_total=callback_percentage_total,
+                                                                        user_indice=user_indice)  ## tuple: (dt_centroid_arr, dt_bounds_arr, indice_arr)         
                 
                 
-                indice_arr_current_chunk = indice_tuple_current_chunk[2]
+                    indice_arr_current_chunk = indice_tuple_current_chunk[2]
                 
-                # we concatenate
-                dict_threshold_indice_arr[t][:, i1_row_current_tile:i2_row_current_tile, i1_col_current_tile:i2_col_current_tile] = indice_arr_current_chunk
+                    # we concatenate
+                    dict_threshold_indice_arr[t][:, i1_row_current_tile:i2_row_current_tile, i1_col_current_tile:i2_col_current_tile] = indice_arr_current_chunk
     
         
-        if chunk_counter == 0:
-                dt_centroid_arr = indice_tuple_current_chunk[0]
-                dt_bounds_arr = indice_tuple_current_chunk[1]
+            if chunk_counter == 0:
+                    dt_centroid_arr = indice_tuple_current_chunk[0]
+                    dt_bounds_arr = indice_tuple_current_chunk[1]
         
 
-        chunk_counter +=1
-
+            chunk_counter +=1
+        
+            # arrays of the current chunk are released before the next chunk is read
+            for v in var_name:
+                for key in tile_keys:
+                    VARS[v][key] = None
+
+    finally:
+        pool.close()
+        metadata.log_summary()
+        remote_cache.log_summary()
+        shm_cache.log_summary()
+        shm_cache.release()
+        pctl_cache.log_summary()
     
 
     ########################################################################################################################
@@ -639,10 +828,10 @@ def indice(in_files,
     if indice_type.startswith('user_indice_'):
         if user_indice['date_event']==True:
             if user_indice['calc_operation'] in ['min', 'max']:            
-                date_event[:,:,:] = date_event_arr_current_chunk
+                date_event[:,:,:] = date_event_arr
             elif user_indice['calc_operation'] in ['nb_events', 'max_nb_consecutive_events', 'run_mean', 'run_sum']:
-                date_event_start[:,:,:] = date_event_start_arr_current_chunk
-                date_event_end[:,:,:] = date_event_end_arr_current_chunk
+                date_event_start[:,:,:] = date_event_start_arr
+                date_event_end[:,:,:] = date_event_end_arr
             
     
     
@@ -683,6 +872,9 @@ def indice(in_files,
     util_nc.set_time_values(onc, dt_centroid_arr, calend, units)
     util_nc.set_timebnds_values(onc, dt_bounds_arr, calend, units)
     
+    if out_file is None:
+        out_values = OrderedDict([(str(name), onc.variables[name][:]) for name in onc.variables])
+
     onc.close()
 
     time_elapsed = (time.clock() - time_start)
@@ -700,9 +892,69 @@ def indice(in_files,
     logging.info("   *                                                                                          *")
     logging.info("   ********************************************************************************************")
 
+    if out_file is None:
+        return out_values
     return out_file
 
 
+def indice_from_arrays(arrays, var_name, time_values, time_units, calendar='gregorian', fill_value=1e20, lat=None, lon=None, var_units=None, **kwargs):
+    '''
+    Computes an indice from in-memory arrays instead of files (e.g. values already computed by a pipeline).
+    Values are read, sliced, tiled and computed as by ``indice``, and the result is returned instead of written:
+    nothing is written to disk.
+
+    :param arrays: Values of the target variable(s), of dimensions (time, lat, lon): numpy arrays (masked or not), memory maps or any array-like with ``shape``, ``dtype`` and ``__getitem__``. Arrays are not modified.
+    :type arrays: array-like OR list of array-likes (one per target variable)
+
+    :param var_name: Target variable name(s) corresponding to ``arrays``.
+    :type var_name: str OR list of str
+
+    :param time_values: Time values, shared by all arrays.
+    :type time_values: 1D array
+
+    :param time_units: Units of time values (e.g. "days since 1950-01-01 00:00:00").
+    :type time_units: str
+
+    :param calendar: Calendar of time values (default: "gregorian").
+    :type calendar: str
+
+    :param fill_value: Values equal to ``fill_value`` are missing, as well as masked values (default: 1e20). Missing values of the result are set to ``fill_value``.
+    :type fill_value: float
+
+    :param lat: Latitudes (default: None, indices of rows).
+    :type lat: 1D array
+
+    :param lon: Longitudes (default: None, indices of columns).
+    :type lon: 1D array
+
+    :param var_units: Units of the target variable(s) (e.g. "K" or "kg m-2 s-1"), used by indices converting units (default: None).
+    :type var_units: str OR list of str
+
+    :param kwargs: Other parameters of ``indice`` (``indice_name``, ``slice_mode``, ``time_range``, ``threshold``...), except ``in_files`` and ``out_file``.
+
+    :rtype: OrderedDict {variable name: numpy.ma.MaskedArray} (variables of the output dataset: the indice, "time", "time_bnds", "lat", "lon"...)
+    '''
+
+    if type(var_name) is not list:
+        var_name = [var_name]
+        arrays = [arrays]
+        var_units = [var_units]
+    elif type(var_units) is not list:
+        var_units = [var_units] * len(var_name)
+    if len(arrays) != len(var_name) or len(var_units) != len(var_name):
+        raise IOError('"arrays" and "var_units" must have one item per target variable.')
+
+    in_files = []
+    try:
+        for (v, arr, v_units) in zip(var_name, arrays, var_units):
+            in_files.append(stores.add_memory_dataset(v, arr, time_values, time_units, calendar=calendar, fill_value=fill_value, 
+                                                      lat=lat, lon=lon, units=v_units))
+        return indice(in_files=list(in_files), var_name=list(var_name), out_file=None, **kwargs)
+    finally:
+        for ifile in in_files:
+            stores.remove_memory_dataset(ifile)
+
+
 
 
 def get_indice_from_dict_temporal_slices(indice_name, 
@@ -769,6 +1021,7 @@ def get_indice_from_dict_temporal_slices(indice_name,
     
     pctl_thresh = {} ### dictionary to keep pctl threshold for each target variable
     pctl_calc_method = {} ### dictionary to separate pctl thresholds: computed with bootstrapping (for in-base years) or without bootstrapping (for out-of-base years)
+    window_tables = {} ### dictionary to keep the windows of calendar days of base period for each target variable (see calc_percentiles.get_window_table)
     
     for slice in t_slices: # for each temporal slice
         
@@ -790,6 +1043,10 @@ def get_indice_from_dict_temporal_slices(indice_name,
 
             else:
                 dic_args = {'arr': values_arr, 'fill_val': fill_val, 'threshold': thresh}
+            
+            # packed values (see indice, "packed_values")
+            if vars_dict[vars_dict.keys()[0]]['packing'] is not None:
+                dic_args['packing'] = vars_dict[vars_dict.keys()[0]]['packing']
 
             
             indice_slice = calc_ind.zzz(indice_name, **dic_args)
@@ -820,7 +1077,8 @@ def get_indice_from_dict_temporal_slices(indice_name,
                 
                 dic_args = {'user_indice':user_indice, 'arr':values_arr, 
                             'fill_val':fill_val, 'vars':vars_dict.keys(),
-                            'dt_arr': dt_arr_, 'out_unit':out_unit}
+                            'dt_arr': dt_arr_, 'out_unit':out_unit,
+                            'packing': vars_dict[vars_dict.keys()[0]]['packing']}
                 
                  
                 indice_ = ui.get_user_indice(**dic_args)
@@ -862,7 +1120,8 @@ def get_indice_from_dict_temporal_slices(indice_name,
                     
                     dic_args = {'user_indice':user_indice, 'arr':values_arr, 
                                 'fill_val':fill_val, 'vars':vars_dict.keys(),
-                                'out_unit':out_unit}
+                                'out_unit':out_unit,
+                                'packing': vars_dict[vars_dict.keys()[0]]['packing']}
                 
                 indice_slice = ui.get_user_indice(**dic_args)
         
@@ -966,7 +1225,10 @@ def get_indice_from_dict_temporal_slices(indice_name,
                             # we compute pctl array only one time
                             if slice_counter==0 and ytd_counter==0: 
 
-                                pctl_arr = calc_percentiles.get_percentile_arr(arr=vars_dict[v]['base']['values_arr'], 
+                                # thresholds may be taken from previous runs (see util/pctl_cache.py)
+                                pctl_arr = pctl_cache.read_percentile_arr(vars_dict[v]['base'].get('cache_key'), 
+                                                                          (pctl_value, interpolation, True), 
+                                                                          lambda: calc_percentiles.get_percentile_arr(arr=vars_dict[v]['base']['values_arr'], 
                                                                                  percentile=pctl_value,                                                            
                                                                                  callback=callback,
                                                                                  callback_percentage_start_value=0, 
@@ -974,7 +1236,7 @@ def get_indice_from_dict_temporal_slices(indice_name,
                                                                                 chunk_counter=1, 
                                                                                 precipitation=True, 
                                                                                 fill_val=vars_dict[v]['fill_value'],                                                                     
-                                                                                interpolation=interpolation)
+                                                                                interpolation=interpolation))
                                 
                                 
                                 # we keep percentiles_arr in dictionary for following calculation of indice
@@ -990,29 +1252,53 @@ def get_indice_from_dict_temporal_slices(indice_name,
                             # for "out-of-base" years we compute daily_pctl_dict ONLY one time (i.e. when cnt=1)
                             if current_intersecting_year != -9999 or cnt==1:
 
-                                new_arrs_base = time_subset.get_resampled_arrs(dt_arr=vars_dict[v]['base']['dt_arr'],
-                                                       values_arr=vars_dict[v]['base']['values_arr'],
-                                                       year_to_eliminate=current_intersecting_year, 
-                                                       year_to_duplicate=ytd)
+                                def get_daily_pctl_dict(v=v, ytd=ytd):
+                                    new_arrs_base = time_subset.get_resampled_arrs(dt_arr=vars_dict[v]['base']['dt_arr'],
+                                                           values_arr=vars_dict[v]['base']['values_arr'],
+                                                           year_to_eliminate=current_intersecting_year, 
+                                                           year_to_duplicate=ytd)
+                                
+                                    # windows of calendar days are computed only once, then resampled
+                                    if v not in window_tables:
+                                        window_tables[v] = calc_percentiles.get_window_table(dt_arr=vars_dict[v]['base']['dt_arr'], 
+                                                                                             window_width=window_width, 
+                                                                                             only_leap_years=only_leap_years, 
+                                                                                             t_calendar=vars_dict[v]['time_calendar'], 
+                                                                                             t_units=vars_dict[v]['time_units'], 
+                                                                                             ignore_Feb29th=ignore_Feb29th)
+                                    if current_intersecting_year == -9999:
+                                        window_table = window_tables[v]
+                                    else:
+                                        window_table = calc_percentiles.get_resampled_window_table(window_tables[v], 
+                                                                                                   time_subset.get_resampled_indices(dt_arr=vars_dict[v]['base']['dt_arr'],
+                                                                                                                                     year_to_eliminate=current_intersecting_year, 
+                                                                                                                                     year_to_duplicate=ytd))
                                     
                                     
-                                # dictionary with daily percentiles    
-                                if current_intersecting_year == -9999:
-                                    logging.info("Daily Percentiles calculation for out-of-base years. Please be patient...")
-                                else:
-                                    logging.info("[Bootstrapping] Daily Percentiles calculation for in-base year %d for %s. Duplicating %s. Please be patient...", current_intersecting_year, str(v), str(ytd))
-                                daily_pctl_dict = calc_percentiles.get_percentile_dict(arr=new_arrs_base[1], 
-                                                                                    dt_arr=new_arrs_base[0], 
-                                                                                    percentile=pctl_value, 
-                                                                                    window_width=window_width, 
-                                                                                    t_calendar=vars_dict[v]['time_calendar'], 
-                                                                                    t_units=vars_dict[v]['time_units'],          
-                                                                                    only_leap_years=only_leap_years, 
-                                                                                    callback=None, callback_percentage_start_value=0, callback_percentage_total=100,
-                                                                                    chunk_counter=1, 
-                                                                                    fill_val=vars_dict[v]['fill_value'],
-                                                                                    ignore_Feb29th=ignore_Feb29th,
-                                                                                    interpolation=interpolation)
+                                    # dictionary with daily percentiles    
+                                    if current_intersecting_year == -9999:
+                                        logging.info("Daily Percentiles calculation for out-of-base years. Please be patient...")
+                                    else:
+                                        logging.info("[Bootstrapping] Daily Percentiles calculation for in-base year %d for %s. Duplicating %s. Please be patient...", current_intersecting_year, str(v), str(ytd))
+                                    return calc_percentiles.get_percentile_dict(arr=new_arrs_base[1], 
+                                                                                        dt_arr=new_arrs_base[0], 
+                                                                                        percentile=pctl_value, 
+                                                                                        window_width=window_width, 
+                                                                                        t_calendar=vars_dict[v]['time_calendar'], 
+                                                                                        t_units=vars_dict[v]['time_units'],          
+                                                                                        only_leap_years=only_leap_years, 
+                                                                                        callback=None, callback_percentage_start_value=0, callback_percentage_total=100,
+                                                                                        chunk_counter=1, 
+                                                                                        fill_val=vars_dict[v]['fill_value'],
+                                                                                        ignore_Feb29th=ignore_Feb29th,
+                                                                                        interpolation=interpolation,
+                                                                                        window_table=window_table)
+
+                                # thresholds may be taken from previous runs (see util/pctl_cache.py)
+                                daily_pctl_dict = pctl_cache.read_percentile_dict(vars_dict[v]['base'].get('cache_key'), 
+                                                                                  (pctl_value, window_width, interpolation, only_leap_years, ignore_Feb29th, 
+                                                                                   vars_dict[v]['time_calendar'], vars_dict[v]['time_units'], current_intersecting_year, ytd), 
+                                                                                  get_daily_pctl_dict)
    
                             if current_intersecting_year == -9999 and cnt==1:
                                 pctl_thresh[v]['without_bootstrapping'] = daily_pctl_dict
@@ -40,12 +40,20 @@ double getElementAt_2(const float *table, int t, int i, int j);
 float WSDI_CSDI_1d(const float *indata,int i, int j, int N);
 void WSDI_CSDI_3d(const float *indata, int _sizeT,int _sizeI,int _sizeJ, double *outdata, int N);
 void percentile_3d(const float *indata, int _sizeT, int _sizeI, int _sizeJ, double *outdata, int percentile, float fill_value,  char * interpolation);
-double percentile_1d(const float *indata, int i, int j, char * interpolation);
-float* get_tab_1d(const float *indata, int i, int j, int* new_size);
+void percentiles_3d(const float *indata, int _sizeT, int _sizeI, int _sizeJ, double *outdata, int nb_percentiles, const int *percentiles, float fill_value, char * interpolation);
+void percentiles_1d(const float *indata, int i, int j, char * interpolation, float* tab_1d, int nb_percentiles, const int *percentiles, const int *order, double *outdata, int out_stride);
+void get_percentiles_order(int nb_percentiles, const int *percentiles, int *order);
+int get_tab_1d(const float *indata, int i, int j, float* tab_1d);
+int get_percentile_rank(int len_tab_1d, int hyndman_fan);
 double get_percentile(float* tab_1d, int len_tab_1d);
 double get_percentile2(float* tab_1d, int len_tab_1d);
 void swap(float* a, float* b);
 void qs(float* s_arr, int first, int last);
+void select_kth(float* s_arr, int len, int k);
+void percentile_windows_3d(const float *indata, int _sizeT, int _sizeI, int _sizeJ, double *outdata, int percentile, float fill_value, char * interpolation, int nb_windows, const int *nb_removed, const int *removed, const int *nb_added, const int *added);
+void percentiles_windows_3d(const float *indata, int _sizeT, int _sizeI, int _sizeJ, double *outdata, int nb_percentiles, const int *percentiles, float fill_value, char * interpolation, int nb_windows, const int *nb_removed, const int *removed, const int *nb_added, const int *added);
+int lower_bound(const float* s_arr, int len, float x);
+int upper_bound(const float* s_arr, int len, float x);
 double get_run_stat_1d(const float *indata, int i, int j, int w_width, float fill_val, char * stat_mode, char * extreme_mode, int *index_event);
 void get_run_stat_3d(const float *indata, int _sizeT, int _sizeI, int _sizeJ, double *outdata, int w_width, float fill_val, char * stat_mode, char * extreme_mode, int *index_event);
 /////////////////////////////////////////////////////////////////////
@@ -490,106 +498,161 @@ void WSDI_CSDI_3d(const float *indata, int _sizeT,int _sizeI,int _sizeJ, double
 
 
 // function called from Python 
+// Fill values are not taken into account.
 void percentile_3d(const float *indata, int _sizeT, int _sizeI, int _sizeJ, double *outdata, int percentile, float fill_value, char * interpolation)
 {
+    percentiles_3d(indata, _sizeT, _sizeI, _sizeJ, outdata, 1, &percentile, fill_value, interpolation);
+}
 
-    setGlobalVariables(_sizeT,_sizeI,_sizeJ, fill_value, percentile);
+
+// function called from Python
+// Several percentiles of the same values: the values of each pixel are copied and selected once for all percentiles (see percentiles_1d).
+// Fill values are not taken into account. One buffer is used for all pixels.
+// outdata: array (nb_percentiles, sizeI, sizeJ)
+void percentiles_3d(const float *indata, int _sizeT, int _sizeI, int _sizeJ, double *outdata, int nb_percentiles, const int *percentiles, float fill_value, char * interpolation)
+{
+
+    setGlobalVariables(_sizeT,_sizeI,_sizeJ, fill_value, percentiles[0]);
     int i,j;
 
+    // values of the current pixel
+    float* tab_1d = (float *) malloc ((sizeT > 0 ? sizeT : 1)*sizeof(float));
+
+    // percentiles from the smallest to the greatest
+    int* order = (int *) malloc (nb_percentiles*sizeof(int));
+    get_percentiles_order(nb_percentiles, percentiles, order);
+
     for (i = 0; i < sizeI; i++)
     {
 
         for (j = 0; j < sizeJ; j++)
         {
-            outdata[i*sizeJ+j] = percentile_1d(indata, i, j, interpolation);
+            percentiles_1d(indata, i, j, interpolation, tab_1d, nb_percentiles, percentiles, order, outdata + i*sizeJ+j, sizeI*sizeJ);
         }
     }
 
+    free(tab_1d);
+    free(order);
 }
 
 
+// indices of the percentiles, from the smallest percentile to the greatest one (insertion sort)
+void get_percentiles_order(int nb_percentiles, const int *percentiles, int *order)
+{
+    int p, q, tmp;
 
-
-
+    for (p = 0; p < nb_percentiles; p++)
+    {
+        order[p] = p;
+        for (q = p; q > 0 && percentiles[order[q-1]] > percentiles[order[q]]; q--)
+        {
+            tmp = order[q];
+            order[q] = order[q-1];
+            order[q-1] = tmp;
+        }
+    }
+}
 
 
 // for 1D array 
-double percentile_1d(const float *indata, int i, int j, char * interpolation)
+// Only the two values between which each percentile is interpolated are put at their sorted positions (selection, see select_kth),
+// the values are not sorted. Percentiles are taken from the smallest to the greatest (see get_percentiles_order):
+// the values of the next ranks are selected among the values after the ones already selected.
+// outdata[percentile index * out_stride]: percentiles
+void percentiles_1d(const float *indata, int i, int j, char * interpolation, float* tab_1d, int nb_percentiles, const int *percentiles, const int *order, double *outdata, int out_stride)
 {
-    int new_size = 0;
-    
-    float* new_tab =  get_tab_1d(indata, i,j,&new_size);
-    
-    qs(new_tab, 0, sizeT-1);
-    
-    // begin print
-//    int xx;
-//    for(xx=0; xx<sizeT; xx++)
-//    {
-//    	printf("%f", new_tab[xx]);
-//    	printf("\n");
-//    }
-//    printf("+++++");
-
-//    printf("%f", new_tab[new_size-1]);
-//    printf("\n");
-//    printf("%f", new_tab[new_size]);
-//    printf("\n");
-//    printf("+++++");
-//    printf("\n");
-
-    //printf("%d", new_size);
-    //printf("\n");
-
-    // end print
+    int hyndman_fan = (strcmp(interpolation,"hyndman_fan")==0);
+    int new_size = get_tab_1d(indata, i, j, tab_1d);
 
-    double perc;
+    // values before tab_1d[selected] are not greater than the values after it
+    int selected = 0;
+    int p, t, rank;
 
-    if (strcmp(interpolation,"linear")==0)
+    for (p = 0; p < nb_percentiles; p++)
     {
-    	perc =  get_percentile(new_tab, new_size);
-    }
-    else if (strcmp(interpolation,"hyndman_fan")==0)
-    {
-    	perc =  get_percentile2(new_tab, new_size);
-    }
+        percentile = percentiles[order[p]];
 
-      
-    free(new_tab);
+        if (new_size > 1)
+        {
+            // ranks do not decrease when percentiles increase
+            rank = get_percentile_rank(new_size, hyndman_fan);
+            if (rank >= selected)
+            {
+                select_kth(tab_1d + selected, new_size - selected, rank - selected);
+                selected = rank + 1;
+            }
+            if (rank + 1 >= selected)
+            {
+                // the next value is the smallest of the values after it
+                for (t = rank + 2; t < new_size; t++)
+                {
+                    if (tab_1d[t] < tab_1d[rank+1]) swap(&tab_1d[t], &tab_1d[rank+1]);
+                }
+                selected = rank + 2;
+            }
+        }
 
-    return  perc;
+        if (hyndman_fan)
+        {
+            outdata[order[p]*out_stride] = get_percentile2(tab_1d, new_size);
+        }
+        else
+        {
+            outdata[order[p]*out_stride] = get_percentile(tab_1d, new_size);
+        }
+    }
 }
 
 
 // indata is actually a 3D array represented in one big 1D array
-float* get_tab_1d(const float *indata, int i, int j, int* new_size)
+// copies the values of indata at (i,j) which are not fill values to tab_1d, returns their number
+int get_tab_1d(const float *indata, int i, int j, float* tab_1d)
 {
-    float* tab_1d;
     float val;
-    int nb_fill_values = 0;
-    
-    // we reserve memory for tab_1d
-    tab_1d = (float *) malloc (sizeT*sizeof(float));
+    int new_size = 0;
     
-    // we copy values from indata at (i,j) to tab_1d
     int t;
     for(t=0; t<sizeT; t++)
     {
         val = getElementAt(indata,t,i,j);
-        tab_1d[t]=val;
-        if (val == fill_value)
+        if (val != fill_value)
         {  
-            nb_fill_values++;
+            tab_1d[new_size] = val;
+            new_size++;
         }
     }
     
-    *new_size = sizeT-nb_fill_values;
-    
-    return tab_1d;
+    return new_size;
     
 }
 
 
+// rank (from 0) of the first of the two sorted values between which the percentile is interpolated (see get_percentile and get_percentile2)
+int get_percentile_rank(int len_tab_1d, int hyndman_fan)
+{
+    double p = percentile * 0.01;
+    double index, index_integer_part;
+    int rank;
+
+    if (hyndman_fan)
+    {
+        index = (len_tab_1d) * p + (1+p)/3. ;
+        modf(index, &index_integer_part);
+        rank = index_integer_part - 1;
+    }
+    else
+    {
+        index = p * (len_tab_1d-1);
+        modf(index, &index_integer_part);
+        rank = index_integer_part;
+    }
+
+    if (rank < 0) rank = 0;
+    if (rank > len_tab_1d-2) rank = len_tab_1d-2;
+    return rank;
+}
+
+
 
 double get_percentile2(float* tab_1d, int len_tab_1d)
 
@@ -638,6 +701,10 @@ double get_percentile2(float* tab_1d, int len_tab_1d)
     modf(index, &index_integer_part);
     int i = index_integer_part;
 
+    // the percentile is out of the values: the smallest or the greatest value
+    if (i < 1) return tab_1d[0];
+    if (i > len_tab_1d-1) return tab_1d[len_tab_1d-1];
+
     double perc = tab_1d[i-1] + (index-i)*(tab_1d[i]-tab_1d[i-1]);
 
     return perc;
@@ -662,6 +729,9 @@ double get_percentile(float* tab_1d, int len_tab_1d)
 
     i = index_integer_part;
     j = i + 1;
+
+    // percentile 100: the greatest value
+    if (j > len_tab_1d-1) return tab_1d[len_tab_1d-1];
     
     perc = index_fractional_part * (tab_1d[j] - tab_1d[i]) + tab_1d[i];
     return perc;
@@ -702,6 +772,197 @@ void qs(float* s_arr, int first, int last)
         qs(s_arr, first, j);
 }
 
+
+// Selection (introselect): reorders s_arr so that s_arr[k] is the value of rank k (from 0) of the sorted values,
+// values before it are not greater and values after it are not smaller.
+// Partitions as qs around the median of three values, and sorts the remaining values with qs after too many partitions.
+void select_kth(float* s_arr, int len, int k)
+{
+    int first = 0, last = len - 1;
+    int i, j;
+    float x, a, b, c;
+
+    // maximum number of partitions: 2*log2(len)
+    int max_depth = 0;
+    for (i = len; i > 1; i /= 2) max_depth += 2;
+
+    while (first < last)
+    {
+        if (max_depth-- == 0)
+        {
+            qs(s_arr, first, last);
+            return;
+        }
+
+        a = s_arr[first];
+        b = s_arr[(first + last) / 2];
+        c = s_arr[last];
+        x = (a < b) ? ((b < c) ? b : ((a < c) ? c : a)) : ((a < c) ? a : ((b < c) ? c : b));
+
+        i = first;
+        j = last;
+        do {
+                while (s_arr[i] < x) i++;
+                while (s_arr[j] > x) j--;
+
+                if(i <= j)
+                {
+                    swap(&s_arr[i], &s_arr[j]);
+                    i++;
+                    j--;
+                }
+            } while (i <= j);
+
+        // values of [first, j] are not greater than x, values of [i, last] are not smaller than x, values between are equal to x
+        if (k <= j) last = j;
+        else if (k >= i) first = i;
+        else return;
+    }
+}
+
+
+// function called from Python
+// Percentiles of consecutive windows of time steps (e.g. windows of consecutive calendar days, see calc_percentiles.get_percentile_dict).
+// Each window is given by the time steps leaving and entering it, compared with the previous window (the first window: only entering time steps):
+// window k removes nb_removed[k] time steps (next values of "removed") and adds nb_added[k] time steps (next values of "added").
+// For each pixel, the values of the current window (except fill values) are kept sorted: leaving values are removed and entering values are inserted
+// (binary search), then the percentile is read from the sorted values, as percentiles_1d does after selecting them in the whole window.
+// Pixels of a row are processed together, so that the values of a time step are read contiguously.
+// outdata: percentiles of all windows, array (nb_windows, sizeI, sizeJ)
+void percentile_windows_3d(const float *indata, int _sizeT, int _sizeI, int _sizeJ, double *outdata, int percentile, float fill_value, char * interpolation, int nb_windows, const int *nb_removed, const int *removed, const int *nb_added, const int *added)
+{
+    percentiles_windows_3d(indata, _sizeT, _sizeI, _sizeJ, outdata, 1, &percentile, fill_value, interpolation, nb_windows, nb_removed, removed, nb_added, added);
+}
+
+
+// function called from Python
+// Several percentiles of consecutive windows (see percentile_windows_3d): all percentiles are read from the same sorted values.
+// outdata: array (nb_windows, nb_percentiles, sizeI, sizeJ)
+void percentiles_windows_3d(const float *indata, int _sizeT, int _sizeI, int _sizeJ, double *outdata, int nb_percentiles, const int *percentiles, float fill_value, char * interpolation, int nb_windows, const int *nb_removed, const int *removed, const int *nb_added, const int *added)
+{
+
+    setGlobalVariables(_sizeT,_sizeI,_sizeJ, fill_value, percentiles[0]);
+    int i,j,k,p,t,pos;
+    int i_removed, i_added, len_window, max_len_window;
+    float val;
+    const float* row;
+    float* tab_1d;
+    double* out;
+
+    int hyndman_fan = (strcmp(interpolation,"hyndman_fan")==0);
+
+    // maximum size of a window
+    len_window = 0;
+    max_len_window = 0;
+    for (k = 0; k < nb_windows; k++)
+    {
+        len_window += nb_added[k] - nb_removed[k];
+        if (len_window > max_len_window) max_len_window = len_window;
+    }
+
+    // for each pixel of a row: sorted values of the current window
+    int stride = max_len_window > 0 ? max_len_window : 1;
+    float* tabs = (float *) malloc (sizeJ*stride*sizeof(float));
+    int* len_tabs = (int *) malloc (sizeJ*sizeof(int));
+
+    for (i = 0; i < sizeI; i++)
+    {
+        for (j = 0; j < sizeJ; j++) len_tabs[j] = 0;
+        i_removed = 0;
+        i_added = 0;
+
+        for (k = 0; k < nb_windows; k++)
+        {
+            for (t = i_removed; t < i_removed + nb_removed[k]; t++)
+            {
+                row = indata + removed[t]*sizeI*sizeJ + i*sizeJ;
+                for (j = 0; j < sizeJ; j++)
+                {
+                    val = row[j];
+                    if (val == fill_value) continue;
+
+                    tab_1d = tabs + j*stride;
+                    pos = lower_bound(tab_1d, len_tabs[j], val);
+                    if (pos == len_tabs[j] || tab_1d[pos] != val) continue;
+                    memmove(tab_1d + pos, tab_1d + pos + 1, (len_tabs[j] - pos - 1)*sizeof(float));
+                    len_tabs[j]--;
+                }
+            }
+            i_removed += nb_removed[k];
+
+            for (t = i_added; t < i_added + nb_added[k]; t++)
+            {
+                row = indata + added[t]*sizeI*sizeJ + i*sizeJ;
+                for (j = 0; j < sizeJ; j++)
+                {
+                    val = row[j];
+                    if (val == fill_value) continue;
+
+                    tab_1d = tabs + j*stride;
+                    pos = upper_bound(tab_1d, len_tabs[j], val);
+                    memmove(tab_1d + pos + 1, tab_1d + pos, (len_tabs[j] - pos)*sizeof(float));
+                    tab_1d[pos] = val;
+                    len_tabs[j]++;
+                }
+            }
+            i_added += nb_added[k];
+
+            for (p = 0; p < nb_percentiles; p++)
+            {
+                percentile = percentiles[p];
+                out = outdata + (k*nb_percentiles + p)*sizeI*sizeJ + i*sizeJ;
+
+                for (j = 0; j < sizeJ; j++)
+                {
+                    tab_1d = tabs + j*stride;
+
+                    if (hyndman_fan)
+                    {
+                        out[j] = get_percentile2(tab_1d, len_tabs[j]);
+                    }
+                    else
+                    {
+                        out[j] = get_percentile(tab_1d, len_tabs[j]);
+                    }
+                }
+            }
+        }
+    }
+
+    free(tabs);
+    free(len_tabs);
+}
+
+
+// index of the first value of a sorted array which is not smaller than x
+int lower_bound(const float* s_arr, int len, float x)
+{
+    int first = 0, last = len, middle;
+
+    while (first < last)
+    {
+        middle = (first + last) / 2;
+        if (s_arr[middle] < x) first = middle + 1;
+        else last = middle;
+    }
+    return first;
+}
+
+
+// index of the first value of a sorted array which is greater than x
+int upper_bound(const float* s_arr, int len, float x)
+{
+    int first = 0, last = len, middle;
+
+    while (first < last)
+    {
+        middle = (first + last) / 2;
+        if (s_arr[middle] <= x) first = middle + 1;
+        else last = middle;
+    }
+    return first;
+}
+
 /////////////////////////////////////////////////////////////////////////////////////
 // percentiles computation: end
 ////////////////////////////////////////////////////////////////////////////////////
@@ -11,6 +11,9 @@ map_indice_type =   {
                                              'R75p', 'R75pTOT', 'R95p', 'R95pTOT', 'R99p', 'R99pTOT']
                     }
 
+### simple indices which can be computed on packed values (see icclim.indice, "packed_values")
+packed_indices = ['SU', 'CSU', 'TR', 'FD', 'CFD', 'ID', 'CDD', 'CWD', 'RR1', 'R10mm', 'R20mm', 'SD1', 'SD5cm', 'SD50cm']
+
 map_indice_percentile_value =   {
                                     'TG10p': [10],
                                     'TX10p': [10], 
@@ -0,0 +1,112 @@
+# -*- coding: utf-8 -*-
+
+# Benchmark of daily percentile thresholds (calc_percentiles.get_percentile_dict) on a synthetic base period.
+#
+# Usage: python benchmark_percentiles.py [nb_years nb_rows nb_columns [window_width]]
+# The percentiles of the sliding windows (libC.c: percentile_windows_3d) are compared with the percentiles of each window
+# computed separately (libC.c: percentile_3d on the values of the window), for both interpolations.
+# get_percentile_dict uses the sliding windows if window_width >= calc_percentiles.SLIDING_WINDOW_MIN_WIDTH.
+# The percentiles of a family of indices (PERCENTILES, e.g. TX10p and TX90p) are then computed in one call and in separate calls.
+
+import sys
+import time
+import ctypes
+import numpy
+from numpy.ctypeslib import ndpointer
+import netcdftime
+
+import icclim.calc_percentiles as calc_percentiles
+
+
+NB_YEARS = 30
+SHAPE = (20, 20)
+PERCENTILE = 90
+PERCENTILES = [10, 90]
+WINDOW_WIDTH = 5
+MISSING_RATE = 0.01
+
+T_UNITS = 'days since 1950-01-01'
+T_CALENDAR = 'gregorian'
+
+
+def get_base(nb_years, shape):
+    t = netcdftime.utime(T_UNITS, T_CALENDAR)
+    nums = numpy.arange(t.date2num(netcdftime.datetime(1961, 1, 1, 12)), t.date2num(netcdftime.datetime(1961 + nb_years - 1, 12, 31, 12)) + 1)
+    dt_arr = numpy.array(t.num2date(nums))
+    values = numpy.random.RandomState(0).normal(15., 8., (len(dt_arr),) + shape).astype('float32')
+    mask = numpy.random.RandomState(1).rand(*values.shape) < MISSING_RATE
+    return (dt_arr, numpy.ma.array(values, mask=mask, fill_value=1e20))
+
+
+def get_percentile_dicts(arr, window_table, interpolation):
+    '''
+    Percentiles of the windows, sliding (percentile_windows_3d) and computed separately (percentile_3d).
+    '''
+    C_percentile = calc_percentiles.libraryC.percentile_3d
+    C_percentile.restype = None
+    C_percentile.argtypes = [ndpointer(ctypes.c_float), ctypes.c_int, ctypes.c_int, ctypes.c_int,
+                             ndpointer(ctypes.c_double), ctypes.c_int, ctypes.c_float, ctypes.c_char_p]
+    C_percentile_windows = calc_percentiles.libraryC.percentile_windows_3d
+    C_percentile_windows.restype = None
+    C_percentile_windows.argtypes = C_percentile.argtypes + [ctypes.c_int] + [ndpointer(ctypes.c_int)] * 4
+
+    arr_filled = arr.filled(1e20)
+    windows = window_table.values()
+
+    t0 = time.time()
+    sliding = numpy.zeros((len(windows),) + arr.shape[1:])
+    C_percentile_windows(arr_filled, arr_filled.shape[0], arr.shape[1], arr.shape[2], sliding, PERCENTILE, 1e20, interpolation,
+                         len(windows), *calc_percentiles.get_window_changes(windows))
+    t_sliding = time.time() - t0
+
+    t0 = time.time()
+    per_window = numpy.zeros((len(windows),) + arr.shape[1:])
+    for (k, window) in enumerate(windows):
+        arr_subset = arr_filled[window]
+        C_percentile(arr_subset, arr_subset.shape[0], arr_subset.shape[1], arr_subset.shape[2], per_window[k], PERCENTILE, 1e20, interpolation)
+    t_per_window = time.time() - t0
+
+    return (sliding, t_sliding, per_window, t_per_window)
+
+
+def main(argv):
+    nb_years = int(argv[1]) if len(argv) > 1 else NB_YEARS
+    shape = (int(argv[2]), int(argv[3])) if len(argv) > 3 else SHAPE
+    window_width = int(argv[4]) if len(argv) > 4 else WINDOW_WIDTH
+
+    (dt_arr, arr) = get_base(nb_years, shape)
+    print 'Base period: %d years, %d time steps, %dx%d pixels, %d-day windows, percentile %d' % (nb_years, len(dt_arr), shape[0], shape[1], window_width, PERCENTILE)
+
+    t0 = time.time()
+    window_table = calc_percentiles.get_window_table(dt_arr, window_width, False, T_CALENDAR, T_UNITS)
+    print 'window table: %.2f s' % (time.time() - t0)
+
+    for interpolation in ['linear', 'hyndman_fan']:
+        t0 = time.time()
+        percentile_dict = calc_percentiles.get_percentile_dict(arr, dt_arr, PERCENTILE, window_width, T_CALENDAR, T_UNITS,
+                                                               interpolation=interpolation, window_table=window_table)
+        t_dict = time.time() - t0
+
+        (sliding, t_sliding, per_window, t_per_window) = get_percentile_dicts(arr, window_table, interpolation)
+
+        same = numpy.array_equal(sliding, per_window) and \
+               all([numpy.array_equal(percentile_dict[calday].data, per_window[k]) for (k, calday) in enumerate(window_table.keys())])
+        print '%-12s get_percentile_dict: %6.2f s   sliding windows: %6.2f s   each window: %6.2f s   same values: %s' % (interpolation, t_dict, t_sliding, t_per_window, same)
+
+    t0 = time.time()
+    percentile_dicts = calc_percentiles.get_percentile_dict(arr, dt_arr, PERCENTILES, window_width, T_CALENDAR, T_UNITS, window_table=window_table)
+    t_one_call = time.time() - t0
+
+    t0 = time.time()
+    same = True
+    for (p, percentile) in enumerate(PERCENTILES):
+        percentile_dict = calc_percentiles.get_percentile_dict(arr, dt_arr, percentile, window_width, T_CALENDAR, T_UNITS, window_table=window_table)
+        same = same and all([numpy.array_equal(percentile_dict[calday].data, percentile_dicts[p][calday].data) for calday in window_table.keys()])
+    t_separate = time.time() - t0
+    print 'percentiles %s   one call: %6.2f s   separate calls: %6.2f s   same values: %s' % (PERCENTILES, t_one_call, t_separate, same)
+
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main(sys.argv))
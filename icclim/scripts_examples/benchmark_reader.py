@@ -0,0 +1,170 @@
+# -*- coding: utf-8 -*-
+
+# Benchmark of the tile reader (util_nc.get_values_arr_and_dt_arr) on multi-file input:
+#   - read time of fancy indexing vs one read per run of consecutive time steps (MFDataset and per-file reader),
+#     and of the same files converted to memory-mapped array stores (see util/stores.py) and to a pixel-major pack (see util/pack.py),
+#   - peak RSS of the unit conversion (values*scale_factor + add_offset): masked array arithmetic vs in-place conversion.
+#     Each measure is done in a new process (peak RSS of the process minus RSS before reading).
+#
+# Usage: python benchmark_reader.py [var_name file1.nc file2.nc ...]
+# Without arguments, a synthetic multi-file dataset (10 years of daily data in 10 files) is created in a temporary directory.
+# For large cubes (e.g. 1000x1000 pixels x 36500 days), give the files of the cube and the benchmark reads the first 
+# time steps that fit in memory (see MAX_READ_MBYTES).
+
+import sys
+import os
+import time
+import resource
+import multiprocessing
+import shutil
+import tempfile
+import datetime
+import numpy
+from netCDF4 import Dataset, MFDataset
+
+import icclim.util.util_nc as util_nc
+import icclim.util.util_dt as util_dt
+import icclim.util.nc_pool as nc_pool
+import icclim.util.stores as stores
+import icclim.util.pack as pack
+
+
+def create_dataset(dirname, var_name='tasmax', first_year=1961, nb_years=10, nb_rows=100, nb_cols=100):
+    files = []
+    for year in range(first_year, first_year + nb_years):
+        filename = os.path.join(dirname, '%s_%d.nc' % (var_name, year))
+        nc = Dataset(filename, 'w', format='NETCDF4_CLASSIC')
+        nc.createDimension('time', None)
+        nc.createDimension('lat', nb_rows)
+        nc.createDimension('lon', nb_cols)
+        var_time = nc.createVariable('time', 'f8', ('time',))
+        var_time.units = 'days since 1950-01-01 12:00:00'
+        var_time.calendar = 'gregorian'
+        first_day = (datetime.datetime(year, 1, 1) - datetime.datetime(1950, 1, 1)).days
+        nb_days = (datetime.datetime(year + 1, 1, 1) - datetime.datetime(year, 1, 1)).days
+        var_time[:] = numpy.arange(first_day, first_day + nb_days)
+        var = nc.createVariable(var_name, 'f4', ('time', 'lat', 'lon'), fill_value=1e20)
+        var.units = 'K'
+        var[:] = 280 + 10 * numpy.random.random_sample((nb_days, nb_rows, nb_cols))
+        nc.close()
+        files.append(filename)
+    return files
+
+
+def get_indices(var_time, time_range, ignore_Feb29th):
+    (dt_arr, year_arr, month_arr, day_arr, dayofyear_arr) = util_dt.decode_time_axis(var_time[:], calend=var_time.calendar, units=var_time.units)
+    indices_subset = util_dt.get_indices_subset(dt_arr, time_range)
+    if ignore_Feb29th:
+        indices_subset = indices_subset[numpy.logical_not(numpy.logical_and(month_arr[indices_subset]==2, day_arr[indices_subset]==29))]
+    return indices_subset
+
+
+def read_fancy(var, indices):
+    # previous behaviour of the tile reader: one fancy indexing read with the array of indices
+    return var[indices, :, :]
+
+
+def read_runs(var, indices):
+    return util_nc.read_values_arr(var, indices)
+
+
+def read_pack(var, indices):
+    # compressed chunks are decompressed at each read (the chunk cache of the previous read is emptied)
+    for file_var in var.get_file_vars():
+        file_var.close()
+    return util_nc.read_values_arr(var, indices)
+
+
+# maximum size of values read by the peak RSS benchmark
+MAX_READ_MBYTES = 2000
+
+
+def convert_masked_arithmetic(values_arr, scale_factor, add_offset):
+    # previous behaviour of the tile reader: temporary masked arrays
+    return (values_arr * scale_factor) + add_offset
+
+
+def convert_in_place(values_arr, scale_factor, add_offset):
+    util_nc.convert_values_arr(values_arr, scale_factor=scale_factor, add_offset=add_offset)
+    return values_arr
+
+
+def measure_rss(files, var_name, nb_time_steps, convert, scale_factor, add_offset, queue):
+    nc = MFDataset(files, 'r', aggdim='time')
+    var = nc.variables[var_name]
+    rss0 = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    values_arr = util_nc.read_values_arr(var, numpy.arange(nb_time_steps))
+    values_arr = convert(values_arr, scale_factor, add_offset)
+    rss1 = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    nc.close()
+    queue.put((rss1 - rss0) / 1024.) # ru_maxrss is in Kbytes on Linux
+
+
+def benchmark_rss(files, var_name):
+    nc = MFDataset(files, 'r', aggdim='time')
+    shape = nc.variables[var_name].shape
+    nc.close()
+    nb_time_steps = min(shape[0], max(1, int(MAX_READ_MBYTES * 1024 * 1024 / (5. * shape[-2] * shape[-1]))))
+    
+    print 'peak RSS of reading + unit conversion, %d time steps (%.0f Mbytes of float32 values + mask)' % (nb_time_steps, nb_time_steps * shape[-2] * shape[-1] * 5. / 1024 / 1024)
+    for (scale_factor, add_offset, label) in [(1.0, 0.0, 'identity'), (1.0, 273.15, 'degC -> K'), (86400.0, 0.0, 'mm/s -> mm/day')]:
+        for (name, convert) in [('masked arithmetic', convert_masked_arithmetic), ('in place', convert_in_place)]:
+            queue = multiprocessing.Queue()
+            p = multiprocessing.Process(target=measure_rss, args=(files, var_name, nb_time_steps, convert, scale_factor, add_offset, queue))
+            p.start()
+            rss = queue.get()
+            p.join()
+            print '    %-15s %-18s: %10.1f Mbytes' % (label, name, rss)
+
+
+def benchmark(files, var_name, nb_repeat=3):
+    nc = MFDataset(files, 'r', aggdim='time')
+    var_time = nc.variables['time']
+    var = nc.variables[var_name]
+    time_range = util_dt.get_time_range(files)
+
+    # per-file reader (mf_reader.MultiFileDataset), files are opened through a pool
+    pool = nc_pool.DatasetPool()
+    var_per_file = pool.get(files, aggdim='time').variables[var_name]
+
+    # same files converted to array stores
+    store_dir = tempfile.mkdtemp()
+    store_files = [stores.write_store(ifile, os.path.join(store_dir, '%d.json' % i)) for (i, ifile) in enumerate(files)]
+    var_store = pool.get(store_files, aggdim='time').variables[var_name]
+
+    # same files packed pixel-major
+    t0 = time.time()
+    pack_dir = pack.pack(files, var_name, out_path=os.path.join(store_dir, 'pack'))
+    print 'packing: %.2f s' % (time.time() - t0)
+    var_pack = pool.get([pack_dir], aggdim='time').variables[var_name]
+    util_nc.set_chunk_cache(var_pack, numpy.prod(var.shape) * var.dtype.itemsize)
+
+    print '%d file(s), variable %s %s' % (len(files), var_name, str(var.shape))
+    for ignore_Feb29th in [False, True]:
+        indices = get_indices(var_time, time_range, ignore_Feb29th)
+        for (name, reader, v) in [('fancy indexing', read_fancy, var), ('contiguous runs', read_runs, var), ('per-file reader', read_runs, var_per_file),
+                                  ('array store', read_runs, var_store), ('pixel-major pack', read_pack, var_pack)]:
+            t = []
+            for i in range(nb_repeat):
+                t0 = time.time()
+                arr = reader(v, indices)
+                t.append(time.time() - t0)
+            print '    ignore_Feb29th=%-5s %-16s: %8.3f s (best of %d), %d time steps' % (ignore_Feb29th, name, min(t), nb_repeat, arr.shape[0])
+
+    pool.close()
+    nc.close()
+    shutil.rmtree(store_dir)
+
+
+if __name__ == '__main__':
+    if len(sys.argv) > 2:
+        benchmark(sys.argv[2:], sys.argv[1])
+        benchmark_rss(sys.argv[2:], sys.argv[1])
+    else:
+        dirname = tempfile.mkdtemp()
+        try:
+            files = create_dataset(dirname)
+            benchmark(files, 'tasmax')
+            benchmark_rss(files, 'tasmax')
+        finally:
+            shutil.rmtree(dirname)
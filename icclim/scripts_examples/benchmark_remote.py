@@ -0,0 +1,107 @@
+# -*- coding: utf-8 -*-
+
+# Benchmark of the remote reader (util/remote_reader.py): throughput of the read of one tile at different numbers of connections.
+#
+# Usage: python benchmark_remote.py [url var_name]
+# With arguments, the tile (whole grid, all time steps) is read from an OPeNDAP dataset with remote_reader.fetch_opendap.
+# Without arguments, a local stand-in HTTP server serves hyperslabs of a synthetic cube as raw float32 values,
+# with a latency per request and a bandwidth per connection (LATENCY_SECONDS, BANDWIDTH_MBYTES), and a proportion
+# of failed requests (FAILURE_RATE) retried by the reader.
+
+import sys
+import time
+import random
+import urllib2
+import urlparse
+import multiprocessing
+import BaseHTTPServer
+import SocketServer
+import numpy
+from netCDF4 import Dataset
+
+import icclim.util.remote_reader as remote_reader
+
+
+# stand-in server
+PORT = 8765
+SHAPE = (3650, 100, 100)
+LATENCY_SECONDS = 0.05
+BANDWIDTH_MBYTES = 20.
+FAILURE_RATE = 0.05
+
+NB_CONNECTIONS = [1, 2, 4, 8]
+MAX_REQUEST_MBYTES = 10.
+
+
+class StandInHandler(BaseHTTPServer.BaseHTTPRequestHandler):
+    '''
+    GET /var_name?t=start:stop&r=start:stop&c=start:stop returns the values of the hyperslab (raw float32, shape in header "X-Shape").
+    '''
+
+    cube = None
+
+    def do_GET(self):
+        query = urlparse.parse_qs(urlparse.urlparse(self.path).query)
+        key = tuple([slice(*[int(i) if i != '' else None for i in query[d][0].split(':')]) for d in ['t', 'r', 'c']])
+        arr = self.cube[key]
+        time.sleep(LATENCY_SECONDS + arr.nbytes / (BANDWIDTH_MBYTES * 1024 * 1024))
+        if random.random() < FAILURE_RATE:
+            self.send_error(503)
+            return
+        self.send_response(200)
+        self.send_header('X-Shape', ','.join([str(n) for n in arr.shape]))
+        self.end_headers()
+        self.wfile.write(arr.tostring())
+
+    def log_message(self, format, *args):
+        pass
+
+
+class StandInServer(SocketServer.ThreadingMixIn, BaseHTTPServer.HTTPServer):
+    daemon_threads = True
+
+
+def serve():
+    StandInHandler.cube = (280 + 10 * numpy.random.random_sample(SHAPE)).astype('float32')
+    StandInServer(('localhost', PORT), StandInHandler).serve_forever()
+
+
+def fetch_http(url, var_name, key):
+    # request of the stand-in server (see remote_reader.RemoteReader, ``fetch``)
+    query = '&'.join(['%s=%s:%s' % (d, '' if k.start is None else k.start, '' if k.stop is None else k.stop) for (d, k) in zip(['t', 'r', 'c'], key)])
+    response = urllib2.urlopen(url + '/' + var_name + '?' + query)
+    shape = [int(n) for n in response.info()['X-Shape'].split(',')]
+    return numpy.frombuffer(response.read(), dtype='float32').reshape(shape)
+
+
+def benchmark(url, var_name, shape, itemsize, fetch):
+    key = (None, slice(None), slice(None))
+    print 'variable %s %s, requests of at most %.1f Mbytes' % (var_name, str(shape), MAX_REQUEST_MBYTES)
+    for nb_connections in NB_CONNECTIONS:
+        reader = remote_reader.RemoteReader(nb_connections=nb_connections, max_request_Mbytes=MAX_REQUEST_MBYTES, fetch=fetch)
+        requests = reader.split(key, 0, [(0, shape[0])], shape, itemsize)[0]
+        data = numpy.empty(shape, dtype='float32')
+        t0 = time.time()
+        for (i, arr) in reader.read([(url, var_name, req_key) for (req_key, out_key) in requests]):
+            data[requests[i][1]] = numpy.ma.getdata(arr)
+        seconds = time.time() - t0
+        print '    %d connection(s): %3d request(s), %2d retry(ies), %6.2f s, %7.1f Mbytes/s' % (nb_connections, reader.nb_requests, reader.nb_retries,
+                                                                                                  seconds, data.nbytes / (1024. * 1024.) / seconds)
+        reader.close()
+
+
+if __name__ == '__main__':
+    if len(sys.argv) > 2:
+        nc = Dataset(sys.argv[1], 'r')
+        var = nc.variables[sys.argv[2]]
+        (shape, itemsize) = (var.shape, var.dtype.itemsize)
+        nc.close()
+        benchmark(sys.argv[1], sys.argv[2], shape, itemsize, remote_reader.fetch_opendap)
+    else:
+        server = multiprocessing.Process(target=serve)
+        server.start()
+        time.sleep(1)
+        try:
+            benchmark('http://localhost:%d' % PORT, 'tasmax', SHAPE, 4, fetch_http)
+        finally:
+            server.terminate()
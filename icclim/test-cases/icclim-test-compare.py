@@ -0,0 +1,225 @@
+#! /usr/bin/env python
+import ConfigParser
+import ast
+import logging
+import os
+import sys
+from collections import OrderedDict
+
+import netCDF4
+import numpy
+
+from auxiliary import *
+
+logging.basicConfig(level=logging.INFO, format='%(asctime)s %(message)s')
+
+import icclim
+
+from argparse import ArgumentParser
+
+# Check command arguments.
+description = """ICCLIM-test compare.py
+Runs the test cases (Python config files, see icclim-test-wrapper.py) once as they are defined (reference run), then once
+per set of parameters of the "compare_with" option (e.g. [{'memory_limit_Mbytes': 1}]), and checks that all results are identical.
+With {'in_memory': True}, the input files are read into arrays and the indice is computed by icclim.indice_from_arrays.
+With the "packed_int16" option (scale_factor, add_offset), all runs read int16 packed copies of the input files, in which some values
+are missing"""
+
+parser = ArgumentParser(description=description)
+parser.add_argument("-t", "--test-config",
+                    dest="testfiles",
+                    type=str,
+                    nargs='+',
+                    help="Test file or directory with the test cases in Python config format")
+parser.add_argument("-i", "--input",
+                    dest="input_test_data_dir",
+                    type=str,
+                    nargs='?',
+                    default="None",
+                    required=False,
+                    help="Folder for input test data files")
+parser.add_argument("-o", "--output",
+                    dest="test_output_dir",
+                    type=str,
+                    nargs='?',
+                    default="None",
+                    required=False,
+                    help="Output folder for test cases")
+args = parser.parse_args()
+
+
+def read_variables(out_file):
+    '''
+    Returns the variables of an output file: OrderedDict {variable name: numpy.ma.MaskedArray}.
+    '''
+    variables = OrderedDict()
+    nc = netCDF4.Dataset(out_file)
+    for v in nc.variables:
+        variables[v] = numpy.ma.masked_array(nc.variables[v][:])
+    nc.close()
+    return variables
+
+
+def write_packed_copy(in_file, var_name, out_file, scale_factor, add_offset):
+    '''
+    Writes a copy of an input file where the variable ``var_name`` is packed into int16 values with ``scale_factor`` and ``add_offset``.
+    Values of one pixel and one value out of 97 are missing (fill value).
+    '''
+    inc = netCDF4.Dataset(in_file)
+    onc = netCDF4.Dataset(out_file, 'w', format='NETCDF4_CLASSIC')
+    for dim in inc.dimensions:
+        onc.createDimension(dim, None if inc.dimensions[dim].isunlimited() else len(inc.dimensions[dim]))
+    for (name, var) in inc.variables.items():
+        if name == var_name:
+            out_var = onc.createVariable(name, 'i2', var.dimensions, fill_value=numpy.int16(-32767))
+            out_var.setncatts(dict([(att, var.getncattr(att)) for att in var.ncattrs() if att not in ['_FillValue', 'missing_value']]))
+            out_var.scale_factor = numpy.float32(scale_factor)
+            out_var.add_offset = numpy.float32(add_offset)
+            packed = numpy.ma.round((var[:] - add_offset) / scale_factor)
+            mask = numpy.ma.getmaskarray(packed).copy()
+            mask[:, 0, 0] = True
+            mask.ravel()[::97] = True
+            out_var.set_auto_maskandscale(False)
+            out_var[:] = numpy.where(mask, -32767, numpy.ma.getdata(packed)).astype('i2')
+        else:
+            out_var = onc.createVariable(name, var.dtype, var.dimensions)
+            out_var.setncatts(dict([(att, var.getncattr(att)) for att in var.ncattrs()]))
+            out_var[:] = var[:]
+    onc.close()
+    inc.close()
+
+
+def read_arrays(in_files, var_name):
+    '''
+    Reads input files into the arguments of icclim.indice_from_arrays: arrays, time values (in the units of the first file),
+    time units, calendar, fill value, lat, lon and units of variables.
+    '''
+    in_files_list = in_files if type(var_name) is list else [in_files]
+    var_name_list = var_name if type(var_name) is list else [var_name]
+
+    arrays = []
+    var_units = []
+    for (files, v) in zip(in_files_list, var_name_list):
+        values = []
+        time_values = []
+        for in_file in files:
+            nc = netCDF4.Dataset(in_file)
+            if len(values) == 0:
+                time_units = nc.variables['time'].units
+                calendar = getattr(nc.variables['time'], 'calendar', 'gregorian')
+                fill_value = getattr(nc.variables[v], '_FillValue', 1e20)
+                lat = nc.variables['lat'][:] if 'lat' in nc.variables else None
+                lon = nc.variables['lon'][:] if 'lon' in nc.variables else None
+                var_units.append(getattr(nc.variables[v], 'units', None))
+            dates = netCDF4.num2date(nc.variables['time'][:], nc.variables['time'].units, calendar)
+            time_values.append(netCDF4.date2num(dates, time_units, calendar))
+            values.append(nc.variables[v][:])
+            nc.close()
+        arrays.append(numpy.ma.concatenate(values))
+        time_values = numpy.concatenate(time_values)
+
+    if type(var_name) is not list:
+        (arrays, var_units) = (arrays[0], var_units[0])
+    return (arrays, time_values, time_units, calendar, fill_value, lat, lon, var_units)
+
+
+def get_differences(variables1, variables2):
+    '''
+    Returns the variables whose shapes, values or masks differ between two results.
+    '''
+    differences = []
+    for v in variables1:
+        if v not in variables2:
+            differences.append(v + " (missing)")
+            continue
+        arr1 = variables1[v]
+        arr2 = variables2[v]
+        if not (arr1.shape == arr2.shape and
+                numpy.array_equal(numpy.ma.getdata(arr1), numpy.ma.getdata(arr2)) and
+                numpy.array_equal(numpy.ma.getmaskarray(arr1), numpy.ma.getmaskarray(arr2))):
+            differences.append(v)
+    return differences
+
+
+nb_failed = 0
+
+for files in args.testfiles:
+    if os.path.isfile(files):
+        files = [files]
+    # Expand files if test dir given
+    elif os.path.isdir(files):
+        files = [os.path.join(files, file) for file in sorted(os.listdir(files))]
+    else:
+        raise ValueError('files is unexpected value: %s' % files)
+
+    for file in files:
+        Config = ConfigParser.ConfigParser()
+        Config.optionxform = str # options are parameters of icclim.indice (e.g. memory_limit_Mbytes)
+        Config.read(file)
+        sections = [sec for sec in Config.sections() if sec != "input_output"]
+
+        # Use config file settings for input if not given on cmd-line
+        input_test_data_dir = get_cfg(args,
+                                      Config,
+                                      req_section="input_output",
+                                      req_option="input_test_data_dir")
+
+        test_output_dir = get_cfg(args,
+                                  Config,
+                                  req_section="input_output",
+                                  req_option="test_output_dir")
+
+        # Create output folder
+        if not os.path.exists(args.test_output_dir):
+            os.mkdir(args.test_output_dir)
+
+        # Loop sections in test config file
+        for section in sections:
+            logging.info("======> " + section)
+
+            section_dict = ConfigSectionMap(Config, section)
+            section_dict = get_input_file_path(section_dict, input_test_data_dir)
+            section_dict = get_varnames_from_filenames(section_dict)
+            section_dict = get_time_ranges(section_dict)
+            for key in ['slice_mode', 'threshold', 'user_indice', 'ignore_Feb29th', 'only_leap_years', 'window_width']:
+                section_dict = try_literal_interpretation(section_dict, key)
+            compare_with = ast.literal_eval(section_dict.pop('compare_with'))
+
+            if 'packed_int16' in section_dict:
+                (scale_factor, add_offset) = ast.literal_eval(section_dict.pop('packed_int16'))
+                packed_files = []
+                for in_file in section_dict['in_files']:
+                    packed_files.append(os.path.join(test_output_dir, "_".join([section, os.path.basename(in_file)])))
+                    write_packed_copy(in_file, section_dict['var_name'], packed_files[-1], scale_factor, add_offset)
+                section_dict['in_files'] = packed_files
+
+            # reference run, then one run per set of parameters to compare with
+            results = []
+            for (k, params) in enumerate([{}] + compare_with):
+                run = 'reference' if k == 0 else 'compare-' + str(k)
+                run_dict = dict(section_dict)
+                run_dict.update(params)
+                logging.info("Run %s: %s", run, params)
+                if run_dict.pop('in_memory', False):
+                    # same values, read into arrays
+                    in_files = run_dict.pop('in_files')
+                    (arrays, time_values, time_units, calendar, fill_value, lat, lon, var_units) = read_arrays(in_files, run_dict['var_name'])
+                    variables = icclim.indice_from_arrays(arrays, time_values=time_values, time_units=time_units, calendar=calendar,
+                                                          fill_value=fill_value, lat=lat, lon=lon, var_units=var_units, **run_dict)
+                    results.append((run, params, variables))
+                else:
+                    run_dict['out_file'] = os.path.join(test_output_dir, "_".join([section, run + ".nc"]))
+                    icclim.indice(**run_dict)
+                    results.append((run, params, read_variables(run_dict['out_file'])))
+
+            (_, _, reference) = results[0]
+            for (run, params, variables) in results[1:]:
+                differences = get_differences(reference, variables)
+                if len(differences) > 0:
+                    logging.error("FAILED: %s %s differs from the reference: %s", section, params, ", ".join(differences))
+                    nb_failed += 1
+                else:
+                    logging.info("OK: %s %s is identical to the reference", section, params)
+            logging.info("<====== " + section + "\n")
+
+sys.exit(1 if nb_failed > 0 else 0)
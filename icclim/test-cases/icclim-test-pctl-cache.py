@@ -0,0 +1,134 @@
+#! /usr/bin/env python
+import ConfigParser
+import logging
+import os
+import shutil
+import sys
+import tempfile
+
+import netCDF4
+import numpy
+
+from auxiliary import *
+
+logging.basicConfig(level=logging.INFO, format='%(asctime)s %(message)s')
+
+import icclim
+import icclim.util.pctl_cache as pctl_cache
+
+from argparse import ArgumentParser
+
+# Check command arguments.
+description = """ICCLIM-test pctl-cache.py
+Runs the test cases of percentile-based indices (Python config files, see icclim-test-wrapper.py) without the percentile
+thresholds cache, with an empty cache and with the filled cache, and checks that the three results are identical"""
+
+parser = ArgumentParser(description=description)
+parser.add_argument("-t", "--test-config",
+                    dest="testfiles",
+                    type=str,
+                    nargs='+',
+                    help="Test file or directory with the test cases in Python config format")
+parser.add_argument("-i", "--input",
+                    dest="input_test_data_dir",
+                    type=str,
+                    nargs='?',
+                    default="None",
+                    required=False,
+                    help="Folder for input test data files")
+parser.add_argument("-o", "--output",
+                    dest="test_output_dir",
+                    type=str,
+                    nargs='?',
+                    default="None",
+                    required=False,
+                    help="Output folder for test cases")
+args = parser.parse_args()
+
+
+def get_differences(file1, file2):
+    '''
+    Returns the variables whose values or masks differ between two output files.
+    '''
+    differences = []
+    nc1 = netCDF4.Dataset(file1)
+    nc2 = netCDF4.Dataset(file2)
+    for v in nc1.variables:
+        arr1 = nc1.variables[v][:]
+        arr2 = nc2.variables[v][:]
+        if not (numpy.array_equal(numpy.ma.getdata(arr1), numpy.ma.getdata(arr2)) and
+                numpy.array_equal(numpy.ma.getmaskarray(arr1), numpy.ma.getmaskarray(arr2))):
+            differences.append(v)
+    nc1.close()
+    nc2.close()
+    return differences
+
+
+nb_failed = 0
+
+for files in args.testfiles:
+    if os.path.isfile(files):
+        files = [files]
+    # Expand files if test dir given
+    elif os.path.isdir(files):
+        files = [os.path.join(files, file) for file in sorted(os.listdir(files))]
+    else:
+        raise ValueError('files is unexpected value: %s' % files)
+
+    for file in files:
+        Config = ConfigParser.ConfigParser()
+        Config.optionxform = str # options are parameters of icclim.indice (e.g. ignore_Feb29th)
+        Config.read(file)
+        sections = [sec for sec in Config.sections() if sec != "input_output"]
+
+        # Use config file settings for input if not given on cmd-line
+        input_test_data_dir = get_cfg(args,
+                                      Config,
+                                      req_section="input_output",
+                                      req_option="input_test_data_dir")
+
+        test_output_dir = get_cfg(args,
+                                  Config,
+                                  req_section="input_output",
+                                  req_option="test_output_dir")
+
+        # Create output folder
+        if not os.path.exists(args.test_output_dir):
+            os.mkdir(args.test_output_dir)
+
+        # Loop sections in test config file
+        for section in sections:
+            logging.info("======> " + section)
+
+            section_dict = ConfigSectionMap(Config, section)
+            section_dict = get_input_file_path(section_dict, input_test_data_dir)
+            section_dict = get_varnames_from_filenames(section_dict)
+            section_dict = get_time_ranges(section_dict)
+            section_dict = try_literal_interpretation(section_dict, 'slice_mode')
+            section_dict = try_literal_interpretation(section_dict, 'ignore_Feb29th')
+            section_dict = try_literal_interpretation(section_dict, 'only_leap_years')
+            section_dict = try_literal_interpretation(section_dict, 'window_width')
+
+            # the same indice: without cache, with an empty cache (thresholds computed), with the filled cache (thresholds read)
+            cache_dir = tempfile.mkdtemp(prefix='icclim_pctl_cache_')
+            out_files = []
+            try:
+                for (run, run_cache_dir) in [('no_cache', ''), ('cold_cache', cache_dir), ('warm_cache', cache_dir)]:
+                    section_dict['out_file'] = os.path.join(test_output_dir, "_".join([section, run + ".nc"]))
+                    pctl_cache.CACHE_DIR = run_cache_dir
+                    icclim.indice(**section_dict)
+                    out_files.append(section_dict['out_file'])
+            finally:
+                pctl_cache.CACHE_DIR = os.environ.get('ICCLIM_PCTL_CACHE_DIR', '')
+                shutil.rmtree(cache_dir)
+
+            for out_file in out_files[1:]:
+                differences = get_differences(out_files[0], out_file)
+                if len(differences) > 0:
+                    logging.error("FAILED: %s differs from %s: %s", out_file, out_files[0], ", ".join(differences))
+                    nb_failed += 1
+                else:
+                    logging.info("OK: %s is identical to %s", out_file, out_files[0])
+            logging.info("<====== " + section + "\n")
+
+sys.exit(1 if nb_failed > 0 else 0)
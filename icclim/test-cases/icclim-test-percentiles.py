@@ -0,0 +1,177 @@
+#! /usr/bin/env python
+import ConfigParser
+import ctypes
+import logging
+import math
+import os
+import sys
+
+import numpy
+from numpy.ctypeslib import ndpointer
+import netcdftime
+
+from auxiliary import *
+
+logging.basicConfig(level=logging.INFO, format='%(asctime)s %(message)s')
+
+import icclim.calc_percentiles as calc_percentiles
+
+from argparse import ArgumentParser
+
+# Check command arguments.
+description = """ICCLIM-test percentiles.py
+Runs the test cases of the percentile kernels (Python config files describing a synthetic base period): for each window of
+calendar days, the percentiles of the sliding windows (libC.c: percentiles_windows_3d) and of each window computed separately
+(libC.c: percentiles_3d) must be the same as percentiles read from the sorted values, as well as the daily percentile
+thresholds of calc_percentiles.get_percentile_dict"""
+
+parser = ArgumentParser(description=description)
+parser.add_argument("-t", "--test-config",
+                    dest="testfiles",
+                    type=str,
+                    nargs='+',
+                    help="Test file or directory with the test cases in Python config format")
+args = parser.parse_args()
+
+
+FILL_VALUE = numpy.float32(1e20)
+
+T_UNITS = 'days since 1950-01-01'
+
+
+def get_base(nb_years, shape, calendar, missing_rate, decimals):
+    '''
+    Returns the dates and the values of a synthetic base period.
+    Values are rounded to ``decimals`` (many equal values), values of pixel (0, 0) are all missing
+    and values of pixel (0, 1) are all missing but one.
+    '''
+    t = netcdftime.utime(T_UNITS, calendar)
+    nums = numpy.arange(t.date2num(netcdftime.datetime(1961, 1, 1, 12)), t.date2num(netcdftime.datetime(1961 + nb_years - 1, 12, 30, 12)) + 1)
+    dt_arr = numpy.array(t.num2date(nums))
+    values = numpy.round(numpy.random.RandomState(0).normal(15., 8., (len(dt_arr),) + shape), decimals).astype('float32')
+    mask = numpy.random.RandomState(1).rand(*values.shape) < missing_rate
+    mask[:, 0, 0] = True
+    mask[:, 0, 1] = True
+    mask[len(dt_arr) // 2, 0, 1] = False
+    return (dt_arr, numpy.ma.array(values, mask=mask, fill_value=FILL_VALUE))
+
+
+def get_reference_percentile(values, percentile, interpolation):
+    '''
+    Returns the percentile of the values which are not fill values, read from the sorted values
+    (same formulas and same float precision as libC.c get_percentile and get_percentile2).
+    '''
+    a = numpy.sort(values[values != FILL_VALUE])
+    n = len(a)
+    if n == 0:
+        return float(FILL_VALUE)
+    if n == 1:
+        return float(a[0])
+
+    p = percentile * 0.01
+    if interpolation == 'linear':
+        index = p * (n - 1)
+        i = int(math.floor(index))
+        if i + 1 > n - 1:
+            return float(a[n-1])
+        return (index - i) * float(a[i+1] - a[i]) + float(a[i])
+    else:
+        index = n * p + (1 + p) / 3.
+        i = int(math.floor(index))
+        if i < 1:
+            return float(a[0])
+        if i > n - 1:
+            return float(a[n-1])
+        return float(a[i-1]) + (index - i) * float(a[i] - a[i-1])
+
+
+def get_kernel_percentiles(arr_filled, windows, percentiles, interpolation):
+    '''
+    Returns the percentiles of the windows: sliding (percentiles_windows_3d) and computed separately (percentiles_3d).
+
+    :rtype: tuple of 2 numpy.ndarray (4D: window, percentile, row, col)
+    '''
+    C_percentile = calc_percentiles.libraryC.percentiles_3d
+    C_percentile.restype = None
+    C_percentile.argtypes = [ndpointer(ctypes.c_float), ctypes.c_int, ctypes.c_int, ctypes.c_int,
+                             ndpointer(ctypes.c_double), ctypes.c_int, ndpointer(ctypes.c_int), ctypes.c_float, ctypes.c_char_p]
+    C_percentile_windows = calc_percentiles.libraryC.percentiles_windows_3d
+    C_percentile_windows.restype = None
+    C_percentile_windows.argtypes = C_percentile.argtypes + [ctypes.c_int] + [ndpointer(ctypes.c_int)] * 4
+
+    C_percentiles = calc_percentiles.get_percentiles(percentiles)
+    (nrow, ncol) = arr_filled.shape[1:]
+
+    sliding = numpy.zeros((len(windows), len(percentiles), nrow, ncol))
+    C_percentile_windows(arr_filled, arr_filled.shape[0], nrow, ncol, sliding, len(percentiles), C_percentiles, FILL_VALUE, interpolation,
+                         len(windows), *calc_percentiles.get_window_changes(windows))
+
+    per_window = numpy.zeros((len(windows), len(percentiles), nrow, ncol))
+    for (k, window) in enumerate(windows):
+        arr_subset = arr_filled[window]
+        C_percentile(arr_subset, arr_subset.shape[0], nrow, ncol, per_window[k], len(percentiles), C_percentiles, FILL_VALUE, interpolation)
+
+    return (sliding, per_window)
+
+
+nb_failed = 0
+
+for files in args.testfiles:
+    if os.path.isfile(files):
+        files = [files]
+    # Expand files if test dir given
+    elif os.path.isdir(files):
+        files = [os.path.join(files, file) for file in sorted(os.listdir(files))]
+    else:
+        raise ValueError('files is unexpected value: %s' % files)
+
+    for file in files:
+        Config = ConfigParser.ConfigParser()
+        Config.optionxform = str # options are parameters of calc_percentiles.get_percentile_dict (e.g. ignore_Feb29th)
+        Config.read(file)
+
+        # Loop sections in test config file
+        for section in Config.sections():
+            logging.info("======> " + section)
+
+            section_dict = ConfigSectionMap(Config, section)
+            for key in ['nb_years', 'shape', 'missing_rate', 'decimals', 'window_width', 'percentiles', 'ignore_Feb29th']:
+                section_dict = try_literal_interpretation(section_dict, key)
+
+            calendar = section_dict['calendar']
+            window_width = section_dict['window_width']
+            percentiles = section_dict['percentiles']
+            interpolation = section_dict['interpolation']
+            ignore_Feb29th = section_dict.get('ignore_Feb29th', False)
+
+            (dt_arr, arr) = get_base(section_dict['nb_years'], section_dict['shape'], calendar, section_dict['missing_rate'], section_dict['decimals'])
+            arr_filled = arr.filled(FILL_VALUE)
+
+            window_table = calc_percentiles.get_window_table(dt_arr, window_width, False, calendar, T_UNITS, ignore_Feb29th=ignore_Feb29th)
+            caldays = window_table.keys()
+            windows = window_table.values()
+
+            reference = numpy.zeros((len(windows), len(percentiles)) + arr.shape[1:])
+            for (k, window) in enumerate(windows):
+                for (p, percentile) in enumerate(percentiles):
+                    for (i, j) in numpy.ndindex(*arr.shape[1:]):
+                        reference[k, p, i, j] = get_reference_percentile(arr_filled[window, i, j], percentile, interpolation)
+
+            (sliding, per_window) = get_kernel_percentiles(arr_filled, windows, percentiles, interpolation)
+
+            percentile_dicts = calc_percentiles.get_percentile_dict(arr, dt_arr, percentiles, window_width, calendar, T_UNITS,
+                                                                    interpolation=interpolation, ignore_Feb29th=ignore_Feb29th)
+            from_dicts = numpy.array([[numpy.ma.getdata(percentile_dicts[p][calday]) for p in range(len(percentiles))] for calday in caldays])
+
+            for (name, result) in [('sliding windows', sliding), ('each window', per_window), ('get_percentile_dict', from_dicts)]:
+                differences = numpy.argwhere(result != reference)
+                if len(differences) > 0:
+                    (k, p, i, j) = differences[0]
+                    logging.error("FAILED: %s %s: %d value(s) differ from the sorted values, e.g. calendar day %s, percentile %s, pixel (%d, %d): %r instead of %r",
+                                  section, name, len(differences), caldays[k], percentiles[p], i, j, result[k, p, i, j], reference[k, p, i, j])
+                    nb_failed += 1
+                else:
+                    logging.info("OK: %s %s: same values as the sorted values", section, name)
+            logging.info("<====== " + section + "\n")
+
+sys.exit(1 if nb_failed > 0 else 0)
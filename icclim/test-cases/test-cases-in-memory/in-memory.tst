@@ -0,0 +1,22 @@
+[SU-in-memory]  # SU index: same values given as arrays (icclim.indice_from_arrays)
+indice_name: SU
+in_files: ['tasmax_day_MPI-ESM-LR_historical_r1i1p1_19900101-19991231.nc']
+slice_mode: year
+compare_with: [{'in_memory': True}, {'in_memory': True, 'transfer_limit_Mbytes': 10}]
+
+[TX90p-in-memory]  # TX90p index: base period and bootstrapping
+indice_name: TX90p
+in_files: ['tasmax_day_MPI-ESM-LR_historical_r1i1p1_19900101-19991231.nc']
+base_dt1: 1991-01-01
+base_dt2: 1995-12-31
+dt1: 1993-01-01
+dt2: 1999-12-31
+slice_mode: year
+ignore_Feb29th: True
+compare_with: [{'in_memory': True}]
+
+[DTR-in-memory]  # DTR index: multivariable
+indice_name: DTR
+in_files: [['tasmax_day_MPI-ESM-LR_historical_r1i1p1_19900101-19991231.nc'], ['tasmin_day_MPI-ESM-LR_historical_r1i1p1_19900101-19991231.nc']]
+slice_mode: month
+compare_with: [{'in_memory': True}]
@@ -0,0 +1,28 @@
+[SU-memory-limit]  # SU index: chunks computed from the memory limit
+indice_name: SU
+in_files: ['tasmax_day_MPI-ESM-LR_historical_r1i1p1_19900101-19991231.nc']
+slice_mode: year
+compare_with: [{'memory_limit_Mbytes': 20}, {'memory_limit_Mbytes': 20, 'transfer_limit_Mbytes': 10}]
+
+[TX90p-memory-limit]  # TX90p index: base period and bootstrapping
+indice_name: TX90p
+in_files: ['tasmax_day_MPI-ESM-LR_historical_r1i1p1_19900101-19991231.nc']
+base_dt1: 1991-01-01
+base_dt2: 1995-12-31
+dt1: 1993-01-01
+dt2: 1999-12-31
+slice_mode: year
+ignore_Feb29th: True
+compare_with: [{'memory_limit_Mbytes': 50}]
+
+[user-max-date-event-memory-limit]  # user index with dates of events
+user_indice: {'indice_name': 'my_indice', 'calc_operation': 'max', 'date_event': True}
+in_files: ['tasmax_day_MPI-ESM-LR_historical_r1i1p1_19900101-19991231.nc']
+slice_mode: year
+compare_with: [{'memory_limit_Mbytes': 20}]
+
+[user-consecutive-date-event-memory-limit]  # user index with dates of the start and end of events
+user_indice: {'indice_name': 'my_indice', 'calc_operation': 'max_nb_consecutive_events', 'logical_operation': 'lt', 'thresh': 1.0, 'coef': 86400.0, 'date_event': True}
+in_files: ['pr_day_CNRM-CM5_historical_r1i1p1_19900101-19941231.nc','pr_day_CNRM-CM5_historical_r1i1p1_19950101-19991231.nc','pr_day_CNRM-CM5_historical_r1i1p1_20000101-20041231.nc']
+slice_mode: year
+compare_with: [{'memory_limit_Mbytes': 20}]
@@ -0,0 +1,47 @@
+# int16 packed copies of the input files (packed_int16: scale_factor, add_offset), with missing values:
+# indices computed on packed values (packed_values: True) must be the same as indices computed on unpacked values.
+# Thresholds fall exactly on packed steps (25 degC = 273.15 + 2500*0.01 K, 1 mm/day = 10 steps of 0.1 mm/day: 1/864000 kg m-2 s-1)
+# and between them.
+
+[SU-packed-values]  # SU index: thresholds on and between packed steps
+indice_name: SU
+in_files: ['tasmax_day_MPI-ESM-LR_historical_r1i1p1_19900101-19991231.nc']
+packed_int16: (0.01, 273.15)
+slice_mode: year
+threshold: [20, 25, 25.005, 29.999]
+compare_with: [{'packed_values': True}, {'packed_values': True, 'transfer_limit_Mbytes': 10}]
+
+[CDD-packed-values]  # CDD index: threshold (1 mm/day) on a packed step of precipitation (converted to mm/day)
+indice_name: CDD
+in_files: ['pr_day_CNRM-CM5_historical_r1i1p1_19900101-19941231.nc','pr_day_CNRM-CM5_historical_r1i1p1_19950101-19991231.nc','pr_day_CNRM-CM5_historical_r1i1p1_20000101-20041231.nc']
+packed_int16: (1.1574074074074074e-06, 0.0)
+slice_mode: year
+compare_with: [{'packed_values': True}]
+
+[user-max-consecutive-packed-values-on-step]  # user index: maximum number of consecutive days above a threshold on a packed step
+user_indice: {'indice_name': 'my_indice', 'calc_operation': 'max_nb_consecutive_events', 'logical_operation': 'gt', 'thresh': 298.15, 'date_event': True}
+in_files: ['tasmax_day_MPI-ESM-LR_historical_r1i1p1_19900101-19991231.nc']
+packed_int16: (0.01, 273.15)
+slice_mode: year
+compare_with: [{'packed_values': True}]
+
+[user-max-consecutive-packed-values-between-steps]  # user index: maximum number of consecutive days at or below a threshold between packed steps
+user_indice: {'indice_name': 'my_indice', 'calc_operation': 'max_nb_consecutive_events', 'logical_operation': 'let', 'thresh': 285.005}
+in_files: ['tasmax_day_MPI-ESM-LR_historical_r1i1p1_19900101-19991231.nc']
+packed_int16: (0.01, 273.15)
+slice_mode: year
+compare_with: [{'packed_values': True}]
+
+[user-max-consecutive-packed-values-coef]  # user index: CDD with a threshold between packed steps (values multiplied by coef)
+user_indice: {'indice_name': 'my_indice', 'calc_operation': 'max_nb_consecutive_events', 'logical_operation': 'lt', 'thresh': 1.05, 'coef': 86400.0, 'date_event': True}
+in_files: ['pr_day_CNRM-CM5_historical_r1i1p1_19900101-19941231.nc','pr_day_CNRM-CM5_historical_r1i1p1_19950101-19991231.nc','pr_day_CNRM-CM5_historical_r1i1p1_20000101-20041231.nc']
+packed_int16: (1.1574074074074074e-06, 0.0)
+slice_mode: year
+compare_with: [{'packed_values': True}]
+
+[user-nb-events-packed-values-coef]  # user index: number of days with precipitation of at least 1 mm/day (values multiplied by coef)
+user_indice: {'indice_name': 'my_indice', 'calc_operation': 'nb_events', 'logical_operation': 'get', 'thresh': 1.0, 'coef': 86400.0}
+in_files: ['pr_day_CNRM-CM5_historical_r1i1p1_19900101-19941231.nc','pr_day_CNRM-CM5_historical_r1i1p1_19950101-19991231.nc','pr_day_CNRM-CM5_historical_r1i1p1_20000101-20041231.nc']
+packed_int16: (1.1574074074074074e-06, 0.0)
+slice_mode: year
+compare_with: [{'packed_values': True}]
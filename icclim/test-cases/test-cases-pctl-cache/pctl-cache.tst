@@ -0,0 +1,18 @@
+[TX90p-pctl-cache]  # TX90p index: out-of-base and in-base (bootstrapping) thresholds
+indice_name: TX90p
+in_files: ['tasmax_day_MPI-ESM-LR_historical_r1i1p1_19900101-19991231.nc']
+base_dt1: 1991-01-01
+base_dt2: 1995-12-31
+dt1: 1993-01-01
+dt2: 1999-12-31
+slice_mode: year
+ignore_Feb29th: True
+
+[R95p-pctl-cache]  # R95p index: thresholds of wet days
+indice_name: R95p
+in_files: ['pr_day_CNRM-CM5_historical_r1i1p1_19900101-19941231.nc','pr_day_CNRM-CM5_historical_r1i1p1_19950101-19991231.nc','pr_day_CNRM-CM5_historical_r1i1p1_20000101-20041231.nc']
+base_dt1: 1991-01-01
+base_dt2: 1995-12-31
+dt1: 1996-01-01
+dt2: 2004-12-31
+slice_mode: year
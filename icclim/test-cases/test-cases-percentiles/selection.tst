@@ -0,0 +1,43 @@
+# Synthetic base periods (nb_years, shape: rows and columns, missing_rate, values rounded to decimals):
+# percentiles selected by the C kernels (libC.c: select_kth, percentiles_1d) and by calc_percentiles.get_percentile_dict
+# must be the same as percentiles read from the sorted values, for extreme percentiles (0, 100), ties and missing values.
+
+[percentiles-window-5-hyndman-fan]
+nb_years: 10
+shape: (4, 5)
+missing_rate: 0.05
+decimals: 1
+calendar: gregorian
+window_width: 5
+percentiles: [0, 1, 10, 50, 90, 95, 99, 100]
+interpolation: hyndman_fan
+
+[percentiles-window-5-linear]
+nb_years: 10
+shape: (4, 5)
+missing_rate: 0.05
+decimals: 1
+calendar: gregorian
+window_width: 5
+percentiles: [0, 1, 10, 50, 90, 95, 99, 100]
+interpolation: linear
+
+[percentiles-window-31-hyndman-fan-missing]  # many missing values
+nb_years: 5
+shape: (3, 4)
+missing_rate: 0.5
+decimals: 2
+calendar: gregorian
+window_width: 31
+percentiles: [1, 10, 90, 99]
+interpolation: hyndman_fan
+
+[percentiles-window-5-linear-ties]  # many equal values, percentiles not in increasing order
+nb_years: 10
+shape: (4, 5)
+missing_rate: 0.05
+decimals: 0
+calendar: gregorian
+window_width: 5
+percentiles: [100, 50, 0, 99, 1]
+interpolation: linear
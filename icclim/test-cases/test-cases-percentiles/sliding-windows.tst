@@ -0,0 +1,55 @@
+# Synthetic base periods (nb_years, shape: rows and columns, missing_rate, values rounded to decimals):
+# percentiles of windows of consecutive calendar days computed by the C kernels (libC.c) and by calc_percentiles.get_percentile_dict
+# must be the same as percentiles read from the sorted values of each window.
+# Windows narrower than calc_percentiles.SLIDING_WINDOW_MIN_WIDTH are computed separately by get_percentile_dict, wider ones are sliding.
+
+[percentiles-window-15-hyndman-fan-ties]  # many equal values
+nb_years: 10
+shape: (4, 5)
+missing_rate: 0.05
+decimals: 0
+calendar: gregorian
+window_width: 15
+percentiles: [90, 10, 50]
+interpolation: hyndman_fan
+
+[percentiles-window-15-linear-ties]  # many equal values
+nb_years: 10
+shape: (4, 5)
+missing_rate: 0.05
+decimals: 0
+calendar: gregorian
+window_width: 15
+percentiles: [0, 10, 25, 50, 75, 90, 100]
+interpolation: linear
+
+[percentiles-window-11-360-day]
+nb_years: 6
+shape: (3, 4)
+missing_rate: 0.01
+decimals: 1
+calendar: 360_day
+window_width: 11
+percentiles: [10, 90]
+interpolation: hyndman_fan
+
+[percentiles-window-21-noleap-linear]
+nb_years: 6
+shape: (3, 4)
+missing_rate: 0.01
+decimals: 1
+calendar: noleap
+window_width: 21
+percentiles: [5, 95]
+interpolation: linear
+
+[percentiles-window-11-ignore-Feb29th]
+nb_years: 8
+shape: (3, 4)
+missing_rate: 0.01
+decimals: 1
+calendar: gregorian
+window_width: 11
+percentiles: [10, 90]
+interpolation: hyndman_fan
+ignore_Feb29th: True
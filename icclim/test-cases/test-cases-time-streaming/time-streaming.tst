@@ -0,0 +1,37 @@
+[SU-time-streaming-year]  # SU index: values read one year at a time
+indice_name: SU
+in_files: ['tasmax_day_MPI-ESM-LR_historical_r1i1p1_19900101-19991231.nc']
+slice_mode: year
+compare_with: [{'time_streaming': True}, {'time_streaming': True, 'transfer_limit_Mbytes': 10}]
+
+[SU-time-streaming-DJF]  # SU index: winters across years (December of the previous year)
+indice_name: SU
+in_files: ['tasmax_day_MPI-ESM-LR_historical_r1i1p1_19900101-19991231.nc']
+slice_mode: DJF
+compare_with: [{'time_streaming': True}]
+
+[SU-time-streaming-month]  # SU index: values read one month at a time
+indice_name: SU
+in_files: ['tasmax_day_MPI-ESM-LR_historical_r1i1p1_19900101-19991231.nc']
+dt1: 1993-01-01
+dt2: 1996-12-31
+slice_mode: month
+compare_with: [{'time_streaming': True}]
+
+[CDD-time-streaming-DJF]  # CDD index: spells of a winter across years
+indice_name: CDD
+in_files: ['pr_day_CNRM-CM5_historical_r1i1p1_19900101-19941231.nc','pr_day_CNRM-CM5_historical_r1i1p1_19950101-19991231.nc','pr_day_CNRM-CM5_historical_r1i1p1_20000101-20041231.nc']
+slice_mode: DJF
+compare_with: [{'time_streaming': True}]
+
+[DTR-time-streaming-year]  # DTR index: multivariable
+indice_name: DTR
+in_files: [['tasmax_day_MPI-ESM-LR_historical_r1i1p1_19900101-19991231.nc'], ['tasmin_day_MPI-ESM-LR_historical_r1i1p1_19900101-19991231.nc']]
+slice_mode: year
+compare_with: [{'time_streaming': True}]
+
+[user-max-date-event-time-streaming-DJF]  # user index with dates of events
+user_indice: {'indice_name': 'my_indice', 'calc_operation': 'max', 'date_event': True}
+in_files: ['tasmax_day_MPI-ESM-LR_historical_r1i1p1_19900101-19991231.nc']
+slice_mode: DJF
+compare_with: [{'time_streaming': True}]
@@ -106,7 +106,7 @@ def get_map_info_slice(slice_mode):
 
             
 
-def get_dict_temporal_slices(dt_arr, values_arr, fill_value, calend='gregorian', temporal_subset_mode=None, time_range=None):
+def get_dict_temporal_slices(dt_arr, values_arr, fill_value, calend='gregorian', temporal_subset_mode=None, time_range=None, dict_slices_indices=None):
     
     '''
     
@@ -125,6 +125,9 @@ def get_dict_temporal_slices(dt_arr, values_arr, fill_value, calend='gregorian',
     :param time_range: Time range.
     :type time_range: [datetime.datetime, datetime.datetime]
     
+    :param dict_slices_indices: Time steps of each slice, if already computed for ``dt_arr`` (see get_dict_temporal_slices_indices).
+    :type dict_slices_indices: dict
+    
     :rtype: dict, where key is (``temporal_subset_mode``, year) and values are grouped in a tuple with 5 elements: (dt_centroid, dt_bounds, dt_arr, values_arr, fill_value).
     
     .. note:: To view all keys of the returned dict:
@@ -205,9 +208,6 @@ def get_dict_temporal_slices(dt_arr, values_arr, fill_value, calend='gregorian',
 
     '''
     
-    seconds_per_day = 86400.0
-    tunits = "seconds since 1600-01-01 00:00:00"
-
     if type(values_arr)==list: # case of anomalies
         values_arr=values_arr[0]
         
@@ -217,6 +217,44 @@ def get_dict_temporal_slices(dt_arr, values_arr, fill_value, calend='gregorian',
     
     return_dict = OrderedDict()
     
+    if dict_slices_indices is None:
+        dict_slices_indices = get_dict_temporal_slices_indices(dt_arr, calend=calend, temporal_subset_mode=temporal_subset_mode, time_range=time_range)
+    
+    for key, (dt_centroid, dt_bounds, indices) in dict_slices_indices.items():
+        if indices is None: # whole selected time range
+            return_dict[key] = (dt_centroid, dt_bounds, dt_arr, values_arr, fill_value)
+        else:
+            return_dict[key] = (dt_centroid, dt_bounds, dt_arr[indices], values_arr[indices, :, :], fill_value)
+
+    return return_dict
+
+
+def get_dict_temporal_slices_indices(dt_arr, calend='gregorian', temporal_subset_mode=None, time_range=None):
+    
+    '''
+    
+    This function returns a dictionary with the time steps of each temporal slice (see get_dict_temporal_slices), without any values.
+    
+    
+    :param dt_arr: Datetime vector.
+    :type dt_arr: numpy.ndarray (1D) of datetime.datetime objects
+    
+    :param temporal_subset_mode: Type of temporal aggregation: the same set of possible values as ``slice_mode``.
+    :type temporal_subset_mode: str 
+    
+    :param time_range: Time range.
+    :type time_range: [datetime.datetime, datetime.datetime]
+    
+    :rtype: dict, where key is the same as in get_dict_temporal_slices and values are grouped in a tuple with 3 elements: (dt_centroid, dt_bounds, indices),
+            where ``indices`` are the indices of the slice in ``dt_arr`` (None if the whole ``dt_arr`` is one slice, i.e. ``temporal_subset_mode`` is None).
+    
+    '''
+    
+    seconds_per_day = 86400.0
+    tunits = "seconds since 1600-01-01 00:00:00"
+    
+    return_dict = OrderedDict()
+    
     if temporal_subset_mode != None:
         map_info_slice=get_map_info_slice(slice_mode=temporal_subset_mode)
     ###########################
@@ -264,7 +302,7 @@ def get_dict_temporal_slices(dt_arr, values_arr, fill_value, calend='gregorian',
         dt_centroid_second = first_second + (last_second - first_second) / 2.
         dt_centroid = cdftime.num2date(dt_centroid_second)
         dt_bounds = time_range
-        return_dict['whole_time_range', time_range[0].year, time_range[1].year] = (dt_centroid, dt_bounds, dt_arr, values_arr, fill_value)
+        return_dict['whole_time_range', time_range[0].year, time_range[1].year] = (dt_centroid, dt_bounds, None)
     
     
     # all or selected months of each year will be processed 
@@ -275,14 +313,13 @@ def get_dict_temporal_slices(dt_arr, values_arr, fill_value, calend='gregorian',
             
                 indices_dt_arr_non_masked_i = get_indices_temp_aggregation(dt_arr, month=m, year=y, f=0)
                 dt_arr_subset_i = dt_arr[indices_dt_arr_non_masked_i]
-                arr_subset_i = values_arr[indices_dt_arr_non_masked_i, :, :]
                 
                 dt_centroid = datetime(  y, m, map_info_slice[str(temporal_subset_mode)]['centroid_day']  )
                 dtt_num_i = util_dt.date2num(dt_arr_subset_i[-1], calend, tunits) + seconds_per_day
                 dtt_i = util_dt.num2date(dtt_num_i, calend=calend, units=tunits)
                 dt_bounds = numpy.array([ dt_arr_subset_i[0], dtt_i ]) # [ bnd1, bnd2 )
                 
-                return_dict[m, y] = (dt_centroid, dt_bounds, dt_arr_subset_i, arr_subset_i, fill_value)
+                return_dict[m, y] = (dt_centroid, dt_bounds, indices_dt_arr_non_masked_i)
         
             #print y
 
@@ -293,15 +330,13 @@ def get_dict_temporal_slices(dt_arr, values_arr, fill_value, calend='gregorian',
     
             indices_dt_arr_non_masked_year = get_indices_temp_aggregation(dt_arr, month=map_info_slice[str(temporal_subset_mode)]['months'], year=y, f=1)
             dt_arr_subset_i = dt_arr[indices_dt_arr_non_masked_year]
-
-            arr_subset_i = values_arr[indices_dt_arr_non_masked_year, :, :]
             
             dt_centroid = datetime(  y, map_info_slice[str(temporal_subset_mode)]['centroid_month'], map_info_slice[str(temporal_subset_mode)]['centroid_day']  )
             dtt_num_i = util_dt.date2num(dt_arr_subset_i[-1], calend, tunits) + seconds_per_day
             dtt_i = util_dt.num2date(dtt_num_i, calend=calend, units=tunits)
             dt_bounds = numpy.array([ dt_arr_subset_i[0], dtt_i ]) # [ bnd1, bnd2 )
             
-            return_dict[str(temporal_subset_mode), y] = (dt_centroid, dt_bounds, dt_arr_subset_i, arr_subset_i, fill_value) 
+            return_dict[str(temporal_subset_mode), y] = (dt_centroid, dt_bounds, indices_dt_arr_non_masked_year) 
     
             #print y
         
@@ -321,14 +356,13 @@ def get_dict_temporal_slices(dt_arr, values_arr, fill_value, calend='gregorian',
                 indices_dt_arr_non_masked_current_season.sort()
                 
                 dt_arr_subset_i = dt_arr[indices_dt_arr_non_masked_current_season]
-                arr_subset_i = values_arr[indices_dt_arr_non_masked_current_season, :, :]
                 
                 dt_centroid = datetime(  next_year, map_info_slice[str(temporal_subset_mode)]['centroid_month'], map_info_slice[str(temporal_subset_mode)]['centroid_day']  )
                 dtt_num_i = util_dt.date2num(dt_arr_subset_i[-1], calend, tunits) + seconds_per_day
                 dtt_i = util_dt.num2date(dtt_num_i, calend=calend, units=tunits)
                 dt_bounds = numpy.array([ dt_arr_subset_i[0], dtt_i ]) # [ bnd1, bnd2 )
                 
-                return_dict[str(temporal_subset_mode), y] = (dt_centroid, dt_bounds, dt_arr_subset_i, arr_subset_i, fill_value) 
+                return_dict[str(temporal_subset_mode), y] = (dt_centroid, dt_bounds, indices_dt_arr_non_masked_current_season) 
             else:
                 pass
 
@@ -340,18 +374,64 @@ def get_dict_temporal_slices(dt_arr, values_arr, fill_value, calend='gregorian',
             indices_dt_arr_non_masked_i = get_indices_temp_aggregation(dt_arr, month=None, year=y, f=2)
             dt_arr_subset_i = dt_arr[indices_dt_arr_non_masked_i]
             
-            arr_subset_i = values_arr[indices_dt_arr_non_masked_i, :, :]
             dt_centroid = datetime(  y, map_info_slice[str(temporal_subset_mode)]['centroid_month'], map_info_slice[str(temporal_subset_mode)]['centroid_day']  )
             dtt_num_i = util_dt.date2num(dt_arr_subset_i[-1], calend, tunits) + seconds_per_day
             dtt_i = util_dt.num2date(dtt_num_i, calend=calend, units=tunits)
             dt_bounds = numpy.array([ dt_arr_subset_i[0], dtt_i ]) # [ bnd1, bnd2 )
             
-            return_dict[temporal_subset_mode, y] = (dt_centroid, dt_bounds, dt_arr_subset_i, arr_subset_i, fill_value)
+            return_dict[temporal_subset_mode, y] = (dt_centroid, dt_bounds, indices_dt_arr_non_masked_i)
         
             #print y
     
 
     return return_dict
+
+
+class StreamedTemporalSlices(object):
+    '''
+    Temporal slices (same keys and values as the dictionary returned by get_dict_temporal_slices) 
+    whose values are read only when the slice is accessed: only one slice is kept in memory at a time.
+    '''
+    
+    def __init__(self, dt_arr, dict_slices_indices, read_slice, fill_value):
+        '''
+        :param dt_arr: Datetime vector.
+        :type dt_arr: numpy.ndarray (1D) of datetime.datetime objects
+        
+        :param dict_slices_indices: time steps of each slice (see get_dict_temporal_slices_indices)
+        :type dict_slices_indices: OrderedDict
+        
+        :param read_slice: function returning the values of the time steps ``indices`` of ``dt_arr``: read_slice(indices)
+        :type read_slice: function
+        '''
+        self.dt_arr = dt_arr
+        self.dict_slices_indices = dict_slices_indices
+        self.read_slice = read_slice
+        self.fill_value = fill_value
+        self.current_key = None
+        self.current_slice = None
+    
+    def keys(self):
+        return self.dict_slices_indices.keys()
+    
+    def __iter__(self):
+        return iter(self.dict_slices_indices)
+    
+    def __len__(self):
+        return len(self.dict_slices_indices)
+    
+    def __contains__(self, key):
+        return key in self.dict_slices_indices
+    
+    def __getitem__(self, key):
+        if key != self.current_key:
+            (dt_centroid, dt_bounds, indices) = self.dict_slices_indices[key]
+            if indices is None: # whole selected time range
+                indices = numpy.arange(len(self.dt_arr))
+            self.current_slice = None # the previous slice is released before the next one is read
+            self.current_slice = (dt_centroid, dt_bounds, self.dt_arr[indices], self.read_slice(indices), self.fill_value)
+            self.current_key = key
+        return self.current_slice
         
         
             
@@ -422,6 +502,24 @@ def get_indices_temp_aggregation(dt_arr, month, year, f=0):
     return indices_non_masked
     
 ### This function is used for the bootstrapping procedure
+def get_resampled_indices(dt_arr, year_to_eliminate, year_to_duplicate):
+    '''
+    Returns the indices of the resampled time steps in ``dt_arr``: all time steps except those of "year_to_eliminate",
+    then the time steps of "year_to_duplicate" (see get_resampled_arrs).
+
+    :rtype: numpy.ndarray (1D) of int
+    '''
+    
+    dt_arr_years = numpy.array([dt.year for dt in dt_arr])
+    
+    # step 1: we eliminate in-base year ("year_to_eliminate")
+    indices_non_masked = numpy.where(dt_arr_years != year_to_eliminate)[0]
+    
+    # step 2: we duplicate one of rest years ("year_to_duplicate"), we add its time steps in the end
+    indices_year_to_duplicate = indices_non_masked[dt_arr_years[indices_non_masked] == year_to_duplicate]
+    
+    return numpy.concatenate([indices_non_masked, indices_year_to_duplicate])
+
 def get_resampled_arrs(dt_arr, values_arr, year_to_eliminate, year_to_duplicate):
     
     ### "out-of-base" years ---> no resampling
@@ -430,32 +528,16 @@ def get_resampled_arrs(dt_arr, values_arr, year_to_eliminate, year_to_duplicate)
     
     ### "in-base" years ---> resampling
     else:
-        # step 1: we eliminate in-base year ("year_to_eliminate"), i.e. we subset our arrays (dt and values)
-        
-        # we define indices where dt_arr != year_to_eliminate
-        dt_arr_years = numpy.array([dt.year for dt in dt_arr])
-        dt_arr_mask_year = dt_arr_years == year_to_eliminate
-        indices_non_masked = numpy.where(dt_arr_mask_year==False)[0]
-        
-        # we subset
-        dt_arr_subsetted = dt_arr[indices_non_masked]
-        values_arr_subsetted = values_arr[indices_non_masked, :, :] # 3D - whole array
-    
-    
-        # step 2: we duplicate one of rest years ("year_to_duplicate")
+        indices = get_resampled_indices(dt_arr, year_to_eliminate, year_to_duplicate)
         
-        # we define indices where dt_arr_subsetted == year_to_duplicate 
-        dt_arr_subsetted_years = numpy.array([dt.year for dt in dt_arr_subsetted])
-        dt_arr_mask_year = dt_arr_subsetted_years == year_to_duplicate
-        indices_year_to_duplicate = numpy.where(dt_arr_mask_year==True)[0]
-        
-        # we define array slices to duplicate
-        dt_arr_year_to_duplicate = dt_arr_subsetted[indices_year_to_duplicate]    
-        values_arr_year_to_duplicate = values_arr_subsetted[indices_year_to_duplicate, :, :] # 3D - whole array
-        
-        # we add slices to duplicate in the end
-        dt_arr_result = numpy.append(dt_arr_subsetted, dt_arr_year_to_duplicate)    
-        values_arr_result = numpy.append(values_arr_subsetted, values_arr_year_to_duplicate, axis=0)
+        dt_arr_result = dt_arr[indices]
+        if isinstance(values_arr, numpy.ma.MaskedArray):
+            # the mask must stay a full array (see calc_percentiles.get_percentile_dict)
+            values_arr_result = numpy.ma.array(values_arr.data[indices],
+                                               mask=numpy.ma.getmaskarray(values_arr)[indices],
+                                               fill_value=values_arr.fill_value)
+        else:
+            values_arr_result = values_arr[indices]
 
         
         return (dt_arr_result, values_arr_result)
@@ -3,9 +3,10 @@
 #
 #  Author: Natalia Tatarinova
 
-from netCDF4 import MFDataset
 import numpy
+import logging
 import util_dt
+import catalog
 
 def get_tile_dimension(in_files, var_name, transfer_limit_Mbytes=None, time_range=None):
     '''
@@ -35,40 +36,179 @@ def get_tile_dimension(in_files, var_name, transfer_limit_Mbytes=None, time_rang
         transfer_limit_bytes = transfer_limit_Mbytes * 1024 * 1024 # Mbytes --> bytes
 
         in_files.sort()
-        mfnc = MFDataset(in_files, 'r', aggdim='time')
+        # shapes and time axis are taken from the catalog (see catalog.py)
+        dict_entries = catalog.get_entries(in_files)
+        first_entry = dict_entries[in_files[0]]
 
-        ndim = mfnc.variables[var_name].ndim
+        v = first_entry['variables'][var_name]
+        ndim = len(v['shape'])
         if ndim != 3:
             print "ERROR: The variable to process must be 3D"
             
-        v = mfnc.variables[var_name]
-        v_shape = v.shape
-        v_dtype = v.dtype
+        v_shape = v['shape']
+        v_dtype = numpy.dtype(str(v['dtype']))
         v_nb_bytes = v_dtype.itemsize 
         
-        if time_range == None: 
-                                   
-            total_array_size_bytes = v_shape[0] * v_shape[1] * v_shape[2] * v_nb_bytes
-            optimal_tile_dimension = int(   numpy.sqrt( transfer_limit_bytes / (v.shape[0] * v_nb_bytes)  )   )
-            
+        nb_time_steps = get_nb_time_steps(in_files, time_range=time_range)
+        total_array_size_bytes = nb_time_steps * v_shape[1] * v_shape[2] * v_nb_bytes
+        optimal_tile_dimension = int(   numpy.sqrt( transfer_limit_bytes / (nb_time_steps * v_nb_bytes)  )   )
+        
+        return optimal_tile_dimension
+
+
+def get_nb_time_steps(in_files, time_range=None):
+    '''
+    Returns number of time steps of input files (within ``time_range`` if it is not None).
+    
+    :param in_files: absolute path(s) to NetCDF dataset(s) (including OPeNDAP URLs), in chronological order
+    :type in_files: list
+    
+    :param time_range: time range
+    :type time_range: list of 2 datetime objects: [dt1, dt2]
+    
+    :rtype: int
+    '''
+    
+    # time axis is taken from the catalog (see catalog.py)
+    dict_entries = catalog.get_entries(in_files)
+    
+    if time_range == None:
+        return sum([entry['ntime'] for entry in dict_entries.values()])
+    
+    first_entry = dict_entries[in_files[0]]
+    time_arr = numpy.concatenate([catalog.get_time_values(entry) for entry in dict_entries.values()])
+    dt_arr = util_dt.decode_time_axis(time_arr, calend=first_entry['calendar'], units=first_entry['units'])[0]
+    
+    return len(util_dt.get_indices_subset(dt_arr, time_range))
+
+
+
+##### peak memory model (used with memory_limit_Mbytes)
+
+# maximum number of time steps of a temporal slice (daily data)
+map_slice_mode_max_length = {'year': 366, 'month': 31,
+                             'DJF': 91, 'MAM': 92, 'JJA': 92, 'SON': 91,
+                             'ONDJFM': 183, 'AMJJAS': 183}
+
+# bytes per value of a masked array: data + mask (1 byte)
+NBYTES_MASKED_FLOAT32 = 4 + 1
+NBYTES_MASKED_FLOAT64 = 8 + 1
+
+# number of days in daily percentile dictionaries
+NB_CALENDAR_DAYS = 366
+
+
+def get_slice_max_length(slice_mode, nb_time_steps):
+    '''
+    Returns the maximum number of daily time steps of a temporal slice (``nb_time_steps`` if unknown, e.g. slice_mode=None).
+    '''
+    if type(slice_mode) is list: # user defined months or season
+        if slice_mode[0] == 'month':
+            return 31
         else:
-            
-            var_time =  mfnc.variables['time']
-            try:
-                time_calend = var_time.calendar
-            except:
-                time_calend = 'gregorian'
-            
-            time_units = var_time.units
-            time_arr = var_time[:]
-            dt_arr = numpy.array([util_dt.num2date(dt, calend=time_calend, units=time_units) for dt in time_arr])
-            indices_subset = util_dt.get_indices_subset(dt_arr, time_range)
-            
-            nb_time_steps_after_subset = len(indices_subset)
-            total_array_size_bytes = nb_time_steps_after_subset * v_shape[1] * v_shape[2] * v_nb_bytes
-            
-            optimal_tile_dimension = int(   numpy.sqrt( transfer_limit_bytes / (nb_time_steps_after_subset * v_nb_bytes)  )   )
+            return nb_time_steps
+    return map_slice_mode_max_length.get(slice_mode, nb_time_steps)
+
+
+def get_nb_bytes_per_pixel(indice_type, nb_time_steps, nb_time_steps_base=None, slice_mode='year', nb_years_base=0, prefetch=False, time_streaming=False):
+    '''
+    Returns the peak memory (in bytes) needed per pixel of a tile to compute an indice.
+    
+    For each target variable, the model counts:
+        - the values read for the study period (float32 masked array) and their copies in temporal slices (time_subset),
+          or only the values of one temporal slice with time streaming,
+        - masked array temporaries of the computation of one temporal slice (float64),
+        - if a base period is read (percentile-based and anomaly indices): the values of the base period 
+          and the temporaries of its processing,
+        - for percentile-based indices: the resampled base arrays of bootstrapping (subset + duplicated year),
+          the daily percentile dictionaries (out-of-base and in-base) and the (nb_years_base-1) intermediate results of in-base years,
+        - if prefetch: the values of one more tile (study and base period).
+    
+    :param indice_type: indice type ('simple', 'multivariable', 'percentile_based', 'user_indice_simple', ...; see maps.map_indice_type)
+    :type indice_type: str
+    
+    :param nb_time_steps: number of time steps of the study period of each target variable
+    :type nb_time_steps: list of int
+    
+    :param nb_time_steps_base: number of time steps of the base period of each target variable (None if no base period is read)
+    :type nb_time_steps_base: list of int
+    
+    :param slice_mode: type of temporal aggregation (None: whole period)
+    :type slice_mode: str
+    
+    :param nb_years_base: number of years of the base period
+    :type nb_years_base: int
+    
+    :param prefetch: if the next tile is read in background (see tile_prefetch.py)
+    :type prefetch: bool
+    
+    :param time_streaming: if values are read one temporal slice at a time (see time_subset.StreamedTemporalSlices)
+    :type time_streaming: bool
+    
+    :rtype: int
+    '''
+    
+    if nb_time_steps_base == None:
+        nb_time_steps_base = [0] * len(nb_time_steps)
+    
+    percentile_based = 'percentile' in indice_type
+    
+    nb_bytes = 0
+    for (T, B) in zip(nb_time_steps, nb_time_steps_base):
         
-        mfnc.close()
+        slice_length = min(get_slice_max_length(slice_mode, T), T)
         
-        return optimal_tile_dimension
+        if time_streaming:
+            nb_bytes += slice_length * NBYTES_MASKED_FLOAT32 # values of one temporal slice
+        else:
+            nb_bytes += 2 * T * NBYTES_MASKED_FLOAT32 # values and temporal slices
+        nb_bytes += 2 * slice_length * NBYTES_MASKED_FLOAT64 # temporaries
+        
+        nb_bytes += B * NBYTES_MASKED_FLOAT32 + B * NBYTES_MASKED_FLOAT64 # base period and its temporaries
+        
+        if percentile_based:
+            nb_bytes += 2 * B * NBYTES_MASKED_FLOAT32 # bootstrapping: resampled arrays
+            nb_bytes += 2 * NB_CALENDAR_DAYS * NBYTES_MASKED_FLOAT32 # daily percentiles (out-of-base and in-base)
+            nb_bytes += max(nb_years_base-1, 1) * NBYTES_MASKED_FLOAT64 # intermediate results of in-base years
+        
+        if prefetch:
+            nb_bytes += (T + B) * NBYTES_MASKED_FLOAT32
+    
+    return int(nb_bytes)
+
+
+def get_tile_dimension_from_memory_limit(memory_limit_Mbytes, nb_bytes_per_pixel, nrow, ncol, nb_bytes_fixed=0):
+    '''
+    Returns the tile dimension (tiles of tdim x tdim pixels) so that the peak memory stays below ``memory_limit_Mbytes``.
+    
+    :param memory_limit_Mbytes: memory limit in Mbytes
+    :type memory_limit_Mbytes: float
+    
+    :param nb_bytes_per_pixel: peak memory per pixel (see get_nb_bytes_per_pixel)
+    :type nb_bytes_per_pixel: int
+    
+    :param nrow: number of rows of the grid
+    :type nrow: int
+    
+    :param ncol: number of columns of the grid
+    :type ncol: int
+    
+    :param nb_bytes_fixed: memory not depending on tile size (e.g. result arrays of the whole grid)
+    :type nb_bytes_fixed: int
+    
+    :rtype: int (0 if no tiling is needed)
+    '''
+    
+    available_bytes = memory_limit_Mbytes * 1024 * 1024 - nb_bytes_fixed
+    
+    nb_pixels = int(available_bytes // nb_bytes_per_pixel)
+    
+    if nb_pixels >= nrow * ncol:
+        return 0
+    
+    if nb_pixels < 1:
+        logging.warning("memory_limit_Mbytes=%s is too small (%.1f Mbytes are needed for one pixel), tiles of 1 pixel are used.", 
+                        memory_limit_Mbytes, (nb_bytes_fixed + nb_bytes_per_pixel) / (1024. * 1024.))
+        return 1
+    
+    return max(1, int(numpy.sqrt(nb_pixels)))
@@ -96,7 +96,7 @@ def get_last_occurrence(arr, val=1):
     return res    
 
 
-def get_binary_arr(arr, logical_operation, thresh, dt_arr=None, fill_val=None):
+def get_binary_arr(arr, logical_operation, thresh, dt_arr=None, fill_val=None, packing=None):
     '''
     Compare "arr" with "thresh" and return a binary array with the result.
     
@@ -112,6 +112,9 @@ def get_binary_arr(arr, logical_operation, thresh, dt_arr=None, fill_val=None):
     :param dt_arr: datetime vector, required if thresh is a dictionary with daily percentiles 
     :type dt_arr: numpy.ndarray (1D) with datetime.datetime objects
     
+    :param packing: if "arr" contains packed values, packed values and the values they are read as (see util_nc.get_packing)
+    :type packing: tuple (numpy.ndarray (1D), numpy.ndarray (1D))
+    
     :rtype: binary numpy.ndarray (3D)
 
     
@@ -121,6 +124,10 @@ def get_binary_arr(arr, logical_operation, thresh, dt_arr=None, fill_val=None):
     
     arr_masked = get_masked_arr(arr, fill_val)
     
+    # packed values are compared with the threshold converted into packed values (see get_packed_comparison)
+    if packing is not None:
+        (arr_masked, logical_operation, thresh) = get_packed_comparison(arr_masked, logical_operation, thresh, packing)
+    
     # thresh is a dictionary with daily percentiles
     if type(thresh)==OrderedDict:
         
@@ -184,6 +191,88 @@ def get_binary_arr(arr, logical_operation, thresh, dt_arr=None, fill_val=None):
     return binary_arr
 
 
+def get_packed_condition(logical_operation, thresh, packing):
+    '''
+    Converts the comparison of values with a number into the comparison of the packed values they are read from (e.g. int16 values
+    with "scale_factor" and "add_offset"). The comparison is evaluated once for all packed values, with the values they are read as:
+    packed values for which it is true are converted into a comparison with the first or the last of them ("get" or "let"),
+    so that the result is the same as the comparison of the values read.
+    
+    :param logical_operation: logical operation to compare values with thresh ('gt', 'get', 'lt', 'let', 'e')
+    :type logical_operation: str
+    
+    :param thresh: threshold
+    :type thresh: float
+    
+    :param packing: packed values (in increasing order) and the values they are read as (see util_nc.get_packing)
+    :type packing: tuple (numpy.ndarray (1D), numpy.ndarray (1D))
+    
+    :rtype: tuple (logical_operation, thresh) to compare packed values with,
+            or None if packed values for which the comparison is true are not a range of packed values (e.g. with 'e')
+    '''
+    
+    if type(thresh)==OrderedDict or numpy.ndim(thresh) != 0:
+        return None
+    
+    (packed, values) = packing
+    
+    # the comparison of values read (float32) with thresh, as for arrays of values
+    binary = get_binary_arr(numpy.ma.array(values.reshape(-1, 1, 1)), logical_operation, thresh).ravel()
+    indices = numpy.flatnonzero(binary)
+    
+    if len(indices) == 0:
+        return ('gt', int(packed[-1])) # never true
+    if indices[-1] - indices[0] + 1 != len(indices):
+        return None
+    if indices[-1] == len(packed) - 1:
+        return ('get', int(packed[indices[0]]))
+    if indices[0] == 0:
+        return ('let', int(packed[indices[-1]]))
+    return None
+
+
+def unpack_arr(arr, packing):
+    '''
+    Returns the values read from packed values (float32, see util_nc.get_packing).
+    
+    :param arr: packed values
+    :type arr: numpy.ma.MaskedArray
+    
+    :param packing: packed values (in increasing order) and the values they are read as (see util_nc.get_packing)
+    :type packing: tuple (numpy.ndarray (1D), numpy.ndarray (1D))
+    
+    :rtype: numpy.ma.MaskedArray of float32
+    '''
+    
+    (packed, values) = packing
+    data = values[numpy.ma.getdata(arr).astype(int) - int(packed[0])]
+    return numpy.ma.array(data, mask=numpy.ma.getmaskarray(arr), copy=False)
+
+
+def get_packed_comparison(arr, logical_operation, thresh, packing, coef=1.0):
+    '''
+    Prepares the comparison of packed values with a threshold: the threshold is converted into packed values (see get_packed_condition),
+    so that packed values are compared as they are, or if it can not be, the values are unpacked (see unpack_arr).
+    
+    :param arr: packed values
+    :type arr: numpy.ma.MaskedArray
+    
+    :param coef: coefficient applied to values before the comparison
+    :type coef: float
+    
+    :rtype: tuple (arr, logical_operation, thresh)
+    '''
+    
+    if coef != 1.0:
+        packing = (packing[0], packing[1] * coef)
+    
+    packed_condition = get_packed_condition(logical_operation, thresh, packing)
+    if packed_condition is None:
+        return (unpack_arr(arr, packing), logical_operation, thresh)
+    
+    return (arr, packed_condition[0], packed_condition[1])
+
+
 def get_masked_arr(arr, fill_val):
     '''
     If a masked array is passed, this function does nothing.
@@ -387,17 +476,30 @@ def get_run_stat(arr, window_width, stat_mode, extreme_mode, coef=1.0, fill_val=
 
     
 ### This function uses "find_max_len_consec_sequence_3d" function from libC.c
-def get_max_nb_consecutive_days(arr, logical_operation, thresh, coef=1.0, fill_val=None, index_event=False, out_unit="days"):
+def get_max_nb_consecutive_days(arr, logical_operation, thresh, coef=1.0, fill_val=None, index_event=False, out_unit="days", packing=None):
 
     '''
     Used for computing: CSU, CFD, CDD, CWD
+    
+    If "arr" contains packed values, "packing" gives packed values and the values they are read as (see util_nc.get_packing):
+    the threshold is converted into packed values (see get_packed_comparison).
     '''
     
     
     if index_event==True:
         index_event_bounds=[]
     
-    arr_masked = get_masked_arr(arr, fill_val) * coef
+    if packing is None:
+        arr_masked = get_masked_arr(arr, fill_val) * coef
+    else:
+        (arr_masked, logical_operation, thresh) = get_packed_comparison(get_masked_arr(arr, fill_val), logical_operation, thresh, packing, coef=coef)
+        if arr_masked.dtype.kind in 'iu':
+            # masked values are passed to C function as a value which is not a packed value
+            fill_val = float(packing[0][0]) - 1
+            arr_masked = arr_masked.astype('float32')
+        else:
+            fill_val = arr_masked.fill_value
+        numpy.ma.set_fill_value(arr_masked, fill_val)
     in_mask = arr_masked.mask[0, :, :]
     arr_filled = arr_masked.filled(fill_value=arr_masked.fill_value) # array must be filled for passing in C function
         
@@ -461,7 +563,7 @@ def get_max_nb_consecutive_days(arr, logical_operation, thresh, coef=1.0, fill_v
 
 
     
-def get_nb_events(arr, logical_operation, thresh, fill_val=None, index_event=False, out_unit="days", dt_arr=None, coef=1.0):
+def get_nb_events(arr, logical_operation, thresh, fill_val=None, index_event=False, out_unit="days", dt_arr=None, coef=1.0, packing=None):
     # WARNING: for precipitation percentile indices (e.g. R75p) ---> arr must be already masked (we need only wet days)
     
     '''
@@ -469,9 +571,15 @@ def get_nb_events(arr, logical_operation, thresh, fill_val=None, index_event=Fal
     :type thresh: float or numpy.ndarray or collections.OrderedDict
     
     If thresh is a dictionary with daily percentiles, dt_arr is required.
+    
+    :param packing: if "arr" contains packed values, packed values and the values they are read as (see util_nc.get_packing)
+    :type packing: tuple (numpy.ndarray (1D), numpy.ndarray (1D))
 
     '''
-    arr_masked = get_masked_arr(arr, fill_val) * coef
+    if packing is None:
+        arr_masked = get_masked_arr(arr, fill_val) * coef
+    else:
+        (arr_masked, logical_operation, thresh) = get_packed_comparison(get_masked_arr(arr, fill_val), logical_operation, thresh, packing, coef=coef)
     in_mask = arr_masked.mask[0, :, :]
 
     
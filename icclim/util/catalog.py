@@ -0,0 +1,365 @@
+#  Copyright CERFACS (http://cerfacs.fr/)
+#  Apache License, Version 2.0 (http://www.apache.org/licenses/LICENSE-2.0)
+
+'''
+Persistent catalog of input files.
+
+For each input file we keep: size and modification time (used to validate the entry),
+calendar and units of the temporal variable, first/last time values, number of time steps,
+list of years, name(s) of unlimited dimension(s) and shape/dimensions/dtype/chunking/filters/attributes of all variables.
+The time values themselves are stored next to the index in a small .npy file.
+
+The catalog is kept on disk in the directory given by the environment variable ICCLIM_CATALOG_DIR, e.g. ~/.icclim/catalog
+(default: empty, the catalog is kept in memory for the current process only).
+OPeNDAP URLs (no size/mtime) are written to disk only if the remote cache is enabled (see remote_cache.py),
+else they are kept in memory for the current process. In-memory datasets (see stores.add_memory_dataset) are never written to disk.
+
+Files missing from the catalog (or modified since they were scanned) are scanned in the current process, or concurrently
+in ICCLIM_CATALOG_SCAN_PROCESSES processes (default: 1, at most MAX_SCAN_PROCESSES).
+'''
+
+import os
+import json
+import hashlib
+import logging
+import multiprocessing
+from collections import OrderedDict
+
+import numpy
+
+import util_dt
+import remote_cache
+import stores
+from ..icclim_exceptions import *
+
+
+CATALOG_VERSION = 3
+
+CATALOG_DIR = os.environ.get('ICCLIM_CATALOG_DIR', '')
+
+INDEX_FILENAME = 'index.json'
+
+MAX_SCAN_PROCESSES = 8
+
+# entries already loaded/scanned in the current process: {key: entry}
+_entries = {}
+
+# time values already loaded in the current process: {key: numpy array}
+_time_values = {}
+
+_index_loaded = False
+
+# number of files scanned (opened) and number of entries served without opening the file, in the current process
+nb_scanned = 0
+nb_served = 0
+
+
+def is_remote(ifile):
+    return '://' in ifile
+
+
+def get_nb_scan_processes():
+    return max(1, min(int(os.environ.get('ICCLIM_CATALOG_SCAN_PROCESSES', 1)), MAX_SCAN_PROCESSES))
+
+
+def get_key(ifile):
+    if is_remote(ifile) or stores.is_memory(ifile):
+        return ifile
+    else:
+        return os.path.abspath(ifile)
+
+
+def get_file_stat(ifile):
+    '''
+    Returns (size, mtime) of a local file (of the sidecar for a store, see stores.py), (None, None) for an OPeNDAP URL or an in-memory dataset.
+    '''
+    if is_remote(ifile) or stores.is_memory(ifile):
+        return (None, None)
+    try:
+        st = os.stat(stores.get_sidecar(ifile) or ifile)
+    except OSError:
+        raise MissingIcclimInputError("Failed to access dataset: " + ifile)
+    return (st.st_size, st.st_mtime)
+
+
+def get_time_values_filename(key):
+    return os.path.join(CATALOG_DIR, hashlib.sha1(key if isinstance(key, str) else key.encode('utf-8')).hexdigest() + '.npy')
+
+
+def load_index():
+    '''
+    Loads the on-disk index (if any) into memory.
+    '''
+    global _index_loaded
+
+    if _index_loaded:
+        return
+    _index_loaded = True
+
+    for key, entry in read_index().items():
+        if key not in _entries:
+            _entries[key] = entry
+
+
+def read_index():
+    if not CATALOG_DIR:
+        return {}
+    index_file = os.path.join(CATALOG_DIR, INDEX_FILENAME)
+    if not os.path.isfile(index_file):
+        return {}
+    try:
+        with open(index_file, 'r') as f:
+            index = json.load(f)
+    except (IOError, ValueError):
+        logging.warning("Catalog index %s is not readable, it will be rebuilt.", index_file)
+        return {}
+    if index.get('version') != CATALOG_VERSION:
+        return {}
+    return index['entries']
+
+
+def save_entries(new_entries):
+    '''
+    Writes new entries (and their time values) to the on-disk catalog.
+    The index is merged with the current on-disk index and replaced atomically, so concurrent runs only risk to rescan a file.
+
+    :param new_entries: entries to write
+    :type new_entries: dict {key: entry}
+    '''
+    if not CATALOG_DIR:
+        return
+
+    to_save = dict((key, entry) for key, entry in new_entries.items() if not stores.is_memory(key) and (not is_remote(key) or remote_cache.enabled()))
+    if len(to_save) == 0:
+        return
+
+    try:
+        if not os.path.isdir(CATALOG_DIR):
+            os.makedirs(CATALOG_DIR, 0700)
+
+        for key in to_save:
+            tmp_file = get_time_values_filename(key) + '.' + str(os.getpid()) + '.tmp'
+            with open(tmp_file, 'wb') as f:
+                numpy.save(f, _time_values[key])
+            os.rename(tmp_file, get_time_values_filename(key))
+
+        index_entries = read_index()
+        index_entries.update(to_save)
+
+        index_file = os.path.join(CATALOG_DIR, INDEX_FILENAME)
+        tmp_file = index_file + '.' + str(os.getpid()) + '.tmp'
+        with open(tmp_file, 'w') as f:
+            json.dump({'version': CATALOG_VERSION, 'entries': index_entries}, f)
+        os.rename(tmp_file, index_file)
+
+    except (IOError, OSError) as e:
+        logging.warning("Failed to write catalog in %s (%s), catalog is kept in memory only.", CATALOG_DIR, e)
+
+
+def scan_file(args):
+    '''
+    Opens a file and collects its metadata.
+
+    :param args: (file, size, mtime, temporal_var_name)
+    :type args: tuple
+
+    :rtype: tuple (entry, time values)
+    '''
+
+    (ifile, size, mtime, temporal_var_name) = args
+
+    try:
+        nc = stores.open_dataset(ifile)
+    except (RuntimeError, IOError):
+        raise MissingIcclimInputError("Failed to access dataset: " + ifile)
+
+    unlimited_dims = [dim for dim in nc.dimensions if nc.dimensions[dim].isunlimited()]
+
+    variables = OrderedDict()
+    for var_name in nc.variables:
+        var = nc.variables[var_name]
+        try:
+            chunking = var.chunking() # None (netCDF3), 'contiguous' or list of chunk sizes
+            filters = var.filters()
+        except RuntimeError:
+            chunking, filters = None, None
+        variables[var_name] = {'dimensions': list(var.dimensions),
+                               'shape': list(var.shape),
+                               'dtype': getattr(var.dtype, 'str', str(var.dtype)),
+                               'chunking': list(chunking) if isinstance(chunking, (list, tuple)) else chunking,
+                               'filters': filters,
+                               'attributes': get_attributes(var)}
+
+    var_time = nc.variables[temporal_var_name]
+    time_units = var_time.units
+    try:
+        time_calend = var_time.calendar
+    except:
+        time_calend = 'gregorian'
+    time_arr = numpy.ma.getdata(var_time[:]).astype('float64')
+
+    nc.close()
+
+    if len(time_arr) > 0:
+        years = numpy.unique(util_dt.get_date_fields_arr(time_arr, calend=time_calend, units=time_units)[0]).tolist()
+        time_first, time_min, time_max = float(time_arr[0]), float(time_arr.min()), float(time_arr.max())
+    else:
+        years = []
+        time_first, time_min, time_max = None, None, None
+
+    entry = {'path': ifile,
+             'size': size,
+             'mtime': mtime,
+             'time_var': temporal_var_name,
+             'calendar': time_calend,
+             'units': time_units,
+             'ntime': len(time_arr),
+             'time_first': time_first,
+             'time_min': time_min,
+             'time_max': time_max,
+             'years': years,
+             'unlimited_dims': unlimited_dims,
+             'variables': variables}
+
+    return (entry, time_arr)
+
+
+def get_attributes(var):
+    '''
+    Returns attributes of a variable as JSON serializable values (numpy scalars and arrays are converted to Python types).
+    '''
+    attributes = OrderedDict()
+    for att in var.ncattrs():
+        value = var.getncattr(att)
+        if isinstance(value, numpy.ndarray) or isinstance(value, numpy.generic):
+            value = value.tolist()
+        attributes[att] = value
+    return attributes
+
+
+def scan_file_in_process(args):
+    # exceptions are returned as messages, because icclim exceptions can not be pickled back to the parent process
+    try:
+        return scan_file(args)
+    except MissingIcclimInputError as e:
+        return (None, e.msg)
+    except Exception as e:
+        return (None, "Failed to scan dataset " + args[0] + ": " + repr(e))
+
+
+def scan_files(list_args):
+    '''
+    Scans files, concurrently if several scan processes are allowed (see get_nb_scan_processes).
+    Falls back to serial scan if processes cannot be started.
+    '''
+
+    nb_processes = min(get_nb_scan_processes(), len(list_args))
+    if any([stores.is_memory(args[0]) for args in list_args]):
+        # in-memory datasets exist in the current process only
+        nb_processes = 1
+    if nb_processes > 1:
+        try:
+            pool = multiprocessing.Pool(nb_processes)
+        except (OSError, ImportError):
+            pool = None
+        if pool is not None:
+            try:
+                results = pool.map(scan_file_in_process, list_args)
+            finally:
+                pool.close()
+                pool.join()
+            for (entry, res) in results:
+                if entry is None:
+                    raise MissingIcclimInputError(res)
+            return results
+
+    return [scan_file(args) for args in list_args]
+
+
+def is_valid(entry, size, mtime, temporal_var_name):
+    return (entry['size'] == size and entry['mtime'] == mtime and entry['time_var'] == temporal_var_name)
+
+
+def get_entries(files_list, temporal_var_name='time'):
+    '''
+    Returns catalog entries of files. Files not in the catalog (or modified since they were scanned) are scanned and added to the catalog.
+
+    :param files_list: netCDF file(s) (including OPeNDAP URL(s))
+    :type files_list: list of str
+
+    :param temporal_var_name: name of temporal variable (default: "time")
+    :type temporal_var_name: str
+
+    :rtype: OrderedDict {file: entry} (same order as ``files_list``)
+    '''
+
+    load_index()
+
+    to_scan = []
+    for ifile in files_list:
+        key = get_key(ifile)
+        (size, mtime) = get_file_stat(ifile)
+        entry = _entries.get(key)
+        if entry is None or not is_valid(entry, size, mtime, temporal_var_name):
+            _time_values.pop(key, None)
+            if (ifile, size, mtime, temporal_var_name) not in to_scan:
+                to_scan.append((ifile, size, mtime, temporal_var_name))
+
+    global nb_scanned, nb_served
+    nb_scanned += len(to_scan)
+    nb_served += len(files_list) - len(to_scan)
+
+    if len(to_scan) > 0:
+        logging.info("Scanning %s file(s) to update the catalog...", len(to_scan))
+        new_entries = {}
+        for (entry, time_arr) in scan_files(to_scan):
+            key = get_key(entry['path'])
+            _entries[key] = entry
+            _time_values[key] = time_arr
+            new_entries[key] = entry
+        save_entries(new_entries)
+
+    dict_entries = OrderedDict()
+    for ifile in files_list:
+        dict_entries[ifile] = _entries[get_key(ifile)]
+
+    return dict_entries
+
+
+def get_entry(ifile, temporal_var_name='time'):
+    '''
+    Returns catalog entry of one file (see get_entries).
+    '''
+    return get_entries([ifile], temporal_var_name=temporal_var_name)[ifile]
+
+
+def forget(ifile):
+    '''
+    Removes the entry of a file from the catalog of the current process (e.g. in-memory dataset removed, see stores.py).
+    '''
+    key = get_key(ifile)
+    _entries.pop(key, None)
+    _time_values.pop(key, None)
+
+
+def get_time_values(entry):
+    '''
+    Returns raw time values (numpy array) of a file described by a catalog entry.
+    '''
+    key = get_key(entry['path'])
+
+    if key not in _time_values:
+        time_arr = None
+        if CATALOG_DIR and (not is_remote(key) or remote_cache.enabled()):
+            try:
+                time_arr = numpy.load(get_time_values_filename(key))
+            except (IOError, ValueError):
+                time_arr = None
+        if time_arr is None or len(time_arr) != entry['ntime']:
+            (entry, time_arr) = scan_file((entry['path'], entry['size'], entry['mtime'], entry['time_var']))
+            _entries[key] = entry
+            _time_values[key] = time_arr
+            save_entries({key: entry})
+        _time_values[key] = time_arr
+
+    return _time_values[key]
@@ -4,27 +4,29 @@
 #  Author: Natalia Tatarinova
 
 from collections import OrderedDict
-import util_dt
+import catalog
 
 
 def get_dict_file_years_glob(files_list):
+    '''
+    Returns years of each file (taken from the catalog, see catalog.py).
+    '''
     dict_file_years = OrderedDict()
     
+    dict_entries = catalog.get_entries(files_list)
     for filename in files_list:
-        dates_list_current_file = util_dt.get_list_dates(filename, 'dt')
-        years_current_file = util_dt.get_year_list(dates_list_current_file)
-        dict_file_years[filename] = years_current_file
-        del dates_list_current_file, years_current_file
+        dict_file_years[filename] = dict_entries[filename]['years']
 
     return dict_file_years
 
 
-def get_files_correct_order(files_list, time_range, slice_mode=None):
+def get_files_correct_order(files_list, time_range, slice_mode=None, dict_file_years=None):
     '''
     Select only files to process (depending on the time_range) and put them in correct (chronological) order.    
     '''
     
-    dict_file_years = get_dict_file_years_glob(files_list)
+    if dict_file_years is None:
+        dict_file_years = get_dict_file_years_glob(files_list)
     
     #if slice_mode in ['DJF','ONDJFM']:
     #    years_to_process = range(time_range[0].year, time_range[1].year+2) #if time_range is [2000,2009] and season is 'DJF', then we need 2010 to take J and F of 2010
@@ -54,10 +56,10 @@ def get_dict_files_years_to_process_in_correct_order(files_list, time_range, sli
     years_to_process = range(time_range[0].year, time_range[1].year+1)
 
         
-    list_files_correct_order = get_files_correct_order(files_list, time_range)
-    
     dict_glob_all_files_years = get_dict_file_years_glob(files_list)
     
+    list_files_correct_order = get_files_correct_order(files_list, time_range, dict_file_years=dict_glob_all_files_years)
+    
     new_dic = OrderedDict()
     
     for f in list_files_correct_order:
@@ -0,0 +1,363 @@
+#  Copyright CERFACS (http://cerfacs.fr/)
+#  Apache License, Version 2.0 (http://www.apache.org/licenses/LICENSE-2.0)
+
+'''
+Direct reader of a variable aggregated over several files (replaces netCDF4.MFDataset).
+
+The number of time steps of each file is taken from the file catalog (see catalog.py), so a requested range of time steps
+is mapped onto index ranges of each file without opening the files.
+Each file's contribution is read straight into one preallocated output array.
+Files are opened only when they are read, through a function given by the caller (e.g. nc_pool.DatasetPool.get_dataset),
+so they do not need to be all open at the same time, and they may be of any netCDF format.
+The time variable is read from the catalog.
+
+Optionally, the files of one read are read in parallel by a bounded pool of worker processes (``read_pool``).
+Threads are not used: netCDF4 releases the GIL while reading, and netCDF-C/HDF5 are usually not thread-safe
+(concurrent reads from threads crash).
+Reads of remote datasets (OPeNDAP) can be split into several requests sent at the same time (``remote_reader``, see remote_reader.py),
+and go through the on-disk cache of remote reads if it is enabled (see remote_cache.py).
+'''
+
+import itertools
+import numpy
+from collections import OrderedDict
+
+import catalog
+import remote_cache
+import stores
+from ..icclim_exceptions import *
+
+
+class MultiFileDataset(object):
+    '''
+    Files aggregated along the dimension ``aggdim``. Variables are accessed as with netCDF4.Dataset: ``mfd.variables[var_name]``.
+    '''
+
+    def __init__(self, files, open_dataset, aggdim='time', temporal_var_name='time', read_pool=None, remote_reader=None):
+        '''
+        :param files: netCDF file(s) (including OPeNDAP URL(s)) in chronological order
+        :type files: list of str
+
+        :param open_dataset: function returning an open netCDF4.Dataset of a file: open_dataset(file)
+        :type open_dataset: function
+
+        :param aggdim: aggregation dimension (default: "time")
+        :type aggdim: str
+
+        :param temporal_var_name: name of temporal variable (default: "time")
+        :type temporal_var_name: str
+
+        :param read_pool: pool of worker processes reading several files in parallel (default: None, files are read one after another)
+        :type read_pool: multiprocessing.Pool
+
+        :param remote_reader: reader of remote datasets (default: None, remote datasets are read as local files)
+        :type remote_reader: remote_reader.RemoteReader
+        '''
+        self.files = list(files)
+        self.open_dataset = open_dataset
+        self.aggdim = aggdim
+        self.temporal_var_name = temporal_var_name
+        self.read_pool = read_pool
+        self.remote_reader = remote_reader
+        self.entries = catalog.get_entries(self.files, temporal_var_name=temporal_var_name).values()
+
+        self.variables = OrderedDict()
+        for var_name in self.entries[0]['variables']:
+            self.variables[var_name] = MultiFileVariable(self, var_name)
+
+
+class MultiFileVariable(object):
+    '''
+    Variable of a MultiFileDataset. Supports reading with slices and integers (and arrays of indices along the aggregation dimension),
+    as a netCDF4.Variable.
+    '''
+
+    def __init__(self, mfd, name):
+        self.mfd = mfd
+        self.name = name
+
+        var_entry = mfd.entries[0]['variables'][name]
+        self.dimensions = tuple(var_entry['dimensions'])
+        self.dtype = numpy.dtype(str(var_entry['dtype']))
+        self.ndim = len(self.dimensions)
+
+        if mfd.aggdim in self.dimensions:
+            self.agg_axis = self.dimensions.index(mfd.aggdim)
+            lengths = []
+            for entry in mfd.entries:
+                if name not in entry['variables']:
+                    raise MissingIcclimInputError("Variable " + name + " not found in dataset: " + entry['path'])
+                lengths.append(entry['variables'][name]['shape'][self.agg_axis])
+            self.file_offsets = numpy.concatenate(([0], numpy.cumsum(lengths))).astype(int)
+        else:
+            self.agg_axis = None
+            self.file_offsets = numpy.array([0, var_entry['shape'][0] if self.ndim > 0 else 1])
+
+        shape = list(var_entry['shape'])
+        if self.agg_axis is not None:
+            shape[self.agg_axis] = int(self.file_offsets[-1])
+        self.shape = tuple(shape)
+
+        # remote datasets are read by the remote reader
+        self.remote = (mfd.remote_reader is not None and self.agg_axis is not None and
+                       any([catalog.is_remote(ifile) for ifile in mfd.files]))
+
+    def __len__(self):
+        return self.shape[0]
+
+    def __getattr__(self, att):
+        # attributes (units, calendar, _FillValue, ...) are those of the first file (as with netCDF4.MFDataset)
+        if att.startswith('__') or att in ['mfd', 'name', 'dimensions', 'dtype', 'ndim', 'agg_axis', 'file_offsets', 'shape', 'remote']:
+            raise AttributeError(att)
+        return getattr(self.get_file_var(0), att)
+
+    def ncattrs(self):
+        return self.get_file_var(0).ncattrs()
+
+    def get_file_var(self, i):
+        return self.mfd.open_dataset(self.mfd.files[i]).variables[self.name]
+
+    def get_file_vars(self):
+        '''
+        Returns the variable of each file (opening all files).
+        '''
+        if self.agg_axis is None:
+            return [self.get_file_var(0)]
+        return [self.get_file_var(i) for i in range(len(self.mfd.files))]
+
+    def get_file_runs(self, start, stop):
+        '''
+        Maps the range [start, stop) of the aggregation dimension onto the files.
+
+        :rtype: list of tuples (file index, start in file, stop in file, position in the output)
+        '''
+        runs = []
+        i = max(0, numpy.searchsorted(self.file_offsets, start, side='right') - 1)
+        pos = 0
+        while start < stop and i < len(self.file_offsets) - 1:
+            file_stop = min(stop, self.file_offsets[i+1])
+            if file_stop > start:
+                runs.append((i, int(start - self.file_offsets[i]), int(file_stop - self.file_offsets[i]), pos))
+                pos += file_stop - start
+                start = file_stop
+            i += 1
+        return runs
+
+    def __getitem__(self, key):
+
+        if not isinstance(key, tuple):
+            key = (key,)
+        if len(key) > self.ndim:
+            raise IndexError("Too many indices for variable " + self.name)
+        key = key + (slice(None),) * (self.ndim - len(key))
+
+        if self.agg_axis is None:
+            return self.get_file_var(0)[key]
+
+        k = key[self.agg_axis]
+        n = self.shape[self.agg_axis]
+
+        if isinstance(k, (int, long, numpy.integer)):
+            if k < 0:
+                k += n
+            if not 0 <= k < n:
+                raise IndexError("Index out of range of variable " + self.name)
+            squeeze = True
+            indices = [k]
+        elif isinstance(k, slice):
+            squeeze = False
+            (start, stop, step) = k.indices(n)
+            if step == 1:
+                return self.read_range(key, start, stop, squeeze=False)
+            indices = range(start, stop, step)
+        else:
+            squeeze = False
+            indices = numpy.asarray(k).ravel()
+
+        # several ranges: read range by range (see util_nc.get_contiguous_runs)
+        indices = numpy.asarray(indices, dtype=int)
+        if len(indices) > 0 and numpy.all(numpy.diff(indices) == 1):
+            return self.read_range(key, int(indices[0]), int(indices[-1]) + 1, squeeze=squeeze)
+        pieces = [self.read_range(key, int(i), int(i) + 1, squeeze=False) for i in indices]
+        return numpy.ma.concatenate(pieces, axis=self.get_output_agg_axis(key))
+
+    def get_output_agg_axis(self, key):
+        # integer indices before the aggregation dimension remove dimensions from the output
+        return self.agg_axis - len([k for k in key[:self.agg_axis] if isinstance(k, (int, long, numpy.integer))])
+
+    def get_output_shape(self, key, nb_agg):
+        # shape of values read with ``key`` (slices and integers), with ``nb_agg`` values along the aggregation dimension
+        out_shape = []
+        for d in range(self.ndim):
+            if d == self.agg_axis:
+                out_shape.append(nb_agg)
+            elif isinstance(key[d], slice):
+                out_shape.append(len(xrange(*key[d].indices(self.shape[d]))))
+        return tuple(out_shape)
+
+    def get_run_output_key(self, key, run):
+        # position of the values of a run (see get_file_runs) in the output
+        (i, file_start, file_stop, p) = run
+        out_key = [slice(None)] * len([k for k in key if not isinstance(k, (int, long, numpy.integer))])
+        out_key[self.get_output_agg_axis(key)] = slice(p, p + file_stop - file_start)
+        return tuple(out_key)
+
+    def read_range(self, key, start, stop, squeeze=False):
+        '''
+        Reads the range [start, stop) of the aggregation dimension (other dimensions: ``key``) into one preallocated array.
+        '''
+
+        if self.mfd.temporal_var_name == self.name and self.ndim == 1:
+            # time values are taken from the catalog
+            time_arr = numpy.concatenate([catalog.get_time_values(entry) for entry in self.mfd.entries])[start:stop]
+            return time_arr[0] if squeeze else time_arr
+
+        if len(self.get_file_runs(start, stop)) <= 1:
+            # one file: the array read is used as is
+            runs = self.get_file_runs(start, stop) or [(0, 0, 0, 0)]
+            arr = self.read_file_run(key, runs[0])
+        else:
+            (data, mask) = self.read_into(key, [(start, stop)])
+            if mask is not None:
+                arr = numpy.ma.array(data, mask=mask, copy=False)
+            else:
+                arr = data
+
+        return numpy.take(arr, 0, axis=self.get_output_agg_axis(key)) if squeeze else arr
+
+    def read_file_run(self, key, run, file_var=None):
+        (i, file_start, file_stop, pos) = run
+        file_key = list(key)
+        file_key[self.agg_axis] = slice(file_start, file_stop)
+        file_key = tuple(file_key)
+        # remote datasets are read through the remote cache (the dataset is not opened if the values are in the cache)
+        return remote_cache.read(self.mfd.files[i], self.name, file_key, 
+                                 lambda: (file_var if file_var is not None else self.get_file_var(i))[file_key])
+
+    def read_into(self, key, ranges, data=None, mask=None):
+        '''
+        Reads ranges of the aggregation dimension (other dimensions: ``key``) one after another along the output aggregation axis,
+        straight into ``data`` and ``mask``. 
+        
+        :param key: indices of the other dimensions (the index of the aggregation dimension is ignored)
+        :type key: tuple
+        
+        :param ranges: ranges [start, stop) of the aggregation dimension
+        :type ranges: list of tuples (start, stop)
+        
+        :param data: output array (if None, it is allocated with the type of values read)
+        :type data: numpy.ndarray
+        
+        :param mask: output mask (if None, it is allocated if some values read are masked)
+        :type mask: numpy.ndarray of bool
+        
+        :rtype: tuple (data, mask), mask is None if no value is masked and no mask was given
+        '''
+        
+        axis = self.get_output_agg_axis(key)
+        
+        runs = []
+        pos = 0
+        for (start, stop) in ranges:
+            for (i, file_start, file_stop, p) in self.get_file_runs(start, stop):
+                runs.append((i, file_start, file_stop, pos + p))
+            pos += stop - start
+        
+        if self.remote:
+            # runs are split into requests sent at the same time, and copied as they arrive
+            requests = []
+            out_keys = []
+            for (run, run_requests) in zip(runs, self.mfd.remote_reader.split(key, self.agg_axis, [run[1:3] for run in runs], self.shape, self.dtype.itemsize)):
+                for (req_key, req_out_key) in run_requests:
+                    requests.append((self.mfd.files[run[0]], self.name, req_key))
+                    req_out_key = list(req_out_key)
+                    req_out_key[axis] = slice(run[3] + req_out_key[axis].start, run[3] + req_out_key[axis].stop)
+                    out_keys.append(tuple(req_out_key))
+            pieces = ((out_keys[i], arr) for (i, arr) in self.mfd.remote_reader.read(requests))
+        
+        elif self.mfd.read_pool is not None and len(runs) > 1:
+            # files are read in parallel by the worker processes, and copied as they arrive
+            args = [(self.mfd.files[run[0]], self.name, key, self.agg_axis, run[1], run[2]) for run in runs]
+            pieces = itertools.izip([self.get_run_output_key(key, run) for run in runs], self.mfd.read_pool.imap(read_file_run_in_process, args))
+        
+        else:
+            pieces = ((self.get_run_output_key(key, run), self.read_file_run(key, run)) for run in runs)
+        
+        for (out_key, arr) in pieces:
+            
+            if isinstance(arr, str): # error message from a worker process
+                raise MissingIcclimInputError(arr)
+            
+            if data is None:
+                if self.remote:
+                    out_shape = self.get_output_shape(key, pos)
+                else:
+                    out_shape = list(numpy.shape(arr))
+                    out_shape[axis] = pos
+                data = numpy.empty(out_shape, dtype=arr.dtype)
+            
+            data[out_key] = numpy.ma.getdata(arr)
+            if numpy.ma.getmask(arr) is not numpy.ma.nomask:
+                if mask is None:
+                    mask = numpy.zeros(data.shape, dtype=bool)
+                mask[out_key] = numpy.ma.getmaskarray(arr)
+            elif mask is not None:
+                mask[out_key] = False
+            del arr
+
+        return (data, mask)
+
+
+# files opened by a worker process: {file: netCDF4.Dataset}, least recently used first
+_worker_datasets = OrderedDict()
+
+MAX_WORKER_OPEN_FILES = 16
+
+
+def read_file_run_in_process(args):
+    '''
+    Reads a range of one file in a worker process (see MultiFileDataset, ``read_pool``).
+    Errors are returned as messages, because icclim exceptions can not be pickled back to the parent process.
+    
+    :param args: (file, var_name, key, agg_axis, file_start, file_stop)
+    :type args: tuple
+    '''
+    
+    (ifile, var_name, key, agg_axis, file_start, file_stop) = args
+    
+    try:
+        file_key = list(key)
+        file_key[agg_axis] = slice(file_start, file_stop)
+        file_key = tuple(file_key)
+        return remote_cache.read(ifile, var_name, file_key, lambda: get_worker_dataset(ifile).variables[var_name][file_key])
+    
+    except Exception as e:
+        return "Failed to read dataset " + ifile + ": " + repr(e)
+
+
+def get_worker_dataset(ifile):
+    '''
+    Returns an open dataset of ``ifile`` (netCDF4.Dataset or stores.Store) kept open by the current (worker) process.
+    '''
+    
+    if ifile in _worker_datasets:
+        nc = _worker_datasets.pop(ifile)
+    else:
+        while len(_worker_datasets) >= MAX_WORKER_OPEN_FILES:
+            _worker_datasets.popitem(last=False)[1].close()
+        nc = stores.open_dataset(ifile)
+    _worker_datasets[ifile] = nc
+    return nc
+
+
+def close_worker_dataset(ifile):
+    '''
+    Closes ``ifile`` if it is kept open by the current (worker) process (e.g. after a failed read of a remote dataset).
+    '''
+    
+    nc = _worker_datasets.pop(ifile, None)
+    if nc is not None:
+        try:
+            nc.close()
+        except RuntimeError:
+            pass
@@ -0,0 +1,163 @@
+#  Copyright CERFACS (http://cerfacs.fr/)
+#  Apache License, Version 2.0 (http://www.apache.org/licenses/LICENSE-2.0)
+
+'''
+Pool of open files, reused across tiles.
+
+Without the pool, each tile and each variable (and the base period) re-opens its list of files.
+The pool keeps files open for the whole run, closing the least recently used ones when the number of open files
+exceeds ``max_open_files``.
+Lists of files are read with mf_reader.MultiFileDataset, which opens files through the pool only when they are read,
+so a file is shared between all reads using it (e.g. study and base period).
+Remote datasets (OPeNDAP) can be read by a remote reader sending several requests at the same time (see remote_reader.py).
+'''
+
+import logging
+import multiprocessing
+from collections import OrderedDict
+
+import util_nc
+import mf_reader
+import stores
+
+from ..icclim_exceptions import *
+
+
+MAX_OPEN_FILES = 256
+
+
+class DatasetPool(object):
+
+    def __init__(self, max_open_files=MAX_OPEN_FILES, nb_read_processes=1, remote_reader=None):
+        '''
+        :param max_open_files: maximum number of files kept open at the same time (default: MAX_OPEN_FILES)
+        :type max_open_files: int
+        
+        :param nb_read_processes: number of worker processes reading files in parallel when a read spans several files 
+                                  (default: 1, i.e. no worker process, see mf_reader.py)
+        :type nb_read_processes: int
+        
+        :param remote_reader: reader of remote datasets, closed with the pool (default: None, remote datasets are read as local files)
+        :type remote_reader: remote_reader.RemoteReader
+        '''
+        self.max_open_files = max_open_files
+        self.remote_reader = remote_reader
+        self.read_pool = None
+        if nb_read_processes > 1:
+            try:
+                self.read_pool = multiprocessing.Pool(nb_read_processes)
+            except (OSError, ImportError):
+                logging.warning("Failed to start worker processes, files are read one after another.")
+        self.datasets = OrderedDict() # {file: netCDF4.Dataset}, least recently used first
+        self.mf_datasets = {} # {(aggdim, tuple of files): mf_reader.MultiFileDataset}
+        self.chunk_cache = {} # {var_name: size}
+        self.packed = set() # variables whose values are read as they are stored
+        self.nb_requests = 0
+        self.nb_opened = 0
+
+
+    def get_nb_open_files(self):
+        return len(self.datasets)
+
+
+    def get_dataset(self, ifile):
+        '''
+        Returns an open dataset of ``ifile`` (netCDF4.Dataset or stores.Store, see stores.py): the dataset already in the pool, or a newly opened one.
+        '''
+
+        if ifile in self.datasets:
+            nc = self.datasets.pop(ifile)
+            self.datasets[ifile] = nc
+            return nc
+
+        while len(self.datasets) > 0 and self.get_nb_open_files() >= self.max_open_files:
+            (key, nc) = self.datasets.popitem(last=False)
+            nc.close()
+
+        try:
+            nc = stores.open_dataset(ifile)
+        except (RuntimeError, IOError):
+            raise MissingIcclimInputError("Failed to access dataset: " + ifile)
+
+        for var_name in self.chunk_cache:
+            if var_name in nc.variables:
+                util_nc.set_chunk_cache(nc.variables[var_name], self.chunk_cache[var_name])
+
+        for var_name in self.packed:
+            if var_name in nc.variables:
+                nc.variables[var_name].set_auto_scale(False)
+
+        self.nb_opened += 1
+        self.datasets[ifile] = nc
+
+        return nc
+
+
+    def get(self, files, aggdim='time', chunk_cache=None, temporal_var_name='time', packed=None):
+        '''
+        Returns a dataset aggregating ``files`` along ``aggdim`` (mf_reader.MultiFileDataset). Files are opened when they are read.
+
+        :param files: netCDF file(s) (including OPeNDAP URL(s)) in chronological order
+        :type files: list of str
+
+        :param aggdim: aggregation dimension (default: "time")
+        :type aggdim: str
+
+        :param chunk_cache: size of chunk cache in bytes to set for variables of newly opened files (default: None)
+        :type chunk_cache: dict {var_name: size}
+        
+        :param temporal_var_name: name of temporal variable (default: "time")
+        :type temporal_var_name: str
+
+        :param packed: variables whose values are read as they are stored, i.e. not unpacked with "scale_factor" and "add_offset" 
+                       (in all files of the pool, see util_nc.get_values_arr) (default: None)
+        :type packed: list of str
+
+        :rtype: mf_reader.MultiFileDataset
+
+        .. warning:: files are closed by the pool (see ``close``)
+        '''
+
+        self.nb_requests += 1
+        files = tuple(files)
+
+        if chunk_cache is not None:
+            self.chunk_cache.update(chunk_cache)
+
+        for var_name in (packed or []):
+            if var_name not in self.packed:
+                self.packed.add(var_name)
+                for nc in self.datasets.values():
+                    if var_name in nc.variables:
+                        nc.variables[var_name].set_auto_scale(False)
+
+        key = (aggdim, files)
+        if key not in self.mf_datasets:
+            self.mf_datasets[key] = mf_reader.MultiFileDataset(files, self.get_dataset, aggdim=aggdim, 
+                                                                temporal_var_name=temporal_var_name, 
+                                                                read_pool=self.read_pool,
+                                                                remote_reader=self.remote_reader)
+
+        return self.mf_datasets[key]
+
+
+    def close(self):
+        '''
+        Closes all files of the pool.
+        '''
+
+        for nc in self.datasets.values():
+            nc.close()
+        self.datasets.clear()
+        self.mf_datasets.clear()
+        
+        if self.read_pool is not None:
+            self.read_pool.close()
+            self.read_pool.join()
+            self.read_pool = None
+        
+        if self.remote_reader is not None:
+            self.remote_reader.close()
+            self.remote_reader = None
+
+        logging.info("Dataset pool: %s file(s) opened for %s read(s).", self.nb_opened, self.nb_requests)
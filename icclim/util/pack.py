@@ -0,0 +1,236 @@
+#  Copyright CERFACS (http://cerfacs.fr/)
+#  Apache License, Version 2.0 (http://www.apache.org/licenses/LICENSE-2.0)
+
+'''
+Pixel-major packs of input files.
+
+A pack converts the input files of one variable (time, lat, lon) into a chunked store (see stores.py) whose chunks are
+spatial blocks of complete time series, stored pixel-major (lat, lon, time): the time series of each pixel is contiguous.
+A tile is then read with one sequential read per block it overlaps, whatever the number of input files and time steps
+selected, and tiles are aligned on blocks (see tile_plan.py).
+Blocks are memory-mapped .npy files, or compressed .npz files (``compression``="zlib": smaller, but each block is
+decompressed before it is read, which can cost more than the read itself).
+Packing costs one full read of the input files: it pays for itself when many indices are computed on the same files.
+
+Packs live in the directory given by the environment variable ICCLIM_PACK_DIR, e.g. ~/.icclim/pack (default: empty,
+packs are not looked for), one subdirectory per variable and list of input files (named after their paths, sizes and
+modification times, so a pack is not used anymore once an input file is modified).
+While ICCLIM_PACK_DIR is set, icclim.indice reads a variable from its pack when one exists (see ``get_pack``).
+A pack can also be written anywhere (``out_path``) and given to icclim.indice as input file.
+
+Packs are built with ``pack`` or from the command line::
+
+    python -m icclim.util.pack [--zlib] var_name in_file [in_file ...]
+'''
+
+import os
+import sys
+import json
+import shutil
+import hashlib
+import logging
+import itertools
+import time
+import numpy
+from collections import OrderedDict
+
+import catalog
+import nc_pool
+import stores
+from ..icclim_exceptions import *
+
+
+PACK_DIR = os.environ.get('ICCLIM_PACK_DIR', '')
+
+# maximum size of one block (uncompressed)
+BLOCK_MBYTES = 64
+
+
+def get_pack_path(files, var_name):
+    '''
+    Returns the directory of the pack of a variable in PACK_DIR (the pack may not exist).
+    '''
+    items = [var_name]
+    for ifile in sorted([catalog.get_key(f) for f in files]):
+        (size, mtime) = catalog.get_file_stat(ifile)
+        items.append('%s|%s|%s' % (ifile, size, mtime))
+    name = '\n'.join(items)
+    return os.path.join(PACK_DIR, hashlib.sha1(name if isinstance(name, str) else name.encode('utf-8')).hexdigest())
+
+
+def get_pack(files, var_name):
+    '''
+    Returns the pack of a variable if it exists in PACK_DIR (None if ICCLIM_PACK_DIR is not set).
+
+    :param files: input files of the variable
+    :type files: list of str
+
+    :param var_name: variable name
+    :type var_name: str
+
+    :rtype: str (directory of the pack, input file for icclim.indice), or None
+    '''
+    if not PACK_DIR:
+        return None
+    try:
+        pack_path = get_pack_path(files, var_name)
+    except MissingIcclimInputError: # missing file: reported by the reader
+        return None
+    if os.path.isfile(os.path.join(pack_path, stores.STORE_FILENAME)):
+        return pack_path
+    return None
+
+
+def get_block_shape(ntime, nrow, ncol, itemsize, block_Mbytes=BLOCK_MBYTES):
+    '''
+    Returns the spatial shape of blocks (full-width bands of rows if they fit, else parts of one row).
+
+    :rtype: tuple (number of rows, number of columns)
+    '''
+    nb_pixels = max(1, int(block_Mbytes * 1024 * 1024 // (int(ntime) * itemsize)))
+    if nb_pixels >= ncol:
+        return (int(min(nrow, nb_pixels // ncol)), int(ncol))
+    return (1, nb_pixels)
+
+
+def pack(in_files, var_name, temporal_var_name='time', block_Mbytes=BLOCK_MBYTES, compression=None, out_path=None):
+    '''
+    Packs the input files of a variable.
+
+    :param in_files: input files (netCDF files, OPeNDAP URLs or stores)
+    :type in_files: list of str
+
+    :param var_name: variable to pack, of dimensions (time, lat, lon)
+    :type var_name: str
+
+    :param temporal_var_name: name of temporal variable (default: "time")
+    :type temporal_var_name: str
+
+    :param block_Mbytes: maximum size of one block in Mbytes, uncompressed (default: BLOCK_MBYTES)
+    :type block_Mbytes: float
+
+    :param compression: compression of blocks: "zlib" or None (blocks are memory-mapped when they are read) (default: None)
+    :type compression: str
+
+    :param out_path: directory of the pack (default: None, the pack is written in PACK_DIR and found by icclim.indice, ICCLIM_PACK_DIR must be set)
+    :type out_path: str
+
+    :rtype: str (directory of the pack, input file for icclim.indice)
+    '''
+
+    if type(in_files) is not list:
+        in_files = [in_files]
+    if compression not in ['zlib', None]:
+        raise IOError('"compression" must be "zlib" or None')
+    if out_path is None and not PACK_DIR:
+        raise IOError('"out_path" must be given if the environment variable ICCLIM_PACK_DIR is not set')
+
+    # files in chronological order
+    entries = catalog.get_entries(in_files, temporal_var_name=temporal_var_name)
+    files = sorted(entries.keys(), key=lambda f: entries[f]['time_first'])
+    first_entry = entries[files[0]]
+
+    if var_name not in first_entry['variables']:
+        raise MissingIcclimInputError("Variable " + var_name + " not found in " + files[0])
+    var_entry = first_entry['variables'][var_name]
+    time_dim = first_entry['variables'][temporal_var_name]['dimensions'][0]
+    if len(var_entry['dimensions']) != 3 or var_entry['dimensions'][0] != time_dim:
+        raise IOError("Only variables of dimensions (time, lat, lon) can be packed: " + var_name + str(tuple(var_entry['dimensions'])))
+    for ifile in files[1:]:
+        attributes = entries[ifile]['variables'][var_name]['attributes']
+        for att in ['_FillValue', 'missing_value', 'scale_factor', 'add_offset']:
+            if attributes.get(att) != var_entry['attributes'].get(att):
+                raise IOError("Attribute " + att + " of " + var_name + " differs between " + files[0] + " and " + ifile + ", files can not be packed together.")
+
+    ntimes = [entries[f]['variables'][var_name]['shape'][0] for f in files]
+    offsets = numpy.cumsum([0] + ntimes)
+    (nrow, ncol) = var_entry['shape'][1:]
+    dtype = numpy.dtype(str(var_entry['dtype']))
+    (block_nrow, block_ncol) = get_block_shape(offsets[-1], nrow, ncol, dtype.itemsize, block_Mbytes=block_Mbytes)
+
+    if out_path is None:
+        out_path = get_pack_path(in_files, var_name)
+    tmp_path = out_path.rstrip(os.sep) + '.' + str(os.getpid()) + '.tmp'
+    if os.path.isdir(tmp_path):
+        shutil.rmtree(tmp_path)
+    os.makedirs(os.path.join(tmp_path, var_name))
+
+    t0 = time.time()
+    pool = nc_pool.DatasetPool()
+    try:
+        def read_var(ifile, name, key=slice(None)):
+            var = pool.get_dataset(ifile).variables[name]
+            var.set_auto_maskandscale(False) # packed values and fill values are written as they are
+            return numpy.ma.getdata(var[key])
+
+        # blocks of complete time series, pixel-major
+        for (bi, bj) in itertools.product(xrange((nrow + block_nrow - 1) // block_nrow), xrange((ncol + block_ncol - 1) // block_ncol)):
+            rows = slice(bi * block_nrow, min((bi + 1) * block_nrow, nrow))
+            cols = slice(bj * block_ncol, min((bj + 1) * block_ncol, ncol))
+            block = numpy.empty((rows.stop - rows.start, cols.stop - cols.start, offsets[-1]), dtype=dtype)
+            for (i, ifile) in enumerate(files):
+                block[:, :, offsets[i]:offsets[i+1]] = numpy.rollaxis(read_var(ifile, var_name, (slice(None), rows, cols)), 0, 3)
+            if compression == 'zlib':
+                with open(os.path.join(tmp_path, var_name, '0.%d.%d.npz' % (bi, bj)), 'wb') as f:
+                    numpy.savez_compressed(f, values=block)
+            else:
+                numpy.save(os.path.join(tmp_path, var_name, '0.%d.%d.npy' % (bi, bj)), block)
+
+        meta = OrderedDict([('icclim_store', stores.STORE_VERSION),
+                            ('unlimited_dimensions', first_entry['unlimited_dims']),
+                            ('variables', OrderedDict()),
+                            ('source', [[catalog.get_key(f)] + list(catalog.get_file_stat(f)) for f in files])])
+
+        # other variables: temporal variable (and its bounds) concatenated, variables without time dimension copied
+        time_bounds = first_entry['variables'][temporal_var_name]['attributes'].get('bounds')
+        for (name, v) in first_entry['variables'].items():
+            var_meta = OrderedDict([('dimensions', v['dimensions']),
+                                    ('shape', list(v['shape'])),
+                                    ('dtype', v['dtype']),
+                                    ('attributes', v['attributes'])])
+            if name == var_name:
+                var_meta['shape'][0] = int(offsets[-1])
+                var_meta['chunks'] = [int(offsets[-1]), block_nrow, block_ncol]
+                var_meta['chunk_order'] = 'pixel_major'
+                if compression == 'zlib':
+                    var_meta['compression'] = 'zlib'
+            elif time_dim not in v['dimensions']:
+                var_meta['file'] = name + '.npy'
+                numpy.save(os.path.join(tmp_path, var_meta['file']), read_var(files[0], name))
+            elif name in [temporal_var_name, time_bounds] and v['dimensions'][0] == time_dim:
+                var_meta['shape'][0] = int(offsets[-1])
+                var_meta['file'] = name + '.npy'
+                numpy.save(os.path.join(tmp_path, var_meta['file']), numpy.concatenate([read_var(f, name) for f in files]))
+            else:
+                continue
+            meta['variables'][name] = var_meta
+    finally:
+        pool.close()
+
+    with open(os.path.join(tmp_path, stores.STORE_FILENAME), 'w') as f:
+        json.dump(meta, f, indent=1)
+
+    if os.path.isdir(out_path):
+        shutil.rmtree(out_path)
+    os.rename(tmp_path, out_path)
+
+    logging.info("Packed %s (%s file(s)) into %s: blocks of %sx%s pixels, %.1f s.", var_name, len(files), out_path, block_nrow, block_ncol, time.time() - t0)
+
+    return out_path
+
+
+def main(argv):
+    compression = None
+    if len(argv) > 1 and argv[1] == '--zlib':
+        compression = 'zlib'
+        argv = argv[:1] + argv[2:]
+    if len(argv) < 3:
+        print 'Usage: python -m icclim.util.pack [--zlib] var_name in_file [in_file ...]'
+        print 'The pack is written in ICCLIM_PACK_DIR.'
+        return 1
+    print pack(argv[2:], argv[1], compression=compression)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main(sys.argv))
@@ -0,0 +1,183 @@
+#  Copyright CERFACS (http://cerfacs.fr/)
+#  Apache License, Version 2.0 (http://www.apache.org/licenses/LICENSE-2.0)
+
+'''
+Persistent cache of percentile thresholds.
+
+The percentile thresholds of a base period (daily thresholds of temperature variables, see calc_percentiles.get_percentile_dict,
+and thresholds of wet days of precipitation variables, see calc_percentiles.get_percentile_arr) depend only on the values of the
+base period of a tile and on the parameters of the percentiles. They are stored on disk and reused by later runs, for other indices
+(e.g. TX90p and WSDI) or other study periods: thresholds of out-of-base years, and thresholds of in-base years (bootstrapping: one
+set of thresholds per in-base year and duplicated year).
+
+An entry is keyed by the fingerprint of the base values (input files: paths, sizes and modification times; variable, time steps of
+the base period, tile and conversion, see ``get_base_key``) and by the parameters of the percentiles (percentile, window width,
+interpolation, only_leap_years, ignore_Feb29th, calendar, years of bootstrapping), so an entry is not used anymore once an input
+file is modified. Thresholds are stored as they are computed (float64 arrays), one .npz file per entry, so that indices computed
+with thresholds taken from the cache are the same as indices computed without the cache. The mask is stored once for all calendar
+days when it is the same for all of them.
+
+The cache is enabled by the environment variable ICCLIM_PCTL_CACHE_DIR (default: empty, no cache), e.g. ~/.icclim/pctl.
+Entries are not removed by icclim: the directory can be emptied at any time.
+Entries are written atomically (temporary files renamed), so concurrent runs can add the same entry.
+In-memory datasets (see stores.py) are not cached.
+Entries are loaded without unpickling (an entry containing objects is ignored), the cache directory is created with mode 0700.
+'''
+
+import os
+import hashlib
+import logging
+import zipfile
+import numpy
+from collections import OrderedDict
+
+import shm_cache
+
+
+CACHE_DIR = os.environ.get('ICCLIM_PCTL_CACHE_DIR', '')
+
+ENTRY_EXTENSION = '.npz'
+
+# number of thresholds taken from the cache and computed, in the current process (since the last summary)
+nb_hits = 0
+nb_misses = 0
+
+
+def enabled():
+    return bool(CACHE_DIR)
+
+
+def get_base_key(files, key):
+    '''
+    Returns the fingerprint of the values of a base period, or None if the thresholds computed from them can not be cached
+    (cache disabled, in-memory dataset).
+
+    :param files: input files of the base period
+    :type files: list of str
+
+    :param key: values read: variable, time steps, tile, conversion (see shm_cache.get_name)
+    :type key: tuple
+
+    :rtype: str
+    '''
+    if not enabled():
+        return None
+    return shm_cache.get_name('base', files, key)
+
+
+def get_path(base_key, params):
+    name = hashlib.sha1(base_key + '\n' + repr(params)).hexdigest()
+    return os.path.join(CACHE_DIR, name + ENTRY_EXTENSION)
+
+
+def read_percentile_dict(base_key, params, compute):
+    '''
+    Returns daily percentile thresholds from the cache, or computes them with ``compute`` and adds them to the cache.
+
+    :param base_key: fingerprint of the base values (see get_base_key), if None thresholds are computed and not cached
+    :type base_key: str
+
+    :param params: parameters of the percentiles: numbers, strings, booleans
+    :type params: tuple
+
+    :param compute: function computing the thresholds: compute() (see calc_percentiles.get_percentile_dict)
+    :type compute: function
+
+    :rtype: OrderedDict, keys=calendar day (month,day), values=numpy.ma.MaskedArray (2D) of float
+    '''
+    global nb_hits, nb_misses
+
+    if base_key is None:
+        return compute()
+
+    path = get_path(base_key, ('daily',) + tuple(params))
+    arrays = load(path)
+    if arrays is None:
+        nb_misses += 1
+        percentile_dict = compute()
+        values = numpy.array([numpy.ma.getdata(a) for a in percentile_dict.values()])
+        masks = numpy.array([numpy.ma.getmaskarray(a) for a in percentile_dict.values()])
+        # the thresholds of all calendar days usually have the same mask
+        if len(masks) > 0 and (masks == masks[0]).all():
+            masks = masks[0]
+        arrays = {'caldays': numpy.array(percentile_dict.keys(), dtype='int32').reshape(-1, 2),
+                  'values': values,
+                  'mask': masks}
+        save(path, arrays)
+    else:
+        nb_hits += 1
+
+    percentile_dict = OrderedDict()
+    for (k, (month, day)) in enumerate(arrays['caldays']):
+        mask = arrays['mask'] if arrays['mask'].ndim == 2 else arrays['mask'][k]
+        percentile_dict[int(month), int(day)] = numpy.ma.masked_array(arrays['values'][k], mask)
+    return percentile_dict
+
+
+def read_percentile_arr(base_key, params, compute):
+    '''
+    Returns percentile thresholds from the cache, or computes them with ``compute`` and adds them to the cache.
+
+    :param base_key: fingerprint of the base values (see get_base_key), if None thresholds are computed and not cached
+    :type base_key: str
+
+    :param params: parameters of the percentiles: numbers, strings, booleans
+    :type params: tuple
+
+    :param compute: function computing the thresholds: compute() (see calc_percentiles.get_percentile_arr)
+    :type compute: function
+
+    :rtype: numpy.ma.MaskedArray (2D) of float
+    '''
+    global nb_hits, nb_misses
+
+    if base_key is None:
+        return compute()
+
+    path = get_path(base_key, ('arr',) + tuple(params))
+    arrays = load(path)
+    if arrays is None:
+        nb_misses += 1
+        percentile_arr = compute()
+        arrays = {'values': numpy.ma.getdata(percentile_arr),
+                  'mask': numpy.ma.getmaskarray(percentile_arr)}
+        save(path, arrays)
+    else:
+        nb_hits += 1
+
+    return numpy.ma.masked_array(arrays['values'], arrays['mask'])
+
+
+def load(path):
+    '''
+    Returns the arrays of an entry, or None if the entry does not exist.
+    '''
+    try:
+        with numpy.load(path, allow_pickle=False) as npz:
+            return dict([(name, npz[name]) for name in npz.files])
+    except (IOError, ValueError, KeyError, zipfile.BadZipfile):
+        return None
+
+
+def save(path, arrays):
+    try:
+        if not os.path.isdir(CACHE_DIR):
+            os.makedirs(CACHE_DIR, 0700)
+        tmp_file = path + '.' + str(os.getpid()) + '.tmp'
+        with open(tmp_file, 'wb') as f:
+            numpy.savez(f, **arrays)
+        os.rename(tmp_file, path)
+    except (IOError, OSError):
+        logging.warning("Failed to write in the percentile thresholds cache %s.", CACHE_DIR)
+
+
+def log_summary():
+    '''
+    Logs the number of thresholds taken from the cache and computed in the current process since the last summary.
+    '''
+    global nb_hits, nb_misses
+
+    if enabled() and nb_hits + nb_misses > 0:
+        logging.info("Percentile thresholds cache: %s threshold(s) taken from %s, %s computed.", nb_hits, CACHE_DIR, nb_misses)
+    nb_hits = 0
+    nb_misses = 0
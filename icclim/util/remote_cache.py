@@ -0,0 +1,192 @@
+#  Copyright CERFACS (http://cerfacs.fr/)
+#  Apache License, Version 2.0 (http://www.apache.org/licenses/LICENSE-2.0)
+
+'''
+On-disk read-through cache of remote (OPeNDAP) reads.
+
+Values read from remote datasets are stored in a local directory, keyed by URL, variable and indices of the hyperslab
+(time steps and spatial slice), so that repeated runs on the same remote datasets read them from local disk instead of the server.
+Metadata of remote datasets (catalog entries and time values, see catalog.py) are kept on disk as well while the cache is enabled
+and the catalog is kept on disk (ICCLIM_CATALOG_DIR).
+
+The cache is enabled by the environment variable ICCLIM_REMOTE_CACHE_DIR (default: empty, no cache).
+When its size exceeds ICCLIM_REMOTE_CACHE_MBYTES (default: MAX_CACHE_MBYTES), the least recently used hyperslabs are removed.
+Remote datasets are assumed not to change: if they do, remove the cache directory.
+
+Hyperslabs are written atomically (temporary file renamed), so the cache can be shared by concurrent runs and worker processes.
+'''
+
+import os
+import hashlib
+import logging
+import numpy
+
+import catalog
+
+
+CACHE_DIR = os.environ.get('ICCLIM_REMOTE_CACHE_DIR', '')
+
+MAX_CACHE_MBYTES = 10240
+
+CACHE_EXTENSION = '.npz'
+
+# size of the cache (bytes) as known by the current process (None: not computed yet)
+_size = None
+
+# number of hyperslabs read from the cache and from the server, in the current process (since the last summary)
+nb_hits = 0
+nb_misses = 0
+
+
+def enabled():
+    return bool(CACHE_DIR)
+
+
+def get_max_bytes():
+    return float(os.environ.get('ICCLIM_REMOTE_CACHE_MBYTES', MAX_CACHE_MBYTES)) * 1024 * 1024
+
+
+def get_filename(url, var_name, key):
+    '''
+    Returns the file of a hyperslab in the cache.
+
+    :param key: indices of all dimensions (slices and integers)
+    :type key: tuple
+    '''
+    str_key = []
+    for k in key:
+        if isinstance(k, slice):
+            str_key.append('%s:%s:%s' % (k.start, k.stop, k.step))
+        else:
+            str_key.append(str(int(k)))
+    name = '|'.join([url, var_name] + str_key)
+    return os.path.join(CACHE_DIR, hashlib.sha1(name if isinstance(name, str) else name.encode('utf-8')).hexdigest() + CACHE_EXTENSION)
+
+
+def read(url, var_name, key, read_values):
+    '''
+    Returns ``var_name[key]`` of a remote dataset from the cache, or reads it with ``read_values`` and adds it to the cache.
+    Local files are not cached.
+
+    :param url: OPeNDAP URL (or file)
+    :type url: str
+
+    :param var_name: variable name
+    :type var_name: str
+
+    :param key: indices of all dimensions (slices and integers)
+    :type key: tuple
+
+    :param read_values: function reading the values from the server: read_values()
+    :type read_values: function
+
+    :rtype: numpy.ndarray or numpy.ma.MaskedArray
+    '''
+    global nb_hits, nb_misses
+
+    if not enabled() or not catalog.is_remote(url):
+        return read_values()
+
+    filename = get_filename(url, var_name, key)
+    arr = load(filename)
+    if arr is not None:
+        nb_hits += 1
+        return arr
+
+    nb_misses += 1
+    arr = read_values()
+    save(filename, arr)
+    return arr
+
+
+def load(filename):
+    try:
+        with open(filename, 'rb') as f:
+            npz = numpy.load(f)
+            if 'mask' in npz.files:
+                arr = numpy.ma.array(npz['data'], mask=npz['mask'])
+            else:
+                arr = npz['data']
+    except (IOError, ValueError, KeyError):
+        return None
+    # the hyperslab becomes the most recently used
+    try:
+        os.utime(filename, None)
+    except OSError:
+        pass
+    return arr
+
+
+def save(filename, arr):
+    global _size
+
+    tmp_file = filename + '.' + str(os.getpid()) + '.tmp'
+    try:
+        if not os.path.isdir(CACHE_DIR):
+            os.makedirs(CACHE_DIR)
+        with open(tmp_file, 'wb') as f:
+            if numpy.ma.getmask(arr) is not numpy.ma.nomask:
+                numpy.savez(f, data=numpy.ma.getdata(arr), mask=numpy.ma.getmaskarray(arr))
+            else:
+                numpy.savez(f, data=numpy.ma.getdata(arr))
+        os.rename(tmp_file, filename)
+    except (IOError, OSError):
+        logging.warning("Failed to write in the remote cache %s.", CACHE_DIR)
+        return
+
+    if _size is None:
+        _size = get_size()
+    else:
+        _size += os.path.getsize(filename)
+    if _size > get_max_bytes():
+        evict()
+
+
+def get_files():
+    '''
+    Returns hyperslabs of the cache: list of (mtime, size, file), least recently used first.
+    '''
+    files = []
+    for name in os.listdir(CACHE_DIR):
+        if name.endswith(CACHE_EXTENSION):
+            try:
+                st = os.stat(os.path.join(CACHE_DIR, name))
+            except OSError:
+                continue
+            files.append((st.st_mtime, st.st_size, os.path.join(CACHE_DIR, name)))
+    return sorted(files)
+
+
+def get_size():
+    return sum([size for (mtime, size, filename) in get_files()])
+
+
+def evict():
+    '''
+    Removes the least recently used hyperslabs until the cache is smaller than ICCLIM_REMOTE_CACHE_MBYTES.
+    '''
+    global _size
+
+    files = get_files()
+    _size = sum([size for (mtime, size, filename) in files])
+    max_bytes = get_max_bytes()
+    for (mtime, size, filename) in files:
+        if _size <= max_bytes:
+            break
+        try:
+            os.remove(filename)
+        except OSError: # removed by another process
+            pass
+        _size -= size
+
+
+def log_summary():
+    '''
+    Logs the number of hyperslabs read from the cache and from the server in the current process since the last summary.
+    '''
+    global nb_hits, nb_misses
+
+    if enabled() and nb_hits + nb_misses > 0:
+        logging.info("Remote cache: %s hyperslab(s) read from %s, %s from the server.", nb_hits, CACHE_DIR, nb_misses)
+    nb_hits = 0
+    nb_misses = 0
@@ -0,0 +1,250 @@
+#  Copyright CERFACS (http://cerfacs.fr/)
+#  Apache License, Version 2.0 (http://www.apache.org/licenses/LICENSE-2.0)
+
+'''
+Concurrent reader of remote (OPeNDAP) datasets.
+
+The read of a tile is split into requests smaller than a size limit (e.g. the THREDDS limit, see ``transfer_limit_Mbytes``):
+blocks of time steps, and bands of rows if one time step is bigger than the limit.
+Requests are sent by a bounded pool of worker processes (threads are not used, see mf_reader.py),
+a failed request is retried with exponential backoff, and values are copied into the tile arrays as they arrive
+(see mf_reader.MultiFileVariable.read_into).
+
+The function sending one request (``fetch``) can be replaced, e.g. to read from a local stand-in server
+and measure the throughput at different numbers of connections (see scripts_examples/benchmark_remote.py).
+'''
+
+import logging
+import itertools
+import multiprocessing
+import time
+import numpy
+
+import mf_reader
+import remote_cache
+from ..icclim_exceptions import *
+
+
+# number of retries of a failed request
+MAX_RETRIES = 3
+
+# waiting time before the first retry (doubled at each retry)
+BACKOFF_SECONDS = 0.5
+
+
+def fetch_opendap(url, var_name, key):
+    '''
+    Reads ``var_name[key]`` from an OPeNDAP dataset (or a local file), kept open by the current process.
+
+    :param url: OPeNDAP URL or file
+    :type url: str
+
+    :param var_name: variable name
+    :type var_name: str
+
+    :param key: indices of all dimensions (slices and integers)
+    :type key: tuple
+
+    :rtype: numpy.ma.MaskedArray
+    '''
+
+    try:
+        return mf_reader.get_worker_dataset(url).variables[var_name][key]
+    except Exception:
+        # the connection is opened again at the next try
+        mf_reader.close_worker_dataset(url)
+        raise
+
+
+def fetch_with_retry(args):
+    '''
+    Sends one request, retrying with exponential backoff if it fails (see RemoteReader.read).
+    Errors are returned as messages, because exceptions can not always be pickled back to the parent process.
+
+    :param args: (request number, fetch, url, var_name, key, max_retries, backoff_seconds)
+    :type args: tuple
+
+    :rtype: tuple (request number, values or error message, number of retries, True if the values were in the remote cache)
+    '''
+
+    (i, fetch, url, var_name, key, max_retries, backoff_seconds) = args
+
+    nb_retries = 0
+    nb_hits = remote_cache.nb_hits
+    while True:
+        try:
+            # the request is not sent if its values are in the remote cache (see remote_cache.py)
+            arr = remote_cache.read(url, var_name, key, lambda: fetch(url, var_name, key))
+            return (i, arr, nb_retries, remote_cache.nb_hits > nb_hits)
+        except Exception as e:
+            if nb_retries >= max_retries:
+                return (i, "Failed to read dataset " + url + " after " + str(nb_retries + 1) + " tries: " + repr(e), nb_retries, False)
+            time.sleep(backoff_seconds * 2**nb_retries)
+            nb_retries += 1
+
+
+def split_request(key, agg_axis, start, stop, shape, itemsize, max_request_bytes):
+    '''
+    Splits the read of the range [start, stop) of the aggregation dimension (other dimensions: ``key``) into requests
+    of at most ``max_request_bytes``: blocks of time steps, and bands along the first other sliced dimension (e.g. rows)
+    if one time step is bigger than the limit.
+
+    :param key: indices of the other dimensions (slices and integers; the index of the aggregation dimension is ignored)
+    :type key: tuple
+
+    :param agg_axis: aggregation dimension
+    :type agg_axis: int
+
+    :param shape: shape of the variable
+    :type shape: tuple
+
+    :param itemsize: size of one value in bytes
+    :type itemsize: int
+
+    :param max_request_bytes: maximum size of one request in bytes
+    :type max_request_bytes: int
+
+    :rtype: list of tuples (key of the request, key of its values in the values of the range [start, stop))
+    '''
+
+    out_dims = [d for d in range(len(key)) if d == agg_axis or not isinstance(key[d], (int, long, numpy.integer))]
+
+    def get_request(t1, t2, split_dim=None, b1=None, b2=None):
+        req_key = list(key)
+        req_key[agg_axis] = slice(t1, t2)
+        out_key = [slice(None)] * len(out_dims)
+        out_key[out_dims.index(agg_axis)] = slice(t1 - start, t2 - start)
+        if split_dim is not None:
+            (first, last, step) = key[split_dim].indices(shape[split_dim])
+            req_key[split_dim] = slice(first + b1, first + b2)
+            out_key[out_dims.index(split_dim)] = slice(b1, b2)
+        return (tuple(req_key), tuple(out_key))
+
+    # bytes of one time step, and dimensions which can be split
+    step_bytes = itemsize
+    split_dims = []
+    for d in out_dims:
+        if d == agg_axis:
+            continue
+        if not isinstance(key[d], slice) or key[d].indices(shape[d])[2] != 1:
+            # not a slice of step 1: the range is read by one request
+            return [get_request(start, stop)]
+        step_bytes *= len(xrange(*key[d].indices(shape[d])))
+        split_dims.append(d)
+
+    if step_bytes <= max_request_bytes or len(split_dims) == 0:
+        nb_steps = max(1, int(max_request_bytes // step_bytes))
+        return [get_request(t1, min(t1 + nb_steps, stop)) for t1 in xrange(start, stop, nb_steps)]
+
+    split_dim = split_dims[0]
+    n = len(xrange(*key[split_dim].indices(shape[split_dim])))
+    band_size = max(1, int(max_request_bytes // (step_bytes // n)))
+    return [get_request(t, t + 1, split_dim, b1, min(b1 + band_size, n)) for t in xrange(start, stop) for b1 in xrange(0, n, band_size)]
+
+
+class RemoteReader(object):
+
+    def __init__(self, nb_connections=1, max_request_Mbytes=None, max_retries=MAX_RETRIES, backoff_seconds=BACKOFF_SECONDS, fetch=fetch_opendap):
+        '''
+        :param nb_connections: number of requests sent at the same time (default: 1)
+        :type nb_connections: int
+
+        :param max_request_Mbytes: maximum size of one request in Mbytes
+                                   (default: None, each read is split into ``nb_connections`` requests)
+        :type max_request_Mbytes: float
+
+        :param max_retries: number of retries of a failed request (default: MAX_RETRIES)
+        :type max_retries: int
+
+        :param backoff_seconds: waiting time before the first retry, doubled at each retry (default: BACKOFF_SECONDS)
+        :type backoff_seconds: float
+
+        :param fetch: function sending one request: fetch(url, var_name, key), must be a module-level function
+                      (it is sent to the worker processes) (default: fetch_opendap)
+        :type fetch: function
+        '''
+        self.nb_connections = nb_connections
+        self.max_request_Mbytes = max_request_Mbytes
+        self.max_retries = max_retries
+        self.backoff_seconds = backoff_seconds
+        self.fetch = fetch
+
+        self.pool = None
+        if nb_connections > 1:
+            try:
+                self.pool = multiprocessing.Pool(nb_connections)
+            except (OSError, ImportError):
+                logging.warning("Failed to start worker processes, remote requests are sent one after another.")
+
+        self.nb_requests = 0
+        self.nb_retries = 0
+        self.nb_cached = 0
+        self.nb_bytes = 0
+        self.seconds = 0.
+
+
+    def split(self, key, agg_axis, runs, shape, itemsize):
+        '''
+        Splits reads of ranges of the aggregation dimension into requests (see split_request).
+
+        :param runs: ranges [start, stop) to read
+        :type runs: list of tuples (start, stop)
+
+        :rtype: list of lists of tuples (key of the request, key of its values in the values of the range)
+        '''
+
+        if self.max_request_Mbytes is not None:
+            max_request_bytes = self.max_request_Mbytes * 1024 * 1024
+        else:
+            nb_bytes = sum([stop - start for (start, stop) in runs]) * itemsize
+            for d in range(len(key)):
+                if d != agg_axis and isinstance(key[d], slice):
+                    nb_bytes *= len(xrange(*key[d].indices(shape[d])))
+            max_request_bytes = max(itemsize, nb_bytes // self.nb_connections)
+
+        return [split_request(key, agg_axis, start, stop, shape, itemsize, max_request_bytes) for (start, stop) in runs]
+
+
+    def read(self, requests):
+        '''
+        Sends requests (at most ``nb_connections`` at the same time) and returns their values as they arrive.
+
+        :param requests: requests
+        :type requests: list of tuples (url, var_name, key)
+
+        :rtype: iterator of tuples (request number, values)
+        '''
+
+        args = [(i, self.fetch, url, var_name, key, self.max_retries, self.backoff_seconds) for (i, (url, var_name, key)) in enumerate(requests)]
+
+        if self.pool is not None and len(args) > 1:
+            results = self.pool.imap_unordered(fetch_with_retry, args)
+        else:
+            results = itertools.imap(fetch_with_retry, args)
+
+        t0 = time.time()
+        for (i, arr, nb_retries, cached) in results:
+            self.nb_requests += 1
+            self.nb_retries += nb_retries
+            self.nb_cached += cached
+            if isinstance(arr, str): # error message
+                raise MissingIcclimInputError(arr)
+            self.nb_bytes += numpy.ma.getdata(arr).nbytes
+            yield (i, arr)
+        self.seconds += time.time() - t0
+
+
+    def close(self):
+        '''
+        Stops the worker processes and logs the number of requests and the throughput.
+        '''
+
+        if self.pool is not None:
+            self.pool.close()
+            self.pool.join()
+            self.pool = None
+
+        if self.nb_requests > 0:
+            Mbytes = self.nb_bytes / (1024. * 1024.)
+            logging.info("Remote reads: %s request(s) (%s retry(ies), %s read from the remote cache), %.1f Mbytes in %.1f s (%.1f Mbytes/s).",
+                         self.nb_requests, self.nb_retries, self.nb_cached, Mbytes, self.seconds, Mbytes / max(self.seconds, 1e-6))
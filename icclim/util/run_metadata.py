@@ -0,0 +1,176 @@
+#  Copyright CERFACS (http://cerfacs.fr/)
+#  Apache License, Version 2.0 (http://www.apache.org/licenses/LICENSE-2.0)
+
+'''
+Metadata of all input files of one run (one call of icclim.indice), collected in one pass.
+
+The catalog entries of the files of all target variables are requested at once (see catalog.py: files missing from
+the catalog are scanned concurrently, the others are not opened at all). Later stages read dimensions, unlimited dimension,
+fill values, calendars, units, shapes, chunking and the decoded time axis from this object instead of reopening files.
+The time axis of a list of files is decoded once per run, and the time steps selected by a time range (and the removal of
+Feb 29th) are computed once per run and shared by all tiles and target variables.
+At the end of the run, the number of file opens and of file opens saved (metadata served without opening the file) is logged.
+'''
+
+import logging
+import numpy
+from collections import OrderedDict
+
+import catalog
+import shm_cache
+import util_dt
+import util_nc
+
+
+class RunMetadata(object):
+
+    def __init__(self, vars_in_files, temporal_var_name='time', lev_dim_pos=1):
+        '''
+        :param vars_in_files: input files of each target variable
+        :type vars_in_files: OrderedDict {var_name: list of files}
+
+        :param temporal_var_name: name of temporal variable (default: "time")
+        :type temporal_var_name: str
+
+        :param lev_dim_pos: position of the level dimension for 4D variables (default: 1)
+        :type lev_dim_pos: int
+        '''
+        self.vars_in_files = vars_in_files
+        self.temporal_var_name = temporal_var_name
+
+        self.nb_scanned = catalog.nb_scanned
+        self.nb_served = catalog.nb_served
+
+        # one pass over all files of all target variables
+        all_files = []
+        for v in vars_in_files:
+            for ifile in vars_in_files[v]:
+                if ifile not in all_files:
+                    all_files.append(ifile)
+        self.entries = catalog.get_entries(all_files, temporal_var_name=temporal_var_name)
+
+        self.vars = OrderedDict()
+        for v in vars_in_files:
+            self.vars[v] = self.get_var_metadata(v, lev_dim_pos=lev_dim_pos)
+
+        self.time_axes = {}
+        self.time_subsets = {}
+
+
+    def get_var_metadata(self, v, files=None, lev_dim_pos=1):
+        '''
+        Returns metadata of a target variable (taken from its first file).
+        
+        :param v: target variable
+        :type v: str
+        
+        :param files: files of the variable to describe (default: all input files of the variable)
+        :type files: list of str
+
+        :rtype: dict with keys: 'dimensions', 'shape' (number of time steps summed over all files), 'dtype', 'chunking',
+                'attributes', 'fill_value' (float32), 'units', 'unlimited_dim', 'time_calendar', 'time_units'
+        '''
+        if files is None:
+            files = self.vars_in_files[v]
+        entries = catalog.get_entries(files, temporal_var_name=self.temporal_var_name).values()
+        entry = entries[0]
+        var_entry = entry['variables'][v]
+
+        if len(var_entry['dimensions']) == 4 and lev_dim_pos == 0:
+            index_time = 1
+        else:
+            index_time = 0
+
+        shape = list(var_entry['shape'])
+        shape[index_time] = sum([e['variables'][v]['shape'][index_time] for e in entries])
+
+        attributes = var_entry['attributes']
+
+        return {'dimensions': var_entry['dimensions'],
+                'shape': shape,
+                'dtype': var_entry['dtype'],
+                'chunking': var_entry['chunking'],
+                'attributes': attributes,
+                'fill_value': numpy.float32(attributes['_FillValue']) if '_FillValue' in attributes else None,
+                'units': attributes.get('units'),
+                'unlimited_dim': entry['unlimited_dims'][0] if len(entry['unlimited_dims']) > 0 else None,
+                'time_calendar': entry['calendar'],
+                'time_units': entry['units']}
+
+
+    def get_time_axis(self, files):
+        '''
+        Returns the decoded time axis of files (in the given order), decoded once per run.
+        Numerical dates and date fields are shared with concurrent runs if the shared memory cache is enabled (see shm_cache.py),
+        datetime objects are decoded in each process.
+
+        :rtype: tuple (dt_arr, year_arr, month_arr, day_arr, dayofyear_arr) (see util_dt.decode_time_axis)
+        '''
+        key = tuple(files)
+        if key not in self.time_axes:
+            entry = catalog.get_entry(files[0], temporal_var_name=self.temporal_var_name)
+            def read():
+                entries = catalog.get_entries(files, temporal_var_name=self.temporal_var_name).values()
+                time_arr = numpy.ma.getdata(numpy.concatenate([catalog.get_time_values(e) for e in entries]))
+                return (time_arr,) + util_dt.get_date_fields_arr(time_arr, entry['calendar'], entry['units'])
+            (time_arr, year_arr, month_arr, day_arr, dayofyear_arr) = shm_cache.read_arrays(files, ('time_axis', self.temporal_var_name), read)
+            dt_arr = numpy.array(util_dt.get_utime(entry['units'], entry['calendar']).num2date(time_arr), ndmin=1)
+            self.time_axes[key] = (dt_arr, year_arr, month_arr, day_arr, dayofyear_arr)
+        return self.time_axes[key]
+
+
+    def get_dt_arr_and_indices(self, files, time_range=None, ignore_Feb29th=False):
+        '''
+        Returns the time steps of files (in the given order) selected by ``time_range``, computed once per run
+        (see util_nc.get_dt_arr_and_indices).
+
+        :rtype: tuple (dt_arr, indices)
+        '''
+        key = (tuple(files), str(time_range), ignore_Feb29th)
+        if key not in self.time_subsets:
+            calend = catalog.get_entry(files[0], temporal_var_name=self.temporal_var_name)['calendar']
+            self.time_subsets[key] = util_nc.get_dt_arr_and_indices_from_time_axis(self.get_time_axis(files), calend, 
+                                                                                   time_range=time_range, 
+                                                                                   ignore_Feb29th=ignore_Feb29th)
+        return self.time_subsets[key]
+
+
+    def get_union_dt_arrs_and_indices(self, files, time_range, files_base, base_period_time_range, ignore_Feb29th=False):
+        '''
+        Returns the time steps of the union of the study period and the base period, so that time steps shared 
+        by both periods are read once. Files of both periods are merged in chronological order.
+
+        :rtype: tuple (union_files, indices_union, (dt_arr, pos), (dt_arr_base, pos_base)):
+                union_files: files to read (list of str),
+                indices_union: time steps to read in union_files (numpy.ndarray of int),
+                dt_arr, dt_arr_base: dates of the study and the base period,
+                pos, pos_base: positions of the study and the base period in the values read (slice if contiguous, else numpy.ndarray of int)
+        '''
+        entries = catalog.get_entries(list(files) + [f for f in files_base if f not in files], temporal_var_name=self.temporal_var_name)
+        union_files = sorted(entries.keys(), key=lambda f: entries[f]['time_first'])
+
+        (dt_arr, indices) = self.get_dt_arr_and_indices(union_files, time_range=time_range, ignore_Feb29th=ignore_Feb29th)
+        (dt_arr_base, indices_base) = self.get_dt_arr_and_indices(union_files, time_range=base_period_time_range, ignore_Feb29th=ignore_Feb29th)
+
+        indices_union = numpy.union1d(indices, indices_base)
+
+        return (union_files, indices_union, (dt_arr, get_positions(indices_union, indices)), (dt_arr_base, get_positions(indices_union, indices_base)))
+
+
+    def log_summary(self):
+        '''
+        Logs the number of files opened to collect metadata and the number of file opens saved during the run.
+        '''
+        logging.info("Metadata: %s file(s) opened, %s file open(s) saved.",
+                     catalog.nb_scanned - self.nb_scanned, catalog.nb_served - self.nb_served)
+
+
+def get_positions(indices_union, indices):
+    '''
+    Returns the positions of ``indices`` in ``indices_union`` (both sorted): 
+    a slice if they are contiguous (the values are then a view of the values read), else an array of positions.
+    '''
+    pos = numpy.searchsorted(indices_union, indices)
+    if len(pos) > 0 and pos[-1] - pos[0] == len(pos) - 1:
+        return slice(int(pos[0]), int(pos[-1]) + 1)
+    return pos
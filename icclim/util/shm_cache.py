@@ -0,0 +1,385 @@
+#  Copyright CERFACS (http://cerfacs.fr/)
+#  Apache License, Version 2.0 (http://www.apache.org/licenses/LICENSE-2.0)
+
+'''
+Node-local cache of decoded tiles and time axes, shared by concurrent runs (processes) on the same node.
+
+Values of a tile, as read and converted by util_nc.get_values_arr, are stored in a shared memory directory (e.g. /dev/shm/icclim),
+keyed by the fingerprint of the input files (paths, sizes and modification times) and by the slice read (variable, time steps,
+rows and columns, conversion): another process reading the same tile maps the stored arrays (copy-on-write) instead of reading
+and decoding the files again, so that all processes share the same memory pages.
+Time axes (numerical dates and date fields, see run_metadata.py) are stored as well.
+
+The cache is enabled by the environment variable ICCLIM_SHM_CACHE_DIR (default: empty, no cache), which should be on a memory
+file system (e.g. /dev/shm/icclim). Its size is limited by ICCLIM_SHM_CACHE_MBYTES (default: MAX_CACHE_MBYTES): the least recently
+used entries are removed to make room for new ones, except entries in use. An entry is in use while a process which mapped it
+holds a reference on it (a file "<entry>.<pid>.ref", removed by ``release`` at the end of the run, or ignored once the process
+has terminated). If there is no room left, values are not stored.
+
+Entries are written atomically (temporary files renamed, the header last), so concurrent processes can add the same entry.
+In-memory datasets (see stores.py) are not cached.
+
+Entries contain only plain data: headers are JSON files and arrays are .npy files of numbers or booleans, loaded without
+unpickling (an entry containing objects is ignored). The cache directory is created with mode 0700, and it is not used
+(with a warning) if it is not a directory owned by the current user, or if other users can write in it.
+'''
+
+import os
+import errno
+import hashlib
+import logging
+import json
+import stat
+import numpy
+
+import catalog
+import stores
+
+
+CACHE_DIR = os.environ.get('ICCLIM_SHM_CACHE_DIR', '')
+
+MAX_CACHE_MBYTES = 2048
+
+HEADER_EXTENSION = '.json'
+REF_EXTENSION = '.ref'
+
+# result of check_dir: None if not checked yet
+_dir_ok = None
+
+# entries referenced by the current process
+_refs = set()
+
+# number of entries mapped from the cache and added to the cache, in the current process (since the last summary)
+nb_hits = 0
+nb_misses = 0
+
+
+def enabled():
+    return bool(CACHE_DIR) and check_dir()
+
+
+def check_dir():
+    '''
+    Creates the cache directory (mode 0700) if it does not exist, and checks that it is owned by the current user
+    and that other users can not write in it. The result is kept.
+
+    :rtype: bool (True if the directory can be used)
+    '''
+    global _dir_ok
+
+    if _dir_ok is None:
+        try:
+            if not os.path.isdir(CACHE_DIR):
+                os.makedirs(CACHE_DIR, 0700)
+            st = os.lstat(CACHE_DIR)
+            _dir_ok = stat.S_ISDIR(st.st_mode) and st.st_uid == os.getuid() and not (st.st_mode & (stat.S_IWGRP | stat.S_IWOTH))
+            if not _dir_ok:
+                logging.warning("Shared memory cache %s is not used: it must be a directory owned by the current user, not writable by other users.", CACHE_DIR)
+        except OSError:
+            logging.warning("Shared memory cache %s can not be created, it is not used.", CACHE_DIR)
+            _dir_ok = False
+    return _dir_ok
+
+
+def get_max_bytes():
+    return float(os.environ.get('ICCLIM_SHM_CACHE_MBYTES', MAX_CACHE_MBYTES)) * 1024 * 1024
+
+
+def get_name(kind, files, key):
+    '''
+    Returns the name of an entry, or None if it can not be shared (in-memory dataset).
+
+    :param kind: kind of entry (e.g. "tile" or "arrays")
+    :type kind: str
+
+    :param files: input files
+    :type files: list of str
+
+    :param key: slice read: numbers, strings, slices, arrays (e.g. indices of time steps) or None
+    :type key: tuple
+    '''
+    items = [kind]
+    for ifile in files:
+        if stores.is_memory(ifile):
+            return None
+        (size, mtime) = catalog.get_file_stat(ifile)
+        items.append('%s|%s|%s' % (catalog.get_key(ifile), size, mtime))
+    for k in key:
+        if isinstance(k, numpy.ndarray):
+            items.append(str(k.dtype) + str(k.shape) + hashlib.sha1(numpy.ascontiguousarray(k).tostring()).hexdigest())
+        else:
+            items.append(repr(k))
+    name = '\n'.join(items)
+    return hashlib.sha1(name if isinstance(name, str) else name.encode('utf-8')).hexdigest()
+
+
+def get_path(name, suffix):
+    return os.path.join(CACHE_DIR, name + suffix)
+
+
+def read_array(files, key, read_values):
+    '''
+    Returns values of a tile from the cache (mapped, copy-on-write), or reads them with ``read_values`` and adds them to the cache.
+
+    :param files: input files of the values
+    :type files: list of str
+
+    :param key: slice read (see get_name)
+    :type key: tuple
+
+    :param read_values: function reading the values: read_values()
+    :type read_values: function
+
+    :rtype: numpy.ma.MaskedArray
+    '''
+    global nb_hits, nb_misses
+
+    name = get_name('tile', files, key) if enabled() else None
+    if name is None:
+        return read_values()
+
+    arr = load(name)
+    if arr is not None:
+        nb_hits += 1
+        return arr
+
+    nb_misses += 1
+    arr = read_values()
+    if save(name, arr):
+        # the values read are replaced by the stored ones, so that their memory is shared
+        stored = load(name)
+        if stored is not None:
+            return stored
+    return arr
+
+
+def read_arrays(files, key, compute):
+    '''
+    Returns arrays (e.g. a time axis) from the cache, or computes them with ``compute`` and adds them to the cache.
+    The arrays are loaded into the memory of the process (they are not mapped).
+
+    :param files: input files of the arrays
+    :type files: list of str
+
+    :param key: description of the arrays (see get_name)
+    :type key: tuple
+
+    :param compute: function computing the arrays: compute(), arrays of numbers or booleans
+    :type compute: function
+
+    :rtype: tuple of numpy.ndarray
+    '''
+    global nb_hits, nb_misses
+
+    name = get_name('arrays', files, key) if enabled() else None
+    if name is None:
+        return compute()
+
+    header = load_header(name)
+    if header is not None and 'nb_arrays' in header:
+        try:
+            arrays = tuple([numpy.load(get_path(name, '.%d.npy' % k), allow_pickle=False) for k in range(header['nb_arrays'])])
+            nb_hits += 1
+            return arrays
+        except (IOError, ValueError): # removed by another process
+            pass
+
+    nb_misses += 1
+    arrays = tuple([numpy.asarray(a) for a in compute()])
+    if any([a.dtype.hasobject for a in arrays]):
+        return arrays
+    header = json.dumps({'nb_arrays': len(arrays)})
+    if make_room(len(header) + sum([a.nbytes for a in arrays])):
+        write(name, header, [('.%d.npy' % k, a) for (k, a) in enumerate(arrays)])
+    return arrays
+
+
+def load_header(name):
+    try:
+        with open(get_path(name, HEADER_EXTENSION), 'rb') as f:
+            header = json.load(f)
+    except (IOError, ValueError):
+        return None
+    if not isinstance(header, dict):
+        return None
+    # the entry becomes the most recently used
+    try:
+        os.utime(get_path(name, HEADER_EXTENSION), None)
+    except OSError:
+        pass
+    return header
+
+
+def load(name):
+    '''
+    Maps the arrays of an entry (a reference on the entry is taken before, see ``release``).
+    '''
+    header = load_header(name)
+    if header is None or 'shape' not in header:
+        return None
+    add_ref(name)
+    try:
+        data = numpy.load(get_path(name, '.data.npy'), mmap_mode='c', allow_pickle=False)
+        if header['masked']:
+            mask = numpy.load(get_path(name, '.mask.npy'), mmap_mode='c', allow_pickle=False)
+        else:
+            mask = numpy.zeros(header['shape'], dtype=bool)
+    except (IOError, ValueError, KeyError): # removed by another process
+        return None
+    return numpy.ma.array(data, mask=mask, fill_value=header['fill_value'], copy=False)
+
+
+def save(name, arr):
+    '''
+    Adds the values of a tile to the cache if there is room for them.
+
+    :rtype: bool (True if the values were added)
+    '''
+    data = numpy.ma.getdata(arr)
+    mask = numpy.ma.getmaskarray(arr)
+    masked = bool(mask.any())
+
+    if data.dtype.hasobject:
+        return False
+    fill_value = arr.fill_value if isinstance(arr, numpy.ma.MaskedArray) else None
+    header = json.dumps({'shape': data.shape,
+                         'masked': masked,
+                         'fill_value': fill_value.item() if isinstance(fill_value, numpy.generic) else fill_value})
+    arrays = [('.data.npy', data)]
+    if masked:
+        arrays.append(('.mask.npy', mask))
+
+    if not make_room(len(header) + sum([a.nbytes for (suffix, a) in arrays])):
+        return False
+    return write(name, header, arrays)
+
+
+def write(name, header, arrays):
+    '''
+    Writes the arrays of an entry, then its header (JSON), so that an entry is complete once its header exists.
+    '''
+    try:
+        if not os.path.isdir(CACHE_DIR):
+            os.makedirs(CACHE_DIR, 0700)
+        for (suffix, arr) in arrays:
+            tmp_file = get_path(name, suffix) + '.' + str(os.getpid()) + '.tmp'
+            with open(tmp_file, 'wb') as f:
+                numpy.save(f, arr)
+            os.rename(tmp_file, get_path(name, suffix))
+        tmp_file = get_path(name, HEADER_EXTENSION) + '.' + str(os.getpid()) + '.tmp'
+        with open(tmp_file, 'wb') as f:
+            f.write(header)
+        os.rename(tmp_file, get_path(name, HEADER_EXTENSION))
+    except (IOError, OSError):
+        logging.warning("Failed to write in the shared memory cache %s.", CACHE_DIR)
+        return False
+    return True
+
+
+def add_ref(name):
+    if name in _refs:
+        return
+    try:
+        if not os.path.isdir(CACHE_DIR):
+            os.makedirs(CACHE_DIR, 0700)
+        open(get_path(name, '.' + str(os.getpid()) + REF_EXTENSION), 'w').close()
+        _refs.add(name)
+    except (IOError, OSError):
+        pass
+
+
+def release():
+    '''
+    Releases the references of the current process: its entries can be removed when there is no room left.
+    Values already mapped remain valid.
+    '''
+    for name in list(_refs):
+        try:
+            os.remove(get_path(name, '.' + str(os.getpid()) + REF_EXTENSION))
+        except OSError:
+            pass
+        _refs.discard(name)
+
+
+def is_alive(pid):
+    try:
+        os.kill(pid, 0)
+    except OSError as e:
+        return e.errno == errno.EPERM
+    return True
+
+
+def get_entries():
+    '''
+    Returns entries of the cache: list of (mtime, size, name, in use), least recently used first.
+    References of terminated processes are removed.
+    '''
+    sizes = {}
+    mtimes = {}
+    in_use = set()
+    for filename in os.listdir(CACHE_DIR):
+        name = filename.split('.')[0]
+        path = os.path.join(CACHE_DIR, filename)
+        if filename.endswith(REF_EXTENSION):
+            pid = int(filename.split('.')[1])
+            if is_alive(pid):
+                in_use.add(name)
+            else:
+                try:
+                    os.remove(path)
+                except OSError:
+                    pass
+            continue
+        if filename.endswith('.tmp'):
+            continue
+        try:
+            st = os.stat(path)
+        except OSError:
+            continue
+        sizes[name] = sizes.get(name, 0) + st.st_size
+        if filename.endswith(HEADER_EXTENSION):
+            mtimes[name] = st.st_mtime
+    return sorted([(mtimes.get(name, 0), sizes[name], name, name in in_use) for name in sizes])
+
+
+def make_room(nb_bytes):
+    '''
+    Removes the least recently used entries which are not in use until ``nb_bytes`` more fit in ICCLIM_SHM_CACHE_MBYTES.
+
+    :rtype: bool (True if there is room for ``nb_bytes``)
+    '''
+    max_bytes = get_max_bytes()
+    if nb_bytes > max_bytes:
+        return False
+    if not os.path.isdir(CACHE_DIR):
+        return True
+
+    entries = get_entries()
+    size = sum([entry_size for (mtime, entry_size, name, in_use) in entries])
+    for (mtime, entry_size, name, in_use) in entries:
+        if size + nb_bytes <= max_bytes:
+            break
+        if in_use:
+            continue
+        # the header first: the entry can not be mapped anymore (mapped values remain valid), then its arrays
+        paths = [os.path.join(CACHE_DIR, filename) for filename in os.listdir(CACHE_DIR) 
+                 if filename.startswith(name + '.') and not filename.endswith(REF_EXTENSION) and not filename.endswith('.tmp')]
+        for path in sorted(paths, key=lambda path: not path.endswith(HEADER_EXTENSION)):
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+        size -= entry_size
+    return size + nb_bytes <= max_bytes
+
+
+def log_summary():
+    '''
+    Logs the number of entries taken from the cache and added to it in the current process since the last summary.
+    '''
+    global nb_hits, nb_misses
+
+    if enabled() and nb_hits + nb_misses > 0:
+        logging.info("Shared memory cache: %s entry(ies) taken from %s, %s read.", nb_hits, CACHE_DIR, nb_misses)
+    nb_hits = 0
+    nb_misses = 0
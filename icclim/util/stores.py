@@ -0,0 +1,509 @@
+#  Copyright CERFACS (http://cerfacs.fr/)
+#  Apache License, Version 2.0 (http://www.apache.org/licenses/LICENSE-2.0)
+
+'''
+Readers of input stores.
+
+An input "file" can be:
+    - a netCDF file or an OPeNDAP URL (read with netCDF4.Dataset),
+    - an array store: a JSON sidecar (``*.json``) describing variables stored as memory-mapped ``.npy`` or raw binary files,
+    - a chunked store: a directory containing a JSON sidecar (STORE_FILENAME) and, for each chunked variable,
+      a subdirectory with one ``.npy`` file per chunk (named after the chunk indices, e.g. ``0.2.1.npy``),
+      or one compressed ``.npz`` file per chunk (e.g. packed inputs, see pack.py),
+    - an in-memory dataset: arrays registered with ``add_memory_dataset`` under a name starting with MEMORY_PREFIX
+      (see icclim.indice_from_arrays).
+
+Stores are read with the same interface as netCDF4.Dataset (``dimensions``, ``variables``, ``close``; variables have
+``dimensions``, ``shape``, ``dtype``, ``ncattrs``, ``getncattr``, ``chunking`` and attributes as Python attributes),
+so the file catalog, the file pool and the readers of tiles (see catalog.py, nc_pool.py, mf_reader.py) do not depend on the format.
+Values of array stores are memory-mapped (copy-on-write): reading a range of time steps does not copy the values,
+and converting them in place (see util_nc.convert_values_arr) does not modify the store.
+
+Sidecar (same format for both stores)::
+
+    {"icclim_store": 1,
+     "unlimited_dimensions": ["time"],
+     "variables": {
+         "time":   {"dimensions": ["time"], "shape": [3650], "dtype": "<f8", "file": "time.npy",
+                    "attributes": {"units": "days since 1950-01-01", "calendar": "gregorian"}},
+         "tasmax": {"dimensions": ["time", "lat", "lon"], "shape": [3650, 100, 100], "dtype": "<f4", "file": "tasmax.raw",
+                    "attributes": {"_FillValue": 1e+20, "units": "K"}},
+         ...}}
+
+A variable is stored in ``file`` (``.npy``, or raw binary of ``dtype`` and ``shape`` in C order), relative to the sidecar,
+or in chunks of shape ``chunks`` (chunked store, missing chunks are filled with _FillValue).
+Chunks are compressed if ``compression`` is "zlib", and stored with their first dimension last if ``chunk_order`` is
+"pixel_major" (e.g. (lat, lon, time): the time series of each pixel is contiguous).
+Decompressed chunks are kept in a chunk cache (see ``set_var_chunk_cache``), so a chunk read by several reads of a tile
+is decompressed only once.
+Stores can be written from a netCDF file with ``write_store``.
+'''
+
+import os
+import json
+import itertools
+import numpy
+from collections import OrderedDict
+from netCDF4 import Dataset
+
+import catalog
+from ..icclim_exceptions import *
+
+
+STORE_VERSION = 1
+
+# sidecar of a chunked store (directory)
+STORE_FILENAME = 'store.json'
+
+# default size of the chunk cache of a variable (decompressed chunks)
+CHUNK_CACHE_BYTES = 16 * 1024 * 1024
+
+# names of in-memory datasets
+MEMORY_PREFIX = 'memory:'
+
+# in-memory datasets of the current process: {name: MemoryStore}
+_memory_datasets = {}
+
+# number of in-memory datasets added in the current process (names are never reused)
+_nb_memory_datasets = 0
+
+
+def is_memory(ifile):
+    return ifile.startswith(MEMORY_PREFIX)
+
+
+def get_sidecar(ifile):
+    '''
+    Returns the JSON sidecar of an array or chunked store, None for a netCDF file or an OPeNDAP URL.
+    '''
+    if '://' in ifile or is_memory(ifile):
+        return None
+    if os.path.isdir(ifile) and os.path.isfile(os.path.join(ifile, STORE_FILENAME)):
+        return os.path.join(ifile, STORE_FILENAME)
+    if ifile.endswith('.json'):
+        return ifile
+    return None
+
+
+def open_dataset(ifile):
+    '''
+    Opens a netCDF file, an OPeNDAP URL or a store.
+
+    :param ifile: netCDF file, OPeNDAP URL, JSON sidecar of an array store, directory of a chunked store or name of an in-memory dataset
+    :type ifile: str
+
+    :rtype: netCDF4.Dataset or Store
+    '''
+    if is_memory(ifile):
+        if ifile not in _memory_datasets:
+            raise IOError("Unknown in-memory dataset: " + ifile)
+        return _memory_datasets[ifile]
+    sidecar = get_sidecar(ifile)
+    if sidecar is None:
+        return Dataset(ifile, 'r')
+    return Store(sidecar)
+
+
+class StoreDimension(object):
+
+    def __init__(self, name, size, unlimited):
+        self.name = name
+        self.size = size
+        self.unlimited = unlimited
+
+    def __len__(self):
+        return self.size
+
+    def isunlimited(self):
+        return self.unlimited
+
+
+class Store(object):
+    '''
+    Array or chunked store, read as a netCDF4.Dataset.
+    '''
+
+    def __init__(self, sidecar):
+        '''
+        :param sidecar: JSON sidecar of the store
+        :type sidecar: str
+        '''
+        try:
+            with open(sidecar, 'r') as f:
+                meta = json.load(f, object_pairs_hook=OrderedDict)
+        except (IOError, ValueError):
+            raise IOError("Failed to read store sidecar: " + sidecar)
+        if meta.get('icclim_store') != STORE_VERSION:
+            raise IOError("Unknown store format: " + sidecar)
+
+        self.path = sidecar
+        self.dirname = os.path.dirname(sidecar)
+
+        self.variables = OrderedDict()
+        for (var_name, var_meta) in meta['variables'].items():
+            self.variables[str(var_name)] = StoreVariable(self, str(var_name), var_meta)
+
+        self.set_dimensions(meta.get('unlimited_dimensions', []))
+
+    def set_dimensions(self, unlimited_dimensions):
+        self.dimensions = OrderedDict()
+        for var in self.variables.values():
+            for (dim, size) in zip(var.dimensions, var.shape):
+                if dim not in self.dimensions:
+                    self.dimensions[dim] = StoreDimension(dim, size, dim in unlimited_dimensions)
+
+    def ncattrs(self):
+        return []
+
+    def close(self):
+        for var in self.variables.values():
+            var.close()
+
+
+class MemoryStore(Store):
+    '''
+    In-memory dataset (see add_memory_dataset), read as a netCDF4.Dataset.
+    '''
+
+    def __init__(self, name, variables, unlimited_dimensions):
+        '''
+        :param name: name of the dataset
+        :type name: str
+
+        :param variables: variables: {var_name: (dimensions, values, attributes)}
+        :type variables: OrderedDict
+        '''
+        self.path = name
+        self.dirname = None
+
+        self.variables = OrderedDict()
+        for (var_name, (dimensions, values, attributes)) in variables.items():
+            var_meta = {'dimensions': dimensions, 'shape': values.shape, 'dtype': values.dtype.str, 'attributes': attributes}
+            self.variables[var_name] = StoreVariable(self, var_name, var_meta, values=values)
+
+        self.set_dimensions(unlimited_dimensions)
+
+
+class StoreVariable(object):
+    '''
+    Variable of a store, read as a netCDF4.Variable (masked values, scale_factor and add_offset applied).
+    Attributes of the variable are Python attributes (as for netCDF4.Variable), other fields are slots.
+    '''
+
+    __slots__ = ['name', 'dimensions', 'shape', 'dtype', 'ndim', '_file', '_chunks', '_chunk_dir', '_compressed', '_pixel_major',
+                 '_maskandscale', '_scale', '_array', '_values', '_chunk_cache', '_chunk_cache_bytes', '_chunk_cache_size', '__dict__']
+
+    def __init__(self, store, name, meta, values=None):
+        self.name = name
+        self.dimensions = tuple([str(dim) for dim in meta['dimensions']])
+        self.shape = tuple([int(n) for n in meta['shape']])
+        self.dtype = numpy.dtype(str(meta['dtype']))
+        self.ndim = len(self.shape)
+        self._maskandscale = True
+        self._scale = True
+        self._array = values # values of an in-memory dataset
+        self._values = None
+        self._chunk_cache = OrderedDict() # {chunk indices: chunk}, least recently used first
+        self._chunk_cache_bytes = 0
+        self._chunk_cache_size = CHUNK_CACHE_BYTES
+
+        if values is not None:
+            self._file = None
+            self._chunks = None
+            self._chunk_dir = None
+            self._compressed = False
+            self._pixel_major = False
+        elif 'chunks' in meta:
+            self._file = None
+            self._chunks = tuple([int(n) for n in meta['chunks']])
+            self._chunk_dir = os.path.join(store.dirname, meta.get('chunk_dir', name))
+            self._compressed = meta.get('compression') == 'zlib'
+            self._pixel_major = meta.get('chunk_order') == 'pixel_major'
+        else:
+            self._file = os.path.join(store.dirname, meta['file'])
+            self._chunks = None
+            self._chunk_dir = None
+            self._compressed = False
+            self._pixel_major = False
+
+        for (att, value) in meta.get('attributes', {}).items():
+            if att in ['_FillValue', 'missing_value', 'scale_factor', 'add_offset']:
+                value = numpy.array(value, dtype=self.dtype if att in ['_FillValue', 'missing_value'] else None)[()]
+            self.__dict__[str(att)] = value
+
+    def __len__(self):
+        return self.shape[0]
+
+    def ncattrs(self):
+        return self.__dict__.keys()
+
+    def getncattr(self, att):
+        return self.__dict__[att]
+
+    def chunking(self):
+        if self._chunks is None:
+            return 'contiguous'
+        return list(self._chunks)
+
+    def filters(self):
+        if self._compressed:
+            return {'zlib': True, 'shuffle': False, 'complevel': 6, 'fletcher32': False}
+        return None
+
+    def set_auto_maskandscale(self, maskandscale):
+        self._maskandscale = maskandscale
+        self._scale = maskandscale
+
+    def set_auto_scale(self, scale):
+        self._scale = scale
+
+    def get_var_chunk_cache(self):
+        # same interface as netCDF4.Variable: (size, nelems, preemption)
+        return (self._chunk_cache_size, None, None)
+
+    def set_var_chunk_cache(self, size=None, nelems=None, preemption=None):
+        if size is not None:
+            self._chunk_cache_size = size
+
+    def close(self):
+        self._values = None
+        self._chunk_cache.clear()
+        self._chunk_cache_bytes = 0
+
+    def get_values(self):
+        if self._array is not None:
+            return self._array
+        # memory-mapped values of an array store (copy-on-write: the file is never modified)
+        if self._values is None:
+            if self._file.endswith('.npy'):
+                self._values = numpy.load(self._file, mmap_mode='c')
+            else:
+                self._values = numpy.memmap(self._file, dtype=self.dtype, mode='c', shape=self.shape)
+            if self._values.shape != self.shape:
+                raise IOError("Shape of " + self._file + " does not match its sidecar.")
+        return self._values
+
+    def __getitem__(self, key):
+        if self._chunks is None:
+            arr = self.get_values()[key]
+            if isinstance(self._array, numpy.ndarray) and numpy.may_share_memory(arr, self._array):
+                # values of an in-memory dataset are never modified (see util_nc.convert_values_arr)
+                arr = arr.copy()
+        else:
+            arr = self.read_chunks(key)
+        if not self._maskandscale:
+            return arr
+
+        # masked values and packed values, as netCDF4
+        fill_value = self.__dict__.get('_FillValue', self.__dict__.get('missing_value'))
+        if fill_value is not None and numpy.ndim(arr) > 0:
+            arr = numpy.ma.array(arr, mask=(arr == fill_value), copy=False)
+        if self._scale and ('scale_factor' in self.__dict__ or 'add_offset' in self.__dict__):
+            arr = arr * self.__dict__.get('scale_factor', 1.0) + self.__dict__.get('add_offset', 0.0)
+        return arr
+
+    def read_chunks(self, key):
+        '''
+        Reads ``key`` (integers, slices and arrays of indices) from the chunks overlapping it.
+        '''
+        if not isinstance(key, tuple):
+            key = (key,)
+        if Ellipsis in key:
+            i = key.index(Ellipsis)
+            key = key[:i] + (slice(None),) * (self.ndim - len(key) + 1) + key[i+1:]
+        key = key + (slice(None),) * (self.ndim - len(key))
+
+        # indices of each dimension, and the box [lo, hi) containing them
+        indices = [numpy.arange(n)[k] for (n, k) in zip(self.shape, key)]
+        lo = [int(numpy.min(idx)) if numpy.size(idx) > 0 else 0 for idx in indices]
+        hi = [int(numpy.max(idx)) + 1 if numpy.size(idx) > 0 else 0 for idx in indices]
+
+        fill_value = self.__dict__.get('_FillValue', 0)
+        box = numpy.empty([h - l for (l, h) in zip(lo, hi)], dtype=self.dtype)
+
+        if box.size > 0:
+            chunk_ranges = [xrange(l // c, (h - 1) // c + 1) for (l, h, c) in zip(lo, hi, self._chunks)]
+            for chunk_idx in itertools.product(*chunk_ranges):
+                c_lo = [i * c for (i, c) in zip(chunk_idx, self._chunks)]
+                src = tuple([slice(max(l, cl) - cl, min(h, cl + c) - cl) for (l, h, cl, c) in zip(lo, hi, c_lo, self._chunks)])
+                dst = tuple([slice(max(l, cl) - l, min(h, cl + c) - l) for (l, h, cl, c) in zip(lo, hi, c_lo, self._chunks)])
+                chunk = self.get_chunk(chunk_idx)
+                if chunk is not None:
+                    box[dst] = chunk[src]
+                else:
+                    box[dst] = fill_value
+
+        # indices within the box, dimension by dimension (integers remove the dimension)
+        axis = 0
+        for (k, idx, l) in zip(key, indices, lo):
+            if isinstance(k, (int, long, numpy.integer)):
+                box = numpy.take(box, 0, axis=axis)
+            else:
+                if not (isinstance(k, slice) and k.step in [None, 1]):
+                    box = numpy.take(box, idx - l, axis=axis)
+                axis += 1
+        return box
+
+    def get_chunk(self, chunk_idx):
+        '''
+        Returns a chunk (in the order of the dimensions of the variable) from the chunk cache, or loads it.
+
+        :rtype: numpy.ndarray, or None if the chunk is missing
+        '''
+        if chunk_idx in self._chunk_cache:
+            chunk = self._chunk_cache.pop(chunk_idx)
+            self._chunk_cache[chunk_idx] = chunk
+            return chunk
+
+        chunk_file = os.path.join(self._chunk_dir, '.'.join([str(i) for i in chunk_idx]) + ('.npz' if self._compressed else '.npy'))
+        if not os.path.isfile(chunk_file):
+            return None
+        if self._compressed:
+            with open(chunk_file, 'rb') as f:
+                chunk = numpy.load(f)['values']
+        else:
+            chunk = numpy.load(chunk_file, mmap_mode='r')
+        if self._pixel_major:
+            chunk = numpy.rollaxis(chunk, chunk.ndim - 1, 0)
+
+        if self._compressed:
+            # memory-mapped chunks are not cached
+            while len(self._chunk_cache) > 0 and self._chunk_cache_bytes + chunk.nbytes > self._chunk_cache_size:
+                self._chunk_cache_bytes -= self._chunk_cache.popitem(last=False)[1].nbytes
+            if chunk.nbytes <= self._chunk_cache_size:
+                self._chunk_cache[chunk_idx] = chunk
+                self._chunk_cache_bytes += chunk.nbytes
+        return chunk
+
+
+def add_memory_dataset(var_name, values, time_values, time_units, calendar='gregorian', fill_value=1e20, lat=None, lon=None, units=None):
+    '''
+    Adds an in-memory dataset of one variable (time, lat, lon), read by icclim.indice as an input file.
+
+    :param var_name: variable name
+    :type var_name: str
+
+    :param values: values of the variable: numpy array (masked or not), memory map or any array-like with ``shape``, ``dtype`` and ``__getitem__``
+    :type values: array-like
+
+    :param time_values: time values
+    :type time_values: 1D array
+
+    :param time_units: units of time values (e.g. "days since 1950-01-01 00:00:00")
+    :type time_units: str
+
+    :param calendar: calendar of time values (default: "gregorian")
+    :type calendar: str
+
+    :param fill_value: values equal to ``fill_value`` are missing, as well as masked values (default: 1e20)
+    :type fill_value: float
+
+    :param lat: latitudes (default: None, indices of rows)
+    :type lat: 1D array
+
+    :param lon: longitudes (default: None, indices of columns)
+    :type lon: 1D array
+
+    :param units: units of the variable (default: None)
+    :type units: str
+
+    :rtype: str (name of the dataset, input file for icclim.indice)
+
+    .. warning:: the dataset is kept until it is removed (see ``remove_memory_dataset``)
+    '''
+    global _nb_memory_datasets
+
+    if len(values.shape) != 3:
+        raise IOError("Values of " + var_name + " must have 3 dimensions (time, lat, lon).")
+    time_values = numpy.asarray(time_values)
+    if time_values.shape != (values.shape[0],):
+        raise IOError("Number of time values does not match the values of " + var_name + ".")
+    lat = numpy.arange(values.shape[1], dtype='float64') if lat is None else numpy.asarray(lat)
+    lon = numpy.arange(values.shape[2], dtype='float64') if lon is None else numpy.asarray(lon)
+    if lat.shape != (values.shape[1],) or lon.shape != (values.shape[2],):
+        raise IOError("Coordinates do not match the values of " + var_name + ".")
+
+    attributes = OrderedDict([('_FillValue', fill_value)])
+    if units is not None:
+        attributes['units'] = units
+
+    variables = OrderedDict([('time', (['time'], time_values, OrderedDict([('units', time_units), ('calendar', calendar)]))),
+                             ('lat', (['lat'], lat, OrderedDict([('units', 'degrees_north')]))),
+                             ('lon', (['lon'], lon, OrderedDict([('units', 'degrees_east')]))),
+                             (var_name, (['time', 'lat', 'lon'], values, attributes))])
+
+    _nb_memory_datasets += 1
+    name = MEMORY_PREFIX + str(_nb_memory_datasets) + ':' + var_name
+    _memory_datasets[name] = MemoryStore(name, variables, ['time'])
+    return name
+
+
+def remove_memory_dataset(name):
+    '''
+    Removes an in-memory dataset (and its catalog entry).
+    '''
+    _memory_datasets.pop(name, None)
+    catalog.forget(name)
+
+
+def write_store(in_file, out_path, chunks=None):
+    '''
+    Writes all variables of a netCDF file into an array store (``chunks`` is None) or a chunked store.
+
+    :param in_file: netCDF file
+    :type in_file: str
+
+    :param out_path: JSON sidecar of the array store (values are written next to it in ``.npy`` files),
+                     or directory of the chunked store
+    :type out_path: str
+
+    :param chunks: chunk shape of variables with the same number of dimensions (other variables are not chunked) (default: None)
+    :type chunks: list of int
+
+    :rtype: str (input file of the store for icclim.indice: ``out_path``)
+    '''
+
+    nc = Dataset(in_file, 'r')
+
+    if chunks is None:
+        sidecar = out_path
+        dirname = os.path.dirname(os.path.abspath(out_path))
+        prefix = os.path.splitext(os.path.basename(out_path))[0] + '.'
+    else:
+        sidecar = os.path.join(out_path, STORE_FILENAME)
+        dirname = out_path
+        prefix = ''
+    if not os.path.isdir(dirname):
+        os.makedirs(dirname)
+
+    meta = OrderedDict([('icclim_store', STORE_VERSION),
+                        ('unlimited_dimensions', [dim for dim in nc.dimensions if nc.dimensions[dim].isunlimited()]),
+                        ('variables', OrderedDict())])
+
+    for (var_name, var) in nc.variables.items():
+        var.set_auto_maskandscale(False) # packed values and fill values are written as they are
+        var_meta = OrderedDict([('dimensions', list(var.dimensions)),
+                                ('shape', list(var.shape)),
+                                ('dtype', var.dtype.str),
+                                ('attributes', catalog.get_attributes(var))])
+
+        if chunks is not None and len(chunks) == var.ndim:
+            var_meta['chunks'] = list(chunks)
+            chunk_dir = os.path.join(dirname, var_name)
+            if not os.path.isdir(chunk_dir):
+                os.makedirs(chunk_dir)
+            for chunk_idx in itertools.product(*[xrange((n + c - 1) // c) for (n, c) in zip(var.shape, chunks)]):
+                key = tuple([slice(i * c, min((i + 1) * c, n)) for (i, c, n) in zip(chunk_idx, chunks, var.shape)])
+                numpy.save(os.path.join(chunk_dir, '.'.join([str(i) for i in chunk_idx]) + '.npy'), var[key])
+        else:
+            var_meta['file'] = prefix + var_name + '.npy'
+            numpy.save(os.path.join(dirname, var_meta['file']), var[:])
+
+        meta['variables'][var_name] = var_meta
+
+    nc.close()
+
+    with open(sidecar, 'w') as f:
+        json.dump(meta, f, indent=1)
+
+    return out_path
@@ -0,0 +1,151 @@
+#  Copyright CERFACS (http://cerfacs.fr/)
+#  Apache License, Version 2.0 (http://www.apache.org/licenses/LICENSE-2.0)
+
+'''
+Tile planner taking into account how the variable is stored on disk.
+
+OCGIS_tile.get_tile_schema cuts the grid into square tiles (tdim x tdim).
+When the variable is chunked (netCDF4/HDF5), a square tile straddling storage chunks makes each of these chunks
+to be read (and decompressed) once per tile.
+Here, tiles keep the same number of pixels (tdim*tdim) but:
+    - for a contiguous variable, tiles are row bands (full rows are contiguous on disk),
+      or blocks of one row if one row is bigger than a tile,
+    - for a chunked variable, tile boundaries are aligned on chunk boundaries (full-width bands of chunk rows
+      if they fit, else blocks of chunks), so each chunk is read by one tile only;
+      if one chunk is bigger than a tile, chunks are split into bands.
+Tiles are returned in row-major order.
+'''
+
+import numpy
+import OCGIS_tile
+
+
+# maximum size of the chunk cache set for a variable
+MAX_CHUNK_CACHE_BYTES = 512 * 1024 * 1024
+
+
+def get_tile_shape(nrow, ncol, tdim, chunking=None):
+    '''
+    Returns the shape of tiles: (number of rows, number of columns).
+
+    :param nrow: number of rows of the grid
+    :type nrow: int
+    :param ncol: number of columns of the grid
+    :type ncol: int
+    :param tdim: tile dimension computed for square tiles (see arr_size.get_tile_dimension)
+    :type tdim: int
+    :param chunking: chunking of the variable: 'contiguous' or list of chunk sizes (the last two are the spatial ones)
+    :type chunking: str or list of int
+
+    :rtype: tuple of 2 int, or None if the storage layout is unknown (square tiles should be used)
+    '''
+
+    nb_pixels = tdim * tdim
+
+    if chunking == 'contiguous':
+        if ncol <= nb_pixels:
+            return (min(nb_pixels // ncol, nrow), ncol)
+        else:
+            # one row is bigger than a tile: rows are split into blocks of columns
+            return (1, get_band_size(ncol, nb_pixels))
+
+    if not isinstance(chunking, (list, tuple)):
+        return None
+
+    chunk_nrow = min(chunking[-2], nrow)
+    chunk_ncol = min(chunking[-1], ncol)
+
+    if chunk_nrow * ncol <= nb_pixels:
+        # full-width bands of chunk rows
+        tile_nrow = (nb_pixels // ncol) // chunk_nrow * chunk_nrow
+        return (min(tile_nrow, nrow), ncol)
+
+    elif chunk_nrow * chunk_ncol <= nb_pixels:
+        # blocks of chunks, one chunk row high
+        tile_ncol = (nb_pixels // chunk_nrow) // chunk_ncol * chunk_ncol
+        return (chunk_nrow, min(tile_ncol, ncol))
+
+    elif chunk_ncol <= nb_pixels:
+        # one chunk is bigger than a tile: chunks are split into bands of equal size (e.g. chunks (1, nrow, ncol) are split into row bands)
+        return (get_band_size(chunk_nrow, nb_pixels // chunk_ncol), chunk_ncol)
+
+    else:
+        return (1, get_band_size(chunk_ncol, nb_pixels))
+
+
+def get_band_size(n, max_size):
+    '''
+    Splits ``n`` into the smallest number of bands not bigger than ``max_size`` and returns size of these bands.
+    '''
+
+    nb_bands = (n + max_size - 1) // max_size
+    return (n + nb_bands - 1) // nb_bands
+
+
+def get_tile_schema(nrow, ncol, tdim=0, chunking=None, origin=0):
+    '''
+    Returns the tile map (same format as OCGIS_tile.get_tile_schema: {tile_id: {'row': [i1, i2], 'col': [j1, j2]}}).
+
+    :param nrow: number of rows of the grid
+    :type nrow: int
+    :param ncol: number of columns of the grid
+    :type ncol: int
+    :param tdim: tile dimension computed for square tiles (default: 0, i.e. no tiling)
+    :type tdim: int
+    :param chunking: chunking of the variable: None (unknown, e.g. netCDF3 or OPeNDAP), 'contiguous' or list of chunk sizes
+    :type chunking: str or list of int
+
+    :rtype: dict
+    '''
+
+    if tdim == 0:
+        return OCGIS_tile.get_tile_schema(nrow, ncol, tdim=0, origin=origin)
+
+    tile_shape = get_tile_shape(nrow, ncol, tdim, chunking=chunking)
+    if tile_shape is None:
+        return OCGIS_tile.get_tile_schema(nrow, ncol, tdim=tdim, origin=origin)
+
+    (tile_nrow, tile_ncol) = tile_shape
+
+    row_idx = list(numpy.arange(origin, nrow, tile_nrow)) + [nrow]
+    col_idx = list(numpy.arange(origin, ncol, tile_ncol)) + [ncol]
+
+    ret = {}
+    tile_id = 0
+    for (i1, i2) in zip(row_idx[:-1], row_idx[1:]):
+        for (j1, j2) in zip(col_idx[:-1], col_idx[1:]):
+            ret.update({tile_id: {'row': [int(i1), int(i2)], 'col': [int(j1), int(j2)]}})
+            tile_id += 1
+
+    return ret
+
+
+def get_chunk_cache_size(tile_map, chunking, itemsize):
+    '''
+    Returns the size of chunk cache (in bytes) needed to keep all chunks of a tile for one chunk along time,
+    so that a chunk read by several successive reads of a tile (see util_nc.read_values_arr) is decompressed only once.
+
+    :param tile_map: tile map (see get_tile_schema)
+    :type tile_map: dict
+    :param chunking: chunking of the variable
+    :type chunking: str or list of int
+    :param itemsize: size of one value in bytes
+    :type itemsize: int
+
+    :rtype: int (bytes), or None if the variable is not chunked
+    '''
+
+    if not isinstance(chunking, (list, tuple)):
+        return None
+
+    chunk_nbytes = numpy.prod(chunking) * itemsize
+
+    nb_chunks = 0
+    for tile in tile_map.values():
+        (i1, i2) = tile['row']
+        (j1, j2) = tile['col']
+        nb_chunk_rows = (i2 - 1) // chunking[-2] - i1 // chunking[-2] + 1
+        nb_chunk_cols = (j2 - 1) // chunking[-1] - j1 // chunking[-1] + 1
+        nb_chunks = max(nb_chunks, nb_chunk_rows * nb_chunk_cols)
+
+    return int(min(nb_chunks * chunk_nbytes, MAX_CHUNK_CACHE_BYTES))
@@ -0,0 +1,87 @@
+#  Copyright CERFACS (http://cerfacs.fr/)
+#  Apache License, Version 2.0 (http://www.apache.org/licenses/LICENSE-2.0)
+
+'''
+Background reading of the next tile while the current tile is computed.
+
+At most one tile is read ahead: tile N+1 is read in a background thread while tile N is computed,
+and tile N+2 is not read before tile N+1 is handed to the caller.
+All reads are done in this thread, one after another, so the datasets are never accessed concurrently.
+'''
+
+import sys
+import time
+import logging
+import threading
+
+
+class TileReader(threading.Thread):
+    '''
+    Thread reading one tile with ``read_tile(tile_id)``.
+    '''
+
+    def __init__(self, read_tile, tile_id):
+        threading.Thread.__init__(self)
+        self.daemon = True
+        self.read_tile = read_tile
+        self.tile_id = tile_id
+        self.tile_arrs = None
+        self.exc_info = None
+        self.read_time = 0.0
+
+    def run(self):
+        t0 = time.time()
+        try:
+            self.tile_arrs = self.read_tile(self.tile_id)
+        except:
+            self.exc_info = sys.exc_info()
+        self.read_time = time.time() - t0
+
+    def get_result(self):
+        self.join()
+        if self.exc_info is not None:
+            raise self.exc_info[0], self.exc_info[1], self.exc_info[2]
+        return self.tile_arrs
+
+
+def iter_tiles(tile_ids, read_tile, prefetch=False):
+    '''
+    Iterates over tiles and returns data of each tile.
+
+    :param tile_ids: tiles to read (e.g. keys of the tile map from OCGIS_tile.get_tile_schema)
+    :type tile_ids: list
+
+    :param read_tile: function reading one tile: read_tile(tile_id)
+    :type read_tile: function
+
+    :param prefetch: if True, the next tile is read in background while the current one is processed by the caller (default: False)
+    :type prefetch: bool
+
+    :rtype: generator of tuples (tile_id, read_tile(tile_id))
+    '''
+
+    if not prefetch or len(tile_ids) < 2:
+        for tile_id in tile_ids:
+            yield (tile_id, read_tile(tile_id))
+        return
+
+    total_read_time = 0.0 # time spent reading (in background)
+    total_wait_time = 0.0 # time the caller waited for data
+
+    reader = TileReader(read_tile, tile_ids[0])
+    reader.start()
+
+    for i in range(len(tile_ids)):
+        t0 = time.time()
+        tile_arrs = reader.get_result()
+        total_wait_time += time.time() - t0
+        total_read_time += reader.read_time
+
+        if i+1 < len(tile_ids):
+            reader = TileReader(read_tile, tile_ids[i+1])
+            reader.start()
+
+        yield (tile_ids[i], tile_arrs)
+        del tile_arrs
+
+    logging.info("Prefetch: %.2f s of reading, %.2f s of it hidden behind computation.", total_read_time, max(0.0, total_read_time - total_wait_time))
@@ -168,8 +168,9 @@ def get_user_indice_params(user_indice, var_name, out_unit):
 
 
 
-def get_user_indice(user_indice, arr, fill_val, vars, out_unit='days', dt_arr=None, pctl_thresh=None):
+def get_user_indice(user_indice, arr, fill_val, vars, out_unit='days', dt_arr=None, pctl_thresh=None, packing=None):
     ### 'dt_arr' and 'pctl_thresh' are required for percentile-based indices, i.e. when a threshold is a percentile
+    ### 'packing' is given if arr contains packed values (see util_nc.get_packing), only for 'nb_events' and 'max_nb_consecutive_events'
     ### 'pctl_thresh' could be a dictionary with daily percentiles (for temperature variables) 
     ### or an 2D array with percentiles (for precipitation variables)
     ### vars: list of target variable(s)
@@ -220,7 +221,8 @@ def get_user_indice(user_indice, arr, fill_val, vars, out_unit='days', dt_arr=No
                                         index_event=obj.date_event, 
                                         out_unit=out_unit, 
                                         dt_arr=dt_arr, 
-                                        coef=obj.coef)
+                                        coef=obj.coef,
+                                        packing=packing)
     
                                 
                 elif obj.calc_operation == 'max_nb_consecutive_events':
@@ -231,7 +233,8 @@ def get_user_indice(user_indice, arr, fill_val, vars, out_unit='days', dt_arr=No
                                                  logical_operation=obj.logical_operation, 
                                                  thresh=thresh_, 
                                                  dt_arr=dt_arr,
-                                                 fill_val = fill_val)
+                                                 fill_val = fill_val,
+                                                 packing=packing)
                    
                     
                     ### we pass it to C function with logical_operation='e' (==) and thresh=1 
@@ -8,11 +8,12 @@ import netcdftime
 import pdb
 import os
 #from datetime import datetime
-from netCDF4 import Dataset, MFDataset
+from netCDF4 import Dataset
 import numpy
 import sys
 
 from ..icclim_exceptions import *
+import catalog
 
 # unused function
 def get_list_dates_from_nc(nc, type_dates):
@@ -127,7 +128,7 @@ def date2num(dt, calend, units):
     
     :rtype: float
     '''
-    t = netcdftime.utime(units, calend)
+    t = get_utime(units, calend)
     dt_num = t.date2num(dt)
     
     return dt_num
@@ -146,12 +147,243 @@ def num2date(num, calend, units):
     
     :rtype: datetime.datetime object
     '''   
-    t = netcdftime.utime(units, calend)    
+    t = get_utime(units, calend)    
     dt = t.num2date(num)
 
     return dt
 
 
+# cache of netcdftime.utime objects: key=(units, calend)
+_utime_cache = {}
+
+def get_utime(units, calend):
+    '''
+    Returns a netcdftime.utime object for given units and calendar.
+    The object is created only once for each pair (units, calend) and then reused.
+    
+    :param units: units of variable "time" in netCDF file
+    :type units: str
+    :param calend: calendar attribute of variable "time" in netCDF file
+    :type calend: str
+    
+    :rtype: netcdftime.utime object
+    '''
+    try:
+        t = _utime_cache[units, calend]
+    except KeyError:
+        t = netcdftime.utime(units, calend)
+        _utime_cache[units, calend] = t
+        
+    return t
+
+
+##### vectorized decoding of time axis: begin
+
+# number of seconds in one unit of time
+map_time_units_seconds = {
+                            'days': 86400.0, 'day': 86400.0, 'd': 86400.0,
+                            'hours': 3600.0, 'hour': 3600.0, 'hrs': 3600.0, 'hr': 3600.0, 'h': 3600.0,
+                            'minutes': 60.0, 'minute': 60.0, 'mins': 60.0, 'min': 60.0,
+                            'seconds': 1.0, 'second': 1.0, 'secs': 1.0, 'sec': 1.0, 's': 1.0
+                         }
+
+# cumulative number of days before each month
+cum_days_noleap = numpy.array([0, 31, 59, 90, 120, 151, 181, 212, 243, 273, 304, 334, 365])
+cum_days_all_leap = numpy.array([0, 31, 60, 91, 121, 152, 182, 213, 244, 274, 305, 335, 366])
+
+# first day of the Gregorian calendar (1582-10-15) as Julian Day Number
+JDN_gregorian_reform = 2299161
+
+
+def get_days_from_date(year, month, day, calend='gregorian'):
+    '''
+    Returns the day number of a date (or of arrays of dates) in a given calendar.
+    For real-world calendars ("gregorian", "standard", "proleptic_gregorian", "julian") this is the Julian Day Number.
+    For other calendars ("noleap", "365_day", "all_leap", "366_day", "360_day") this is a number of days since year 0.
+    
+    :param year: year(s)
+    :type year: int or numpy.ndarray (1D) of int
+    :param month: month(s)
+    :type month: int or numpy.ndarray (1D) of int
+    :param day: day(s)
+    :type day: int or numpy.ndarray (1D) of int
+    :param calend: calendar
+    :type calend: str
+    
+    :rtype: int or numpy.ndarray (1D) of int
+    '''
+    
+    calend = calend.lower()
+    
+    year = numpy.asarray(year, dtype='int64')
+    month = numpy.asarray(month, dtype='int64')
+    day = numpy.asarray(day, dtype='int64')
+    
+    if calend == '360_day':
+        return year*360 + (month-1)*30 + (day-1)
+    
+    elif calend in ['noleap', '365_day']:
+        return year*365 + cum_days_noleap[month-1] + (day-1)
+    
+    elif calend in ['all_leap', '366_day']:
+        return year*366 + cum_days_all_leap[month-1] + (day-1)
+    
+    # Julian Day Number (http://en.wikipedia.org/wiki/Julian_day)
+    a = (14-month)//12
+    y = year + 4800 - a
+    m = month + 12*a - 3
+    jdn_julian = day + (153*m+2)//5 + 365*y + y//4 - 32083
+    jdn_gregorian = day + (153*m+2)//5 + 365*y + y//4 - y//100 + y//400 - 32045
+    
+    if calend == 'julian':
+        return jdn_julian
+    
+    elif calend == 'proleptic_gregorian':
+        return jdn_gregorian
+    
+    elif calend in ['gregorian', 'standard']:
+        # dates before 1582-10-15 are in the Julian calendar
+        before_reform = (year*10000 + month*100 + day) < 15821015
+        return numpy.where(before_reform, jdn_julian, jdn_gregorian)
+    
+    else:
+        raise InvalidIcclimArgumentError("calendar", "Unsupported calendar = " + calend)
+
+
+def get_date_from_days(days, calend='gregorian'):
+    '''
+    Inverse of the :func:`get_days_from_date`: returns year, month and day arrays for an array of day numbers.
+    
+    :param days: day numbers
+    :type days: numpy.ndarray (1D) of int
+    :param calend: calendar
+    :type calend: str
+    
+    :rtype: tuple of 3 numpy.ndarray (1D) of int: (year, month, day)
+    '''
+    
+    calend = calend.lower()
+    
+    days = numpy.asarray(days, dtype='int64')
+    
+    if calend == '360_day':
+        year = days//360
+        month = (days%360)//30 + 1
+        day = days%30 + 1
+        return (year, month, day)
+    
+    elif calend in ['noleap', '365_day', 'all_leap', '366_day']:
+        if calend in ['noleap', '365_day']:
+            cum_days = cum_days_noleap
+        else:
+            cum_days = cum_days_all_leap
+        year = days//cum_days[-1]
+        day_of_year = days%cum_days[-1]
+        month = numpy.searchsorted(cum_days, day_of_year, side='right')
+        day = day_of_year - cum_days[month-1] + 1
+        return (year, month, day)
+    
+    elif calend not in ['julian', 'proleptic_gregorian', 'gregorian', 'standard']:
+        raise InvalidIcclimArgumentError("calendar", "Unsupported calendar = " + calend)
+    
+    # Richards' algorithm (http://en.wikipedia.org/wiki/Julian_day#Julian_or_Gregorian_calendar_from_Julian_day_number)
+    a = days + 32044
+    b = (4*a+3)//146097
+    c_gregorian = a - (146097*b)//4
+    c_julian = days + 32082
+    
+    if calend == 'julian':
+        b = 0
+        c = c_julian
+    elif calend == 'proleptic_gregorian':
+        c = c_gregorian
+    else:
+        before_reform = days < JDN_gregorian_reform
+        b = numpy.where(before_reform, 0, b)
+        c = numpy.where(before_reform, c_julian, c_gregorian)
+    
+    d = (4*c+3)//1461
+    e = c - (1461*d)//4
+    m = (5*e+2)//153
+    
+    day = e - (153*m+2)//5 + 1
+    month = m + 3 - 12*(m//10)
+    year = 100*b + d - 4800 + m//10
+    
+    return (year, month, day)
+
+
+def get_date_fields_arr(time_arr, calend, units):
+    '''
+    Vectorized decoding of numerical dates to integer date fields, without any datetime object.
+    
+    :param time_arr: numerical dates (values of variable "time" in netCDF file)
+    :type time_arr: numpy.ndarray (1D)
+    :param calend: calendar attribute of variable "time" in netCDF file
+    :type calend: str
+    :param units: units of variable "time" in netCDF file
+    :type units: str
+    
+    :rtype: tuple of 4 numpy.ndarray (1D): (year, month, day, day of year) 
+    '''
+    
+    t = get_utime(units, calend)
+    
+    try:
+        seconds_per_unit = map_time_units_seconds[t.units.lower()]
+    except KeyError:
+        raise InvalidIcclimArgumentError("units", "Unsupported time units = " + units)
+    
+    origin = t.origin
+    origin_days = get_days_from_date(origin.year, origin.month, origin.day, calend)
+    origin_seconds = origin.hour*3600.0 + origin.minute*60.0 + origin.second - getattr(t, 'tzoffset', 0)*60.0
+    
+    # seconds since the beginning of the origin day; rounded to microseconds to avoid 
+    # 1.9999999 days being decoded as the day before
+    seconds_arr = numpy.round(numpy.asarray(time_arr, dtype='float64')*seconds_per_unit + origin_seconds, 6)
+    days_arr = origin_days + numpy.floor(seconds_arr/86400.0).astype('int64')
+    
+    (year_arr, month_arr, day_arr) = get_date_from_days(days_arr, calend)
+    dayofyear_arr = days_arr - get_days_from_date(year_arr, 1, 1, calend) + 1
+    
+    return (year_arr.astype('int32'), month_arr.astype('int8'), day_arr.astype('int8'), dayofyear_arr.astype('int16'))
+
+
+def decode_time_axis(time_arr, calend, units):
+    '''
+    Decodes a whole numerical time axis in one call.
+    
+    :param time_arr: numerical dates (values of variable "time" in netCDF file)
+    :type time_arr: numpy.ndarray (1D)
+    :param calend: calendar attribute of variable "time" in netCDF file
+    :type calend: str
+    :param units: units of variable "time" in netCDF file
+    :type units: str
+    
+    :rtype: tuple of 5 numpy.ndarray (1D): (dt_arr, year, month, day, day of year), 
+            where dt_arr contains datetime objects and the others contain integers
+    
+    Example:
+    
+    >>> (dt_arr, year_arr, month_arr, day_arr, dayofyear_arr) = util_dt.decode_time_axis(nc.variables['time'][:], calend='noleap', units='days since 2006-1-1')
+    
+    .. note:: The integer arrays are computed with numpy arithmetics for "gregorian"/"standard", "proleptic_gregorian", "julian", 
+              "noleap"/"365_day", "all_leap"/"366_day" and "360_day" calendars, 
+              so the further processing could be done without datetime objects.
+    '''
+    
+    time_arr = numpy.ma.getdata(time_arr)
+    
+    t = get_utime(units, calend)
+    dt_arr = numpy.array(t.num2date(time_arr), ndmin=1)
+    
+    (year_arr, month_arr, day_arr, dayofyear_arr) = get_date_fields_arr(time_arr, calend, units)
+    
+    return (dt_arr, year_arr, month_arr, day_arr, dayofyear_arr)
+
+##### vectorized decoding of time axis: end
+
+
 def get_time_range(files, time_range=None, temporal_var_name='time'):
     
     '''
@@ -173,39 +405,24 @@ def get_time_range(files, time_range=None, temporal_var_name='time'):
     
     Returns a time range: a list two datetime objects: [begin, end], where "begin" is the first date, and "end" is the last.
     '''
-    try:
-        nc = Dataset(files[0],'r')
-    except Runtime:
-        raise MissingIcclimInputError("Failed to access dataset: " + files[0])
-
-    time = nc.variables[temporal_var_name]
+    # calendar, units and time bounds are taken from the catalog (see catalog.py)
+    dict_entries = catalog.get_entries(files, temporal_var_name=temporal_var_name)
+    first_entry = dict_entries[files[0]]
     
-    try:
-        calend = time.calendar
-    except:
-        calend = 'gregorian'
-        
-    units = time.units
+    calend = first_entry['calendar']
+    units = first_entry['units']
     
-    t = netcdftime.utime(units, calend)
+    t = get_utime(units, calend)
     
-    any_dt = t.num2date(time[0])
-    nc.close()
+    any_dt = t.num2date(first_entry['time_first'])
     
     
     if time_range != None:        
         time_range = harmonize_hourly_timestamp(time_range, any_dt)
     
     else:
-        try:
-            nc = MFDataset(files, 'r', aggdim='time')
-        except Runtime:
-            raise MissingIcclimInputError("Failed to access dataset: " + files)
-        time_arr = nc.variables[temporal_var_name][:]
-        nc.close()
-
-        begin_num = min(time_arr)
-        end_num = max(time_arr)
+        begin_num = min([entry['time_min'] for entry in dict_entries.values()])
+        end_num = max([entry['time_max'] for entry in dict_entries.values()])
         
         begin_dt = num2date(begin_num, calend, units)
         end_dt = num2date(end_num, calend, units)
@@ -7,6 +7,8 @@
 import numpy
 import pdb
 import util_dt
+import catalog
+from ..icclim_exceptions import *
 from datetime import timedelta
 from netCDF4 import Dataset
 
@@ -272,7 +274,138 @@ def copy_var_dim(inc, onc, var, lev_dim_pos=1):
     return (str(time_var), str(lat_var), str(lon_var)) # tuple ('time', 'lat', 'lon')
 
 
-def get_values_arr_and_dt_arr(ncVar_temporal, ncVar_values, fill_val=None, time_range=None, N_lev=None, lev_dim_pos=1, ignore_Feb29th=False, i1_row_current_tile=None, i2_row_current_tile=None, i1_col_current_tile=None, i2_col_current_tile=None, add_offset=0.0, scale_factor=1.0):
+def get_contiguous_runs(indices):
+    '''
+    Splits sorted indices into runs of consecutive indices.
+    
+    :param indices: sorted indices
+    :type indices: numpy.ndarray (1D) of int
+    
+    :rtype: list of tuples (start, stop), i.e. each run is range(start, stop)
+    
+    Example: [3, 4, 5, 9, 10] --> [(3, 6), (9, 11)]
+    '''
+    
+    if len(indices) == 0:
+        return []
+    
+    breaks = numpy.where(numpy.diff(indices) != 1)[0] + 1
+    first = numpy.concatenate(([0], breaks))
+    last = numpy.concatenate((breaks, [len(indices)])) - 1
+    
+    return [(int(indices[i]), int(indices[j]) + 1) for (i, j) in zip(first, last)]
+
+
+def read_values_arr(ncVar_values, indices, N_lev=None, lev_dim_pos=1, i1_row=None, i2_row=None, i1_col=None, i2_col=None, dtype='float32'):
+    '''
+    Reads the time steps ``indices`` of a 3D/4D variable into a preallocated float32 masked array (or of type ``dtype``).
+    Instead of a fancy indexing read (``ncVar_values[indices,:,:]``, which netCDF4 does time step by time step),
+    there is one slice read per run of consecutive time steps (see get_contiguous_runs). 
+    
+    :param ncVar_values: variable to read
+    :type ncVar_values: netCDF4.Variable or mf_reader.MultiFileVariable
+    
+    :param indices: sorted indices of time steps to read
+    :type indices: numpy.ndarray (1D) of int
+    
+    :param N_lev: level number (only for 4D variables)
+    :type N_lev: int
+    
+    :param lev_dim_pos: position of the level dimension (0 or 1, only for 4D variables)
+    :type lev_dim_pos: int
+    
+    :param dtype: type of the array (default: "float32")
+    :type dtype: str or numpy.dtype
+    
+    :rtype: numpy.ma.MaskedArray (3D: time, row, col) of float32 (or ``dtype``)
+    '''
+    
+    rows = slice(i1_row, i2_row)
+    cols = slice(i1_col, i2_col)
+    
+    def read_run(start, stop):
+        if N_lev == None:
+            return ncVar_values[start:stop, rows, cols]
+        elif lev_dim_pos == 0:
+            return ncVar_values[N_lev, start:stop, rows, cols]
+        else:
+            return ncVar_values[start:stop, N_lev, rows, cols]
+    
+    runs = get_contiguous_runs(indices)
+    
+    # aggregated variable (see mf_reader.py): runs are read file by file
+    aggregated = hasattr(ncVar_values, 'read_into')
+    
+    # only one run (in one file): the array returned by netCDF4 is used as is (no copy if it is already float32)
+    # (except for remote datasets read by several requests, see remote_reader.py)
+    if len(runs) == 1 and (not aggregated or (len(ncVar_values.get_file_runs(*runs[0])) == 1 and not ncVar_values.remote)):
+        run = read_run(*runs[0])
+        return numpy.ma.array(run, mask=numpy.ma.getmaskarray(run), dtype=dtype, copy=False)
+    
+    nb_rows = len(xrange(*rows.indices(ncVar_values.shape[-2])))
+    nb_cols = len(xrange(*cols.indices(ncVar_values.shape[-1])))
+    
+    data = numpy.empty((len(indices), nb_rows, nb_cols), dtype=dtype)
+    mask = numpy.zeros((len(indices), nb_rows, nb_cols), dtype=bool)
+    
+    if aggregated:
+        # each file's contribution is read straight into data and mask
+        if N_lev == None:
+            key = (None, rows, cols)
+        elif lev_dim_pos == 0:
+            key = (N_lev, None, rows, cols)
+        else:
+            key = (None, N_lev, rows, cols)
+        ncVar_values.read_into(key, runs, data=data, mask=mask)
+        return numpy.ma.array(data, mask=mask, copy=False)
+    
+    i = 0
+    for (start, stop) in runs:
+        run = read_run(start, stop)
+        data[i:i+stop-start] = numpy.ma.getdata(run)
+        if numpy.ma.getmask(run) is not numpy.ma.nomask:
+            mask[i:i+stop-start] = run.mask
+        i += stop-start
+    
+    return numpy.ma.array(data, mask=mask, copy=False)
+
+
+def set_chunk_cache(ncVar, size):
+    '''
+    Sets the chunk cache of a variable (of each file for an aggregated variable), if it is smaller than ``size``.
+    Nothing is done for netCDF3 files.
+    
+    :param ncVar: variable
+    :type ncVar: netCDF4.Variable or mf_reader.MultiFileVariable
+    
+    :param size: size of chunk cache in bytes
+    :type size: int
+    '''
+    
+    for var in (ncVar.get_file_vars() if hasattr(ncVar, 'get_file_vars') else [ncVar]):
+        try:
+            (current_size, current_nelems, current_preemption) = var.get_var_chunk_cache()
+        except (RuntimeError, AttributeError): # netCDF3 or store (see stores.py)
+            continue
+        if size > current_size:
+            var.set_var_chunk_cache(size=size, preemption=current_preemption)
+
+
+def get_dt_arr_and_indices(ncVar_temporal, time_range=None, ignore_Feb29th=False):
+    '''
+    Decodes the time axis and returns the time steps to read for ``time_range`` (without reading values).
+    
+    :param ncVar_temporal: temporal variable
+    :type ncVar_temporal: netCDF4.Variable or mf_reader.MultiFileVariable
+    
+    :param time_range: time range
+    :type time_range: [datetime.datetime, datetime.datetime]
+    
+    :param ignore_Feb29th: if True, Feb 29th are removed from the returned time steps
+    :type ignore_Feb29th: bool
+    
+    :rtype: tuple (dt_arr, indices): datetime vector of the selected time steps and their indices in the time axis
+    '''
     
     try:
         calend = ncVar_temporal.calendar
@@ -282,7 +415,8 @@ def get_values_arr_and_dt_arr(ncVar_temporal, ncVar_values, fill_val=None, time_
     
     time_arr = ncVar_temporal[:]
     
-    dt_arr = numpy.array([util_dt.num2date(dt, calend=calend, units=units) for dt in time_arr])
+    # whole time axis is decoded in one call
+    time_axis = util_dt.decode_time_axis(time_arr, calend=calend, units=units)
 
     # REMOVED, because netcdftime.datetime objects have no method total_seconds()
 #     deltat = (dt_arr[1]-dt_arr[0]).total_seconds()
@@ -290,34 +424,145 @@ def get_values_arr_and_dt_arr(ncVar_temporal, ncVar_values, fill_val=None, time_
 #         print "WARNING: Time interval of the input file is not daily!! Delta time is: "+str(deltat)
     
 #     print  "+++", time_range   
+    
+    return get_dt_arr_and_indices_from_time_axis(time_axis, calend, time_range=time_range, ignore_Feb29th=ignore_Feb29th)
+
+
+def get_dt_arr_and_indices_from_time_axis(time_axis, calend, time_range=None, ignore_Feb29th=False):
+    '''
+    Same as get_dt_arr_and_indices, with an already decoded time axis.
+    
+    :param time_axis: decoded time axis (see util_dt.decode_time_axis)
+    :type time_axis: tuple (dt_arr, year_arr, month_arr, day_arr, dayofyear_arr)
+    
+    :param calend: calendar
+    :type calend: str
+    '''
+    
+    (dt_arr, year_arr, month_arr, day_arr, dayofyear_arr) = time_axis
+                       
+    indices_subset = util_dt.get_indices_subset(dt_arr, time_range)
+    
+    # Feb 29th are removed before reading, so they are never read
+    if ignore_Feb29th == True and not calend == '360_day':
+        mask_Feb29th = numpy.logical_and(month_arr[indices_subset]==2, day_arr[indices_subset]==29)
+        indices_subset = indices_subset[numpy.logical_not(mask_Feb29th)]
+    
+    dt_arr = dt_arr[indices_subset]
+    
+    assert(dt_arr.ndim == 1)
+    
+    return (dt_arr, indices_subset)
+
+
+def convert_values_arr(values_arr, scale_factor=1.0, add_offset=0.0):
+    '''
+    Converts values in place: values*scale_factor + add_offset. 
+    Nothing is done if the conversion is the identity (scale_factor=1, add_offset=0).
+    Masked values are left unchanged (as with masked array arithmetic), and no temporary array of values is created.
+    
+    :param values_arr: values (float32, with a full mask array, see read_values_arr)
+    :type values_arr: numpy.ma.MaskedArray
+    
+    :param scale_factor: scale factor
+    :type scale_factor: float
+    
+    :param add_offset: offset
+    :type add_offset: float
+    '''
+    
+    if scale_factor == 1.0 and add_offset == 0.0:
+        return
+    
+    data = numpy.ma.getdata(values_arr)
+    mask = numpy.ma.getmask(values_arr)
+    
+    if mask is numpy.ma.nomask or not mask.any():
+        where = True
+    else:
+        where = numpy.logical_not(mask)
+    
+    if scale_factor != 1.0:
+        numpy.multiply(data, data.dtype.type(scale_factor), out=data, where=where)
+    if add_offset != 0.0:
+        numpy.add(data, data.dtype.type(add_offset), out=data, where=where)
+
+
+def get_packing(ncVar_values, scale_factor=1.0, add_offset=0.0):
+    '''
+    Returns all packed values of an integer variable (8 or 16 bits), and the values they are read as by get_values_arr 
+    with ``scale_factor`` and ``add_offset``: unpacked with the "scale_factor" and "add_offset" attributes of the variable (as netCDF4 does), 
+    converted to float32 and converted in place (see convert_values_arr).
+    Computations on packed values use them to give the same results as on values read (see util/calc.py get_packed_condition).
+    
+    :param ncVar_values: variable
+    :type ncVar_values: netCDF4.Variable or mf_reader.MultiFileVariable
+    
+    :rtype: tuple (packed values in increasing order: numpy.ndarray (1D) of the type of the variable, 
+                   values read: numpy.ndarray (1D) of float32)
+    '''
+    
+    dtype = numpy.dtype(ncVar_values.dtype)
+    if dtype.kind not in 'iu' or dtype.itemsize > 2:
+        raise IOError("Only values of 8 or 16 bits integer variables can be kept packed, not " + str(dtype))
+    
+    packed = numpy.arange(numpy.iinfo(dtype).min, numpy.iinfo(dtype).max + 1).astype(dtype)
+    
+    values = packed
+    attrs = ncVar_values.ncattrs()
+    if 'scale_factor' in attrs:
+        values = values * ncVar_values.getncattr('scale_factor')
+    if 'add_offset' in attrs:
+        values = values + ncVar_values.getncattr('add_offset')
+    
+    values = numpy.ma.array(values, mask=numpy.zeros(values.shape, dtype=bool), dtype='float32')
+    convert_values_arr(values, scale_factor=scale_factor, add_offset=add_offset)
+    
+    return (packed, numpy.ma.getdata(values))
+
+
+def get_values_arr(ncVar_values, indices, fill_val=None, N_lev=None, lev_dim_pos=1, i1_row_current_tile=None, i2_row_current_tile=None, i1_col_current_tile=None, i2_col_current_tile=None, add_offset=0.0, scale_factor=1.0, packed=False):
+    '''
+    Reads the time steps ``indices`` of a tile (see read_values_arr) and converts them in place: values*scale_factor + add_offset (see convert_values_arr).
+    
+    If ``packed`` is True, values are read as they are stored (e.g. int16 packed values, the variable must not unpack them, 
+    see nc_pool.DatasetPool.get), and are neither converted nor given ``fill_val``: the conversion is taken into account 
+    by the computation instead (see get_packing).
+    
+    :rtype: numpy.ma.MaskedArray (3D: time, row, col) of float32 (or of the type of the variable if ``packed`` is True)
+    '''
+    
     if N_lev == None:
         assert(ncVar_values.ndim == 3)  
-                       
-        indices_subset = util_dt.get_indices_subset(dt_arr, time_range)
-        dt_arr = dt_arr[indices_subset]
-        values_arr = (ncVar_values[indices_subset,i1_row_current_tile:i2_row_current_tile, i1_col_current_tile:i2_col_current_tile] * scale_factor) + add_offset
-            
     else:
         assert(ncVar_values.ndim == 4)
-            
-        indices_subset = util_dt.get_indices_subset(dt_arr, time_range)
-        dt_arr = dt_arr[indices_subset]
-        if lev_dim_pos == 0:
-            values_arr = (ncVar_values[N_lev,indices_subset,i1_row_current_tile:i2_row_current_tile, i1_col_current_tile:i2_col_current_tile] * scale_factor) + add_offset
-        else:
-            values_arr = (ncVar_values[indices_subset,N_lev,i1_row_current_tile:i2_row_current_tile, i1_col_current_tile:i2_col_current_tile] * scale_factor) + add_offset
+    
+    values_arr = read_values_arr(ncVar_values, indices, N_lev=N_lev, lev_dim_pos=lev_dim_pos,
+                                 i1_row=i1_row_current_tile, i2_row=i2_row_current_tile, 
+                                 i1_col=i1_col_current_tile, i2_col=i2_col_current_tile,
+                                 dtype=ncVar_values.dtype if packed else 'float32')
+    if values_arr.ndim != 3:
+        raise MissingIcclimInputError("Variable " + ncVar_values.name + " must have 3 dimensions (time, lat, lon) once a level is selected, not shape " + str(values_arr.shape))
+    
+    if packed:
+        return values_arr
+    
+    convert_values_arr(values_arr, scale_factor=scale_factor, add_offset=add_offset)
         
     if fill_val != None:
         numpy.ma.set_fill_value(values_arr, fill_val)
-        
-    assert(dt_arr.ndim == 1)    
-    assert(values_arr.ndim == 3)
     
-    if ignore_Feb29th == True and not calend == '360_day':
-        mask_Feb29th = numpy.array([ (dt.month==2 and dt.day==29) for dt in dt_arr])
-        indices_masked_Feb29th = numpy.where(mask_Feb29th==False)[0] # ...[0]: tuple to numpy.ndarray (http://stackoverflow.com/questions/16127444/why-is-my-array-length-1-when-building-it-with-numpy-where)
-        dt_arr = dt_arr[indices_masked_Feb29th]
-        values_arr = values_arr[indices_masked_Feb29th,:,:]
+    return values_arr
+
+
+def get_values_arr_and_dt_arr(ncVar_temporal, ncVar_values, fill_val=None, time_range=None, N_lev=None, lev_dim_pos=1, ignore_Feb29th=False, i1_row_current_tile=None, i2_row_current_tile=None, i1_col_current_tile=None, i2_col_current_tile=None, add_offset=0.0, scale_factor=1.0):
+    
+    (dt_arr, indices_subset) = get_dt_arr_and_indices(ncVar_temporal, time_range=time_range, ignore_Feb29th=ignore_Feb29th)
+    
+    values_arr = get_values_arr(ncVar_values, indices_subset, fill_val=fill_val, N_lev=N_lev, lev_dim_pos=lev_dim_pos,
+                                i1_row_current_tile=i1_row_current_tile, i2_row_current_tile=i2_row_current_tile, 
+                                i1_col_current_tile=i1_col_current_tile, i2_col_current_tile=i2_col_current_tile,
+                                add_offset=add_offset, scale_factor=scale_factor)
     
     return (dt_arr, values_arr)
 
@@ -353,7 +598,7 @@ def list_var_dim(inc, var):
                 
     return (str(time_var), str(lat_var), str(lon_var)) # tuple ('time', 'lat', 'lon')
 
-def check_unlimited(infile):
+def check_unlimited(infile, temporal_var_name='time'):
     
     '''    
     Checks for unlimited dimensions in a NetCDF file.
@@ -361,6 +606,9 @@ def check_unlimited(infile):
     :param infile: name of NetCDF file
     :type infile: str
     
+    :param temporal_var_name: name of temporal variable (default: "time")
+    :type temporal_var_name: str
+    
     :rtype: str (name of unlimited dimension, defaulting to time in case there is none)
     
     '''
@@ -369,12 +617,10 @@ def check_unlimited(infile):
     num_unlimited = 0
     dim_unlimited = False
 
-    nc = Dataset(infile, 'r')
-
-    for dim in nc.dimensions:
-      if nc.dimensions[dim].isunlimited():
+    # unlimited dimensions are taken from the catalog (see catalog.py)
+    for dim in catalog.get_entry(infile, temporal_var_name=temporal_var_name)['unlimited_dims']:
         dim_unlimited = True
-        dim_name = dim
+        dim_name = str(dim)
         num_unlimited = num_unlimited + 1
     if dim_unlimited == False:
       print 'Warning: There is no unlimited dimension. File should be fixed if possible to set time as the unlimited dimension.'
@@ -382,6 +628,4 @@ def check_unlimited(infile):
     if num_unlimited > 1:
         print 'Warning: There are more than one unlimited dimension to aggregate. Using '+dim_name+' to aggregate.'
 
-    nc.close()
-
     return dim_name